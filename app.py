@@ -1,40 +1,111 @@
 import os
 import logging
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.orm import DeclarativeBase
+from log_events import configure_logging
+from db_engines import RoutingSession, engine_options, watch_replica, DATABASE_READ_URL, REPLICA_BIND
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Send all logging through a background writer; levels come from LOG_LEVEL and LOG_LEVELS
+configure_logging()
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "default-secret-key-for-development")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+_services_pid = None
+_services_lock = threading.Lock()
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///attendance.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+def create_app():
+    """Build the application without touching the database.
 
-# Initialize the app with the extension
-db.init_app(app)
+    Creating tables and default data is a one-shot step (flask init-db and
+    flask seed, or gunicorn.conf.py in the master), and per-process services
+    start with start_services, so worker boot never waits on the database.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "default-secret-key-for-development")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-with app.app_context():
-    # Import models to ensure tables are created
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///attendance.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], 'DB')
+    # Reports, dashboards and student lists read from a replica when one is configured
+    if DATABASE_READ_URL:
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: {'url': DATABASE_READ_URL, **engine_options(DATABASE_READ_URL, 'DB_READ')}}
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # Initialize the app with the extension; engines connect on first use
+    db.init_app(app)
+    if DATABASE_READ_URL:
+        with app.app_context():
+            watch_replica(db.engines[REPLICA_BIND])
+
+    # Request latency, error and SQL accounting for /metrics
+    from metrics import init_metrics
+    init_metrics(app)
+
+    import models  # noqa: F401
+    from routes import bp as routes_bp
+    from commands import bp as commands_bp
+    app.register_blueprint(routes_bp)
+    app.register_blueprint(commands_bp)
+
+    # Workers not started through gunicorn.conf.py start their services on the first request
+    @app.before_request
+    def _start_services():
+        if _services_pid != os.getpid():
+            start_services(app)
+
+    return app
+
+def init_database():
+    """Create missing tables and build rollups for databases that predate them"""
     import models  # noqa: F401
-    db.create_all()
+    from rollups import ensure_rollups
+    db.create_all(bind_key=None)
     logging.info("Database tables created")
-    
-    # Create default data
-    from routes import create_default_data
-    create_default_data()
+    ensure_rollups()
+
+def start_services(app):
+    """Start this process's background services once.
+
+    Threads, descriptors and pooled connections do not survive a fork, so
+    this runs in each worker after it is forked, never at import. The
+    student cache and attendance matrix warm in the background so a slow or
+    unreachable database does not hold up the worker.
+    """
+    global _services_pid
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+
+    try:
+        # Start receiving live events published by other workers
+        from live import bus
+        bus.start()
+
+        # Replay and drain the local scan journal, if one is configured
+        from scan_journal import scan_journal
+        scan_journal.start(app)
+    except Exception as e:
+        logging.error(f"Service startup error: {e}")
+
+    threading.Thread(target=_warm_caches, args=(app,), name='cache-warmup', daemon=True).start()
+
+def _warm_caches(app):
+    # Warm the card_id -> student lookup cache
+    from cache import student_cache
+    with app.app_context():
+        student_cache.warm()
+
+        # Build or map the attendance matrix before the first heatmap request needs it
+        from attendance_matrix import attendance_matrix
+        try:
+            attendance_matrix.ensure_loaded()
+        except Exception as e:
+            logging.error(f"Attendance matrix warmup error: {e}")
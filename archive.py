@@ -0,0 +1,170 @@
+import os
+import re
+import csv
+import gzip
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import or_, false
+from app import db
+from models import AttendanceRecord
+from utils import institution_today
+from attendance_query import AttendanceFilters, PROJECTIONS, stream_attendance
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_MANIFEST = 'terms.json'
+_TERM_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+_manifest_cache = {'mtime': None, 'terms': []}
+_manifest_lock = threading.Lock()
+
+def archive_dir():
+    directory = ARCHIVE_DIR or os.path.join(current_app.instance_path, 'archive')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def archived_terms():
+    """Archived terms from the manifest, newest first; re-read only when the file changes"""
+    path = os.path.join(archive_dir(), ARCHIVE_MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    with _manifest_lock:
+        if _manifest_cache['mtime'] != mtime:
+            with open(path) as f:
+                terms = json.load(f)
+            for term in terms:
+                term['start'] = datetime.strptime(term['date_from'], '%Y-%m-%d').date()
+                term['end'] = datetime.strptime(term['date_to'], '%Y-%m-%d').date()
+            terms.sort(key=lambda term: term['start'], reverse=True)
+            _manifest_cache.update(mtime=mtime, terms=terms)
+        return _manifest_cache['terms']
+
+def _write_manifest(terms):
+    directory = archive_dir()
+    tmp_path = os.path.join(directory, f'{ARCHIVE_MANIFEST}.{os.getpid()}.tmp')
+    fields = ('name', 'date_from', 'date_to', 'rows', 'file', 'sha256', 'archived_at')
+    with open(tmp_path, 'w') as f:
+        json.dump([{field: term[field] for field in fields} for term in terms], f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, ARCHIVE_MANIFEST))
+
+def archived_date_clause(column):
+    """SQL condition matching dates inside any archived term, for excluding them from rebuilds"""
+    terms = archived_terms()
+    return or_(*(column.between(term['start'], term['end']) for term in terms)) if terms else false()
+
+def archive_term(name, date_from, date_to):
+    """Move a closed term's attendance out of attendance_records into a gzip CSV.
+
+    The rows are written newest first, joined with the student fields the
+    reports show, so archived_rows() can serve them without the students
+    table. The file is fsynced before the live rows are deleted, and the
+    delete must remove exactly the rows written or the transaction is
+    rolled back and the file discarded. Daily rollups are kept, so
+    summaries over archived terms stay correct.
+    """
+    from response_cache import publish_responses_changed
+
+    if not _TERM_NAME_PATTERN.match(name or ''):
+        raise ValueError('Term name may only contain letters, digits, ".", "_" and "-"')
+    if date_to < date_from:
+        raise ValueError('date_to is before date_from')
+    if date_to >= institution_today():
+        raise ValueError('Only terms that ended before today can be archived')
+    terms = archived_terms()
+    for term in terms:
+        if term['name'] == name:
+            raise ValueError(f'Term {name} is already archived')
+        if term['start'] <= date_to and date_from <= term['end']:
+            raise ValueError(f"Range overlaps archived term {term['name']}")
+
+    in_term = AttendanceFilters(date_from=date_from, date_to=date_to)
+    filename = f'{name}.csv.gz'
+    path = os.path.join(archive_dir(), filename)
+    part_path = f'{path}.part'
+    digest = hashlib.sha256()
+    rows = 0
+    published = False
+    try:
+        with open(part_path, 'wb') as raw:
+            with gzip.open(raw, 'wt', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow([column.key for column in PROJECTIONS['archive']])
+                for row in stream_attendance(in_term, 'archive', ARCHIVE_BATCH_SIZE):
+                    writer.writerow([*row[:5], row[5].isoformat(), row[6] or '', row[7] or ''])
+                    rows += 1
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        deleted = db.session.query(AttendanceRecord)\
+            .filter(AttendanceRecord.scan_date.between(date_from, date_to)).delete(synchronize_session=False)
+        if deleted != rows:
+            raise RuntimeError(f'Archived {rows} rows but {deleted} matched the delete; attendance changed during archiving')
+
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        os.replace(part_path, path)
+        terms = [*terms, {
+            'name': name,
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'rows': rows,
+            'file': filename,
+            'sha256': digest.hexdigest(),
+            'archived_at': datetime.utcnow().isoformat()
+        }]
+        # Publish before committing: if the commit fails the term is
+        # withdrawn again, and a crash in between leaves rows readable twice
+        # rather than not at all
+        _write_manifest(terms)
+        published = True
+        db.session.commit()
+        publish_responses_changed()
+    except Exception as e:
+        logging.error(f"Archive error for term {name}: {e}")
+        db.session.rollback()
+        if published:
+            _write_manifest(terms[:-1])
+        for leftover in (part_path, path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    logging.info(f"Archived {rows} attendance records of term {name} ({date_from} to {date_to})")
+    return terms[-1]
+
+def archived_rows(filters):
+    """Yield archived rows matching AttendanceFilters in the 'export' projection's shape.
+
+    Terms outside the date range are skipped without being opened, and
+    since each file is newest first, reading stops at the first row before
+    date_from. Rows come newest first, after all live rows in a report.
+    """
+    date_from, date_to = filters.date_from, filters.date_to
+    directory = archive_dir()
+
+    for term in archived_terms():
+        if (date_from and term['end'] < date_from) or (date_to and term['start'] > date_to):
+            continue
+        with gzip.open(os.path.join(directory, term['file']), 'rt', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for name, roll_number, session, campus, course, scanned, location, status in reader:
+                scan_datetime = datetime.fromisoformat(scanned)
+                scan_date = scan_datetime.date()
+                if date_from and scan_date < date_from:
+                    break
+                if not filters.matches(session, campus, course, scan_date):
+                    continue
+                yield name, roll_number, session, campus, course, scan_date, scan_datetime.time(), location, status
+
+def archived_row_estimate(filters):
+    """Upper bound on archived rows a report can include, from the manifest"""
+    return sum(term['rows'] for term in archived_terms()
+               if (filters.date_from is None or term['end'] >= filters.date_from)
+               and (filters.date_to is None or term['start'] <= filters.date_to))
@@ -0,0 +1,415 @@
+import os
+import json
+import mmap
+import logging
+import threading
+from datetime import date, datetime
+from sqlalchemy import func
+from app import db
+from models import Student, AttendanceRecord
+from live import broadcaster
+from utils import institution_today
+from archive import archived_rows, archived_terms
+from attendance_query import AttendanceFilters
+
+ATTENDANCE_MATRIX_PATH = os.environ.get("ATTENDANCE_MATRIX_PATH")
+MATRIX_START_DATE = os.environ.get("MATRIX_START_DATE")
+# Day columns beyond the last scan, so the matrix need not grow every morning
+MATRIX_DAY_HEADROOM = 120
+MATRIX_MIN_STUDENTS = 1024
+MATRIX_BUILD_BATCH = 50000
+ATTENDED_STATUSES = ('present', 'late')
+GROUP_FIELDS = ('session', 'campus', 'course')
+
+def _round_up(value, multiple):
+    return -(-value // multiple) * multiple
+
+class AttendanceMatrix:
+    """Attendance as bits: one bitset per student over days since start_date.
+
+    The buffer holds two copies of the same bits. The row-major block has
+    one row per student, so "days present between d1 and d2" is a popcount
+    of a slice of that row. The day-major block has one column per day
+    across students, so group totals for a day are a popcount of the column
+    ANDed with the group's student mask. Setting a bit writes both.
+
+    Only attended statuses (present/late) are stored. Built from
+    attendance_records and the archived terms when the worker starts, or loaded from a snapshot written by
+    save() and caught up from the records added since, and kept current
+    from the scan events every worker receives. Student changes mark the
+    groups stale; they are reloaded from the students table before the
+    next query, without rereading attendance.
+    """
+
+    def __init__(self):
+        self._pending = None
+        self._groups_stale = False
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.ready = False
+        self.start_date = None
+        self.days = 0
+        self.capacity = 0
+        self.last_record_id = 0
+        self.built_at = None
+        self._buf = None
+        self._rows = {}          # student_id -> row
+        self._roll_rows = {}     # roll_number -> row
+        self._groups = []        # row -> (student_id, session, campus, course, roll_number)
+        self._inactive = set()   # rows of inactive or deleted students, left out of group queries
+
+    # Layout
+
+    @property
+    def row_bytes(self):
+        return self.days // 8
+
+    @property
+    def column_bytes(self):
+        return self.capacity // 8
+
+    def _column_offset(self, day_index):
+        return self.capacity * self.row_bytes + day_index * self.column_bytes
+
+    def _allocate(self, start_date, days, capacity):
+        self.start_date = start_date
+        self.days = _round_up(days, 64)
+        self.capacity = _round_up(max(capacity, MATRIX_MIN_STUDENTS), 64)
+        self._buf = bytearray(self.capacity * self.row_bytes + self.days * self.column_bytes)
+
+    def _resize(self, days=None, capacity=None):
+        """Re-lay out the buffer for more days or students, keeping every bit"""
+        old_buf, old_days, old_capacity = self._buf, self.days, self.capacity
+        old_row_bytes, old_column_bytes = self.row_bytes, self.column_bytes
+        self._allocate(self.start_date, max(days or 0, old_days), max(capacity or 0, old_capacity))
+        for row in range(len(self._groups)):
+            start = row * old_row_bytes
+            self._buf[row * self.row_bytes:row * self.row_bytes + old_row_bytes] = old_buf[start:start + old_row_bytes]
+        old_columns = old_capacity * old_row_bytes
+        for day_index in range(old_days):
+            start = old_columns + day_index * old_column_bytes
+            offset = self._column_offset(day_index)
+            self._buf[offset:offset + old_column_bytes] = old_buf[start:start + old_column_bytes]
+
+    def _add_student(self, student_id, roll_number, session, campus, course):
+        row = len(self._groups)
+        if row >= self.capacity:
+            self._resize(capacity=self.capacity * 2)
+        self._groups.append((student_id, session, campus, course, roll_number))
+        self._rows[student_id] = row
+        self._roll_rows[roll_number] = row
+        return row
+
+    def _set(self, row, day_index):
+        if day_index >= self.days:
+            self._resize(days=day_index + MATRIX_DAY_HEADROOM)
+        self._buf[row * self.row_bytes + day_index // 8] |= 1 << (day_index % 8)
+        self._buf[self._column_offset(day_index) + row // 8] |= 1 << (row % 8)
+
+    def _mark(self, row, scan_date):
+        day_index = (scan_date - self.start_date).days
+        if day_index >= 0:
+            self._set(row, day_index)
+
+    # Building and persistence
+
+    def build(self):
+        """Load every student and attended day from the database"""
+        with self._lock:
+            # Scans arriving while the table is read are applied afterwards
+            self._pending = []
+        try:
+            if MATRIX_START_DATE:
+                start_date = datetime.strptime(MATRIX_START_DATE, '%Y-%m-%d').date()
+            else:
+                start_date = db.session.query(func.min(AttendanceRecord.scan_date)).scalar() or institution_today()
+                terms = archived_terms()
+                if terms:
+                    start_date = min(start_date, min(term['start'] for term in terms))
+            self._groups_stale = False
+            students = db.session.query(Student.id, Student.roll_number, Student.session, Student.campus,
+                                        Student.course, Student.is_active).order_by(Student.id).all()
+
+            with self._lock:
+                self._reset()
+                self._allocate(start_date, (institution_today() - start_date).days + MATRIX_DAY_HEADROOM, len(students))
+                for *student, is_active in students:
+                    row = self._add_student(*student)
+                    if not is_active:
+                        self._inactive.add(row)
+            self._catch_up()
+            self._mark_archived()
+            self.built_at = datetime.now().isoformat(timespec='seconds')
+            self.ready = True
+            logging.info(f"Attendance matrix built: {len(self._groups)} students x {self.days} days from {self.start_date}")
+        finally:
+            self._drain_pending()
+
+    def _catch_up(self):
+        """Apply attended records with ids above last_record_id, in batches"""
+        while True:
+            rows = db.session.query(AttendanceRecord.id, AttendanceRecord.student_id, AttendanceRecord.scan_date)\
+                .filter(AttendanceRecord.id > self.last_record_id,
+                        func.lower(AttendanceRecord.status).in_(ATTENDED_STATUSES))\
+                .order_by(AttendanceRecord.id).limit(MATRIX_BUILD_BATCH).all()
+            if not rows:
+                return
+            with self._lock:
+                for record_id, student_id, scan_date in rows:
+                    row = self._rows.get(student_id)
+                    if row is not None:
+                        self._mark(row, scan_date)
+                self.last_record_id = rows[-1][0]
+
+    def _mark_archived(self):
+        """Apply attended rows of archived terms, which are no longer in attendance_records"""
+        for row in archived_rows(AttendanceFilters(date_from=self.start_date)):
+            roll_number, scan_date, status = row[1], row[5], row[8]
+            if status.lower() not in ATTENDED_STATUSES:
+                continue
+            with self._lock:
+                row_index = self._roll_rows.get(roll_number)
+                if row_index is not None:
+                    self._mark(row_index, scan_date)
+
+    def _drain_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending or [], None
+            for event in pending:
+                self.apply_scan(event)
+
+    def save(self, path):
+        """Write a snapshot that workers can map at startup"""
+        with self._lock:
+            meta = {
+                'start_date': self.start_date.isoformat(),
+                'days': self.days,
+                'capacity': self.capacity,
+                'last_record_id': self.last_record_id,
+                'built_at': self.built_at,
+                'students': [list(group) for group in self._groups],
+                'inactive': sorted(self._inactive)
+            }
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(self._buf)
+        with open(f'{path}.json.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{path}.tmp', path)
+        os.replace(f'{path}.json.tmp', f'{path}.json')
+        logging.info(f"Attendance matrix saved to {path} at record {meta['last_record_id']}")
+
+    def load(self, path):
+        """Map a snapshot copy-on-write and apply records added since it was saved"""
+        with open(f'{path}.json') as f:
+            meta = json.load(f)
+        with self._lock:
+            self._pending = []
+            self._reset()
+            self.start_date = date.fromisoformat(meta['start_date'])
+            self.days = meta['days']
+            self.capacity = meta['capacity']
+            with open(path, 'rb') as f:
+                # Private mapping: pages are shared with the file until this worker writes to them
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            if len(self._buf) != self.capacity * self.row_bytes + self.days * self.column_bytes:
+                raise ValueError(f"Attendance matrix snapshot {path} does not match its metadata")
+            for student_id, session, campus, course, roll_number in meta['students']:
+                self._add_student(student_id, roll_number, session, campus, course)
+            self._inactive = set(meta.get('inactive', ()))
+            self.last_record_id = meta['last_record_id']
+            # Students may have changed since the snapshot was saved
+            self._groups_stale = True
+            self.built_at = meta['built_at']
+        try:
+            self._catch_up()
+            self.ready = True
+        finally:
+            self._drain_pending()
+        logging.info(f"Attendance matrix loaded from {path}: {len(self._groups)} students, "
+                     f"caught up to record {self.last_record_id}")
+
+    def ensure_loaded(self):
+        if self.ready:
+            if self._groups_stale:
+                self.refresh_groups()
+            return
+        with self._load_lock:
+            if self.ready:
+                return
+            if ATTENDANCE_MATRIX_PATH and os.path.exists(f'{ATTENDANCE_MATRIX_PATH}.json'):
+                try:
+                    self.load(ATTENDANCE_MATRIX_PATH)
+                    return
+                except (OSError, ValueError, KeyError) as e:
+                    logging.error(f"Attendance matrix snapshot unusable, rebuilding: {e}")
+            self.build()
+
+    def refresh_groups(self):
+        """Reload each student's group and active state, adding students not seen yet"""
+        with self._load_lock:
+            if not self._groups_stale:
+                return
+            # A change arriving during the query marks the groups stale again
+            self._groups_stale = False
+            students = db.session.query(Student.id, Student.roll_number, Student.session, Student.campus,
+                                        Student.course, Student.is_active).all()
+            with self._lock:
+                seen = set()
+                for student_id, roll_number, session, campus, course, is_active in students:
+                    row = self._rows.get(student_id)
+                    if row is None:
+                        row = self._add_student(student_id, roll_number, session, campus, course)
+                    else:
+                        old_roll_number = self._groups[row][4]
+                        if self._roll_rows.get(old_roll_number) == row:
+                            del self._roll_rows[old_roll_number]
+                        self._groups[row] = (student_id, session, campus, course, roll_number)
+                        self._roll_rows[roll_number] = row
+                    seen.add(row)
+                    if is_active:
+                        self._inactive.discard(row)
+                    else:
+                        self._inactive.add(row)
+                self._inactive.update(set(range(len(self._groups))) - seen)
+            logging.info(f"Attendance matrix groups reloaded for {len(students)} students")
+
+    def mark_groups_stale(self):
+        """Note a student change; safe on the bus tailer thread, which has no app context"""
+        self._groups_stale = True
+
+    # Live updates
+
+    def apply_scan(self, event):
+        """Set the bit for a scan event from the live bus, without touching the database"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(event)
+                return
+            if not self.ready:
+                return
+            row = self._roll_rows.get(event['roll_number'])
+            if row is None:
+                # Events arrive on the bus tailer thread, which has no app context,
+                # so a new student is added from the event alone
+                if event.get('student_id') is None:
+                    return
+                row = self._add_student(event['student_id'], event['roll_number'], event['session'],
+                                        event['campus'], event['course'])
+            self._mark(row, date.fromisoformat(event['scan_date']))
+
+    # Queries
+
+    def _day_index(self, day):
+        return (day - self.start_date).days
+
+    def _row_bits(self, row, first, last):
+        """The row's bits for day indexes first..last as an int, bit 0 = first"""
+        start_byte = first // 8
+        chunk = self._buf[row * self.row_bytes + start_byte:row * self.row_bytes + last // 8 + 1]
+        return (int.from_bytes(chunk, 'little') >> (first - start_byte * 8)) & ((1 << (last - first + 1)) - 1)
+
+    def _clip(self, date_from, date_to):
+        first = max(self._day_index(date_from), 0)
+        last = min(self._day_index(date_to), self.days - 1)
+        return first, last
+
+    def day_mask(self, dates, date_from):
+        """Bit mask of dates relative to date_from, for restricting counts to working days"""
+        mask = 0
+        for day in dates:
+            mask |= 1 << (day - date_from).days
+        return mask
+
+    def is_present(self, student_id, day):
+        self.ensure_loaded()
+        with self._lock:
+            row = self._rows.get(student_id)
+            day_index = self._day_index(day)
+            if row is None or not 0 <= day_index < self.days:
+                return False
+            return bool(self._buf[row * self.row_bytes + day_index // 8] >> (day_index % 8) & 1)
+
+    def days_present(self, student_id, date_from, date_to, mask=None):
+        """Attended days in [date_from, date_to], optionally only days in mask (see day_mask)"""
+        self.ensure_loaded()
+        with self._lock:
+            row = self._rows.get(student_id)
+            first, last = self._clip(date_from, date_to)
+            if row is None or first > last:
+                return 0
+            bits = self._row_bits(row, first, last)
+            if mask is not None:
+                bits &= mask >> (first - self._day_index(date_from))
+            return bits.bit_count()
+
+    def _matching_rows(self, filters):
+        return [row for row, (_, session, campus, course, _) in enumerate(self._groups)
+                if row not in self._inactive
+                and (not filters.get('session') or session == filters['session'])
+                and (not filters.get('campus') or campus == filters['campus'])
+                and (not filters.get('course') or course == filters['course'])]
+
+    def present_counts(self, date_from, date_to, filters=None):
+        """{student_id: attended days in range} for every student matching the filters"""
+        self.ensure_loaded()
+        with self._lock:
+            first, last = self._clip(date_from, date_to)
+            counts = {}
+            for row in self._matching_rows(filters or {}):
+                counts[self._groups[row][0]] = self._row_bits(row, first, last).bit_count() if first <= last else 0
+            return counts
+
+    def group_daily_totals(self, date_from, date_to, group_by=GROUP_FIELDS, filters=None):
+        """Attended students per day per group, from day columns ANDed with group masks.
+
+        Returns {group key tuple: [count for each day from date_from to date_to]}.
+        """
+        self.ensure_loaded()
+        positions = [GROUP_FIELDS.index(field) + 1 for field in group_by]
+        with self._lock:
+            masks = {}
+            for row in self._matching_rows(filters or {}):
+                key = tuple(self._groups[row][position] for position in positions)
+                masks[key] = masks.get(key, 0) | (1 << row)
+            span = (date_to - date_from).days + 1
+            totals = {key: [0] * max(span, 0) for key in masks}
+            for offset in range(max(span, 0)):
+                day_index = self._day_index(date_from) + offset
+                if not 0 <= day_index < self.days:
+                    continue
+                start = self._column_offset(day_index)
+                column = int.from_bytes(self._buf[start:start + self.column_bytes], 'little')
+                if not column:
+                    continue
+                for key, mask in masks.items():
+                    totals[key][offset] = (column & mask).bit_count()
+            return totals
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self.ready,
+                'students': len(self._groups) - len(self._inactive),
+                'capacity': self.capacity,
+                'start_date': self.start_date.isoformat() if self.start_date else None,
+                'days': self.days,
+                'bytes': len(self._buf) if self._buf is not None else 0,
+                'mapped': isinstance(self._buf, mmap.mmap),
+                'last_record_id': self.last_record_id,
+                'built_at': self.built_at
+            }
+
+attendance_matrix = AttendanceMatrix()
+
+def _on_live_event(event):
+    if event.get('type') == 'scan':
+        attendance_matrix.apply_scan(event)
+    elif event.get('type') == 'students.changed':
+        attendance_matrix.mark_groups_stale()
+
+# Scans recorded by any worker set their bit in this worker's matrix, and
+# student changes from any worker or command reload its groups
+broadcaster.add_listener(_on_live_event)
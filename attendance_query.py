@@ -0,0 +1,131 @@
+import threading
+from datetime import datetime
+from sqlalchemy import select, func, bindparam, or_, and_, Date, DateTime
+from app import db
+from models import Student, AttendanceRecord
+
+STREAM_BATCH_SIZE = 1000
+
+# Column sets a caller can select from the attendance join
+PROJECTIONS = {
+    # Excel export rows; see utils.write_excel_report
+    'export': (
+        Student.name, Student.roll_number, Student.session, Student.campus, Student.course,
+        AttendanceRecord.scan_date, AttendanceRecord.scan_time, AttendanceRecord.location,
+        AttendanceRecord.status
+    ),
+    # The attendance table, plus the (scan_datetime, id) keyset columns
+    'page': (
+        AttendanceRecord.id, Student.name, Student.roll_number, Student.session, Student.campus,
+        Student.course, AttendanceRecord.scan_date, AttendanceRecord.scan_time, AttendanceRecord.location,
+        AttendanceRecord.status, AttendanceRecord.scan_datetime
+    ),
+    # Term archives; scan_date and scan_time are derived from scan_datetime
+    'archive': (
+        Student.name, Student.roll_number, Student.session, Student.campus, Student.course,
+        AttendanceRecord.scan_datetime, AttendanceRecord.location, AttendanceRecord.status
+    ),
+    'count': (func.count(AttendanceRecord.id),),
+}
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+class AttendanceFilters:
+    """Report filters with dates parsed, built once per request.
+
+    Empty fields mean "no filter". Raises ValueError for malformed dates.
+    """
+
+    __slots__ = ('session', 'campus', 'course', 'date_from', 'date_to')
+
+    def __init__(self, session=None, campus=None, course=None, date_from=None, date_to=None):
+        self.session = session or None
+        self.campus = campus or None
+        self.course = course or None
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @classmethod
+    def from_report_filters(cls, filters):
+        """Build from a dict shaped like report_jobs.normalize_report_filters output"""
+        return cls(filters.get('session'), filters.get('campus'), filters.get('course'),
+                   _parse_date(filters.get('date_from')), _parse_date(filters.get('date_to')))
+
+    def matches(self, session, campus, course, scan_date):
+        """Apply the same filters to a row held outside the database"""
+        return (self.session in (None, session) and self.campus in (None, campus)
+                and self.course in (None, course)
+                and (self.date_from is None or scan_date >= self.date_from)
+                and (self.date_to is None or scan_date <= self.date_to))
+
+# Compiled-statement cache: one Select per (projection, filter shape)
+_statements = {}
+_statements_lock = threading.Lock()
+
+def _build_statement(shape):
+    projection, session, campus, course, date_from, date_to, after, limit = shape
+    stmt = select(*PROJECTIONS[projection]).join(Student, AttendanceRecord.student_id == Student.id)
+    if session:
+        stmt = stmt.where(Student.session == bindparam('session'))
+    if campus:
+        stmt = stmt.where(Student.campus == bindparam('campus'))
+    if course:
+        stmt = stmt.where(Student.course == bindparam('course'))
+    if date_from:
+        stmt = stmt.where(AttendanceRecord.scan_date >= bindparam('date_from', type_=Date))
+    if date_to:
+        stmt = stmt.where(AttendanceRecord.scan_date <= bindparam('date_to', type_=Date))
+    if after:
+        after_datetime = bindparam('after_datetime', type_=DateTime)
+        stmt = stmt.where(or_(
+            AttendanceRecord.scan_datetime < after_datetime,
+            and_(AttendanceRecord.scan_datetime == after_datetime, AttendanceRecord.id < bindparam('after_id'))
+        ))
+    if projection != 'count':
+        stmt = stmt.order_by(AttendanceRecord.scan_datetime.desc(), AttendanceRecord.id.desc())
+    if limit:
+        stmt = stmt.limit(bindparam('limit'))
+    return stmt
+
+def attendance_statement(filters, projection='export', after=None, limit=None):
+    """Filtered attendance join, newest first, as (statement, parameters).
+
+    Statements are built once per filter shape (the projection, which
+    filters are set, whether there is a cursor or limit) with bind
+    parameters in place of values, and reused for every later request of
+    that shape. A reused statement's cache key is memoized on it, so the
+    compiled SQL is found without rebuilding and re-hashing a new
+    statement on every request.
+    after is a (scan_datetime, id) keyset position; rows strictly older
+    than it are returned. 'count' ignores ordering.
+    """
+    shape = (projection, bool(filters.session), bool(filters.campus), bool(filters.course),
+             bool(filters.date_from), bool(filters.date_to), bool(after), bool(limit))
+    stmt = _statements.get(shape)
+    if stmt is None:
+        with _statements_lock:
+            stmt = _statements.setdefault(shape, _build_statement(shape))
+
+    params = {'session': filters.session, 'campus': filters.campus, 'course': filters.course,
+              'date_from': filters.date_from, 'date_to': filters.date_to, 'limit': limit}
+    if after:
+        params['after_datetime'], params['after_id'] = after
+    return stmt, {name: value for name, value in params.items() if value is not None}
+
+# These run on the session's connection as Core statements: the rows are
+# plain tuples, so the ORM execution layer would only add overhead
+
+def stream_attendance(filters, projection='export', batch_size=STREAM_BATCH_SIZE):
+    """Iterate matching rows from a server-side cursor, batch_size rows at a time"""
+    stmt, params = attendance_statement(filters, projection)
+    return db.session.connection().execute(stmt, params, execution_options={'yield_per': batch_size})
+
+def fetch_attendance(filters, projection='page', after=None, limit=None):
+    """Load one page (or all) matching rows into a list"""
+    stmt, params = attendance_statement(filters, projection, after, limit)
+    return db.session.connection().execute(stmt, params).all()
+
+def count_attendance(filters):
+    stmt, params = attendance_statement(filters, 'count')
+    return db.session.connection().execute(stmt, params).scalar()
@@ -0,0 +1,156 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, literal, exists, insert
+from app import db
+from models import Student, AttendanceRecord, AttendanceSession
+from utils import institution_today, INSTITUTION_TIMEZONE
+
+LATE_GRACE_MINUTES = int(os.environ.get("LATE_GRACE_MINUTES", "15"))
+# Other workers' session edits are picked up within this many seconds
+SESSION_WINDOWS_TTL = 300
+ABSENCE_LOCATION = 'System'
+ABSENCE_SCANNER_ID = 'absence-job'
+# Classification of a scan after a session's last window has closed; such
+# scans are not recorded, and the absence job marks the student instead
+OUTSIDE_SESSION = 'outside'
+OUTSIDE_SESSION_MESSAGE = 'Scan outside session hours'
+
+def _add_minutes(value, minutes):
+    return (datetime.combine(datetime.min, value) + timedelta(minutes=minutes)).time()
+
+class SessionWindows:
+    """Active AttendanceSession windows per session code, sorted by start time.
+
+    Loaded with one query and refreshed when sessions change in this process
+    or the TTL passes, so classifying a scan never queries the database.
+    """
+
+    def __init__(self, grace_minutes=LATE_GRACE_MINUTES, ttl=SESSION_WINDOWS_TTL):
+        self.grace_minutes = grace_minutes
+        self.ttl = ttl
+        self._windows = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        rows = db.session.query(AttendanceSession.session_code, AttendanceSession.start_time, AttendanceSession.end_time)\
+            .filter(AttendanceSession.is_active == True)\
+            .order_by(AttendanceSession.session_code, AttendanceSession.start_time).all()  # noqa: E712
+        windows = {}
+        for code, start_time, end_time in rows:
+            starts, grace_ends, ends = windows.setdefault(code, ([], [], []))
+            starts.append(start_time)
+            grace_ends.append(_add_minutes(start_time, self.grace_minutes))
+            ends.append(end_time)
+        return windows
+
+    def windows(self):
+        """{session_code: (starts, grace_ends, ends)} parallel lists sorted by start"""
+        with self._lock:
+            if self._windows is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._windows
+        windows = self._load()
+        with self._lock:
+            self._windows = windows
+            self._loaded_at = time.monotonic()
+        return windows
+
+    def invalidate(self):
+        with self._lock:
+            self._windows = None
+
+    def classify(self, session_code, scan_time):
+        """Return 'present', 'late' or OUTSIDE_SESSION for a scan at scan_time by a student of session_code.
+
+        Scans up to the window's start plus the grace period are present,
+        later ones up to the window's end late. A scan after a window ends
+        counts towards the next window of the same session, and is outside
+        the session after the last one.
+        """
+        window = self.windows().get(session_code)
+        if not window:
+            return 'present'
+        starts, grace_ends, ends = window
+        index = bisect.bisect_right(starts, scan_time) - 1
+        if index < 0 or scan_time <= grace_ends[index]:
+            return 'present'
+        if scan_time <= ends[index]:
+            return 'late'
+        if index == len(starts) - 1:
+            return OUTSIDE_SESSION
+        return 'present'
+
+    def day_end(self, session_code):
+        """End of the last window of a session, or None if it has no active window"""
+        window = self.windows().get(session_code)
+        return max(window[2]) if window else None
+
+session_windows = SessionWindows()
+
+@event.listens_for(AttendanceSession, 'after_insert')
+@event.listens_for(AttendanceSession, 'after_update')
+@event.listens_for(AttendanceSession, 'after_delete')
+def _invalidate_session_windows(mapper, connection, target):
+    session_windows.invalidate()
+
+def classify_scan(session_code, scan_time):
+    return session_windows.classify(session_code, scan_time)
+
+def sessions_open_at(day, now=None):
+    """Session codes whose last window on day has not ended yet at now"""
+    now = now or datetime.now(INSTITUTION_TIMEZONE).replace(tzinfo=None)
+    if day < now.date():
+        return []
+    if day > now.date():
+        return sorted(session_windows.windows())
+    return sorted(code for code in session_windows.windows() if session_windows.day_end(code) > now.time())
+
+def materialize_absences(day):
+    """Insert an 'absent' record for every active student with no record on day.
+
+    Only sessions with a working day on day (see percentages.working_days)
+    are marked. Each session is one INSERT ... SELECT ... WHERE NOT EXISTS,
+    so no students are loaded into Python. The rows are stamped with the
+    session's end time, and that day's rollups are rebuilt afterwards.
+    Returns {session_code: rows inserted}.
+    """
+    from percentages import working_days
+    from rollups import rebuild_rollups
+
+    inserted = {}
+    try:
+        for code, dates in working_days(day, day).items():
+            end_time = session_windows.day_end(code)
+            if not dates or end_time is None:
+                continue
+            already_recorded = exists().where(AttendanceRecord.student_id == Student.id,
+                                              AttendanceRecord.scan_date == day)
+            absentees = select(
+                Student.id, Student.card_id,
+                literal(datetime.combine(day, end_time)), literal(day), literal(end_time),
+                literal(ABSENCE_LOCATION), literal(ABSENCE_SCANNER_ID), literal('absent')
+            ).where(Student.is_active == True, Student.session == code, ~already_recorded)  # noqa: E712
+            result = db.session.execute(insert(AttendanceRecord).from_select(
+                ['student_id', 'card_id', 'scan_datetime', 'scan_date', 'scan_time', 'location', 'scanner_id', 'status'],
+                absentees
+            ))
+            inserted[code] = result.rowcount
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Absence materialisation error for {day}: {e}")
+        db.session.rollback()
+        raise
+
+    # Rebuilding the day's rollups also clears every worker's cached responses
+    rebuild_rollups(day, day)
+    logging.info(f"Marked absences for {day}: {inserted}")
+    return inserted
+
+def default_absence_day():
+    """The most recent day whose sessions have all ended"""
+    today = institution_today()
+    return today if not sessions_open_at(today) else today - timedelta(days=1)
@@ -0,0 +1,2 @@
+"""Benchmarks for the attendance system. Run from the repository root, e.g.
+``python -m benchmarks.query_plans --database-url sqlite:////tmp/bench.db``."""
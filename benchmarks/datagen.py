@@ -0,0 +1,159 @@
+"""Seeded synthetic campus data for the benchmarks.
+
+    python -m benchmarks.datagen --database-url sqlite:////tmp/bench.db --students 5000 --days 200
+
+Students are spread across the AN/FN sessions, the three campuses and the
+course list, each with their own attendance habit. Every working day, each
+student attends with that probability and swipes around their session's
+start: most a few minutes early, some after the grace period, and a tail
+of stragglers well into the session. The same seed, sizes and end date
+always produce the same rows. Daily rollups are rebuilt afterwards.
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+SESSIONS = ['AN', 'FN']
+CAMPUSES = ['AEC', 'ACET', 'ACOE']
+COURSES = ['CE', 'EEE', 'ME', 'ECE', 'CSE']
+CARD_PREFIX = 'BCARD'
+INSERT_BATCH = 10000
+# Minutes relative to the session start
+ARRIVAL_MEAN = -12
+ARRIVAL_SPREAD = 10
+STRAGGLER_SHARE = 0.08
+STRAGGLER_MAX = 90
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=200, help='calendar days of history ending yesterday')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def card_id(number):
+    return f'{CARD_PREFIX}{number:07d}'
+
+def make_students(count, rng):
+    """Student rows with a per-student attendance probability (not stored)"""
+    students = []
+    for number in range(count):
+        students.append({
+            'roll_number': f'B{number:07d}',
+            'card_id': card_id(number),
+            'name': f'Bench Student {number}',
+            'session': SESSIONS[number % len(SESSIONS)],
+            'campus': rng.choice(CAMPUSES),
+            'course': rng.choice(COURSES),
+            'year': rng.randint(1, 4),
+            'is_active': True
+        })
+    habits = [rng.betavariate(8, 1.5) for _ in students]
+    return students, habits
+
+def scan_offset(rng):
+    """Seconds from session start at which a student swipes"""
+    if rng.random() < STRAGGLER_SHARE:
+        return rng.uniform(0, STRAGGLER_MAX * 60)
+    return rng.gauss(ARRIVAL_MEAN, ARRIVAL_SPREAD) * 60
+
+def bench_summary(db, Student, AttendanceRecord):
+    bench = Student.card_id.like(f'{CARD_PREFIX}%')
+    students = db.session.query(Student.id).filter(bench).count()
+    records, first_day, last_day = db.session.query(
+        db.func.count(AttendanceRecord.id), db.func.min(AttendanceRecord.scan_date), db.func.max(AttendanceRecord.scan_date)
+    ).join(Student, AttendanceRecord.student_id == Student.id).filter(bench).one()
+    return {'students': students, 'records': records,
+            'first_day': first_day.isoformat() if first_day else None,
+            'last_day': last_day.isoformat() if last_day else None}
+
+def populate(students=5000, days=200, seed=42, end_date=None, log=sys.stderr):
+    """Fill students and attendance_records, or reuse an identical earlier run.
+
+    Must run inside an app context. The schema and default sessions are
+    created first if missing. A database already holding a different
+    number of benchmark students is refused rather than mixed into.
+    Returns a summary dict of what the database holds.
+    """
+    from app import db, init_database
+    from commands import create_default_data
+    from models import Student, AttendanceRecord
+    from percentages import WORKING_WEEKDAYS
+    from attendance_status import session_windows
+    from rollups import rebuild_rollups
+    from cache import student_cache
+    from response_cache import response_cache
+    from utils import institution_today
+
+    init_database()
+    create_default_data()
+    existing = bench_summary(db, Student, AttendanceRecord)
+    if existing['students'] == students and existing['records']:
+        existing['seed'] = None
+        return existing
+    if existing['students']:
+        raise SystemExit(f"Database holds {existing['students']} benchmark students; "
+                         f"use a fresh database for {students}")
+
+    rng = random.Random(seed)
+    student_rows, habits = make_students(students, rng)
+    for start in range(0, len(student_rows), INSERT_BATCH):
+        db.session.execute(Student.__table__.insert(), student_rows[start:start + INSERT_BATCH])
+    db.session.commit()
+    ids = dict(db.session.query(Student.card_id, Student.id).filter(Student.card_id.like(f'{CARD_PREFIX}%')))
+
+    windows = session_windows.windows()
+    starts = {code: windows[code][0][0] if code in windows else None for code in SESSIONS}
+    end_date = end_date or institution_today() - timedelta(days=1)
+    batch = []
+    inserted = 0
+    for offset in range(days - 1, -1, -1):
+        day = end_date - timedelta(days=offset)
+        if day.weekday() not in WORKING_WEEKDAYS:
+            continue
+        for row, habit in zip(student_rows, habits):
+            if rng.random() >= habit:
+                continue
+            start = starts[row['session']] or datetime.min.time()
+            scan_datetime = datetime.combine(day, start) + timedelta(seconds=int(scan_offset(rng)))
+            scan_time = scan_datetime.time()
+            batch.append({
+                'student_id': ids[row['card_id']],
+                'card_id': row['card_id'],
+                'scan_datetime': scan_datetime,
+                'scan_date': scan_datetime.date(),
+                'scan_time': scan_time,
+                'location': 'Main Campus',
+                'scanner_id': f"bench-{row['campus']}",
+                'status': session_windows.classify(row['session'], scan_time)
+            })
+            if len(batch) >= INSERT_BATCH:
+                db.session.execute(AttendanceRecord.__table__.insert(), batch)
+                db.session.commit()
+                inserted += len(batch)
+                batch = []
+                print(f"  seeded {inserted} records", file=log)
+    if batch:
+        db.session.execute(AttendanceRecord.__table__.insert(), batch)
+        db.session.commit()
+
+    rebuild_rollups()
+    student_cache.warm()
+    response_cache.clear()
+    summary = bench_summary(db, Student, AttendanceRecord)
+    summary['seed'] = seed
+    return summary
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+    from main import app
+    with app.app_context():
+        summary = populate(args.students, args.days, args.seed)
+    print(summary)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Simulate many biometric scanners against the scan gateway (or the Flask
+endpoint) and report acknowledgement latency percentiles.
+
+    flask --app main serve-gateway --port 5001
+    python -m benchmarks.gateway_load --url http://127.0.0.1:5001 --scanners 2000 --scans 20
+
+Each simulated scanner keeps one keep-alive connection open and sends its
+scans back to back. Card IDs are read from --database-url when given,
+otherwise the BCARD numbering used by benchmarks.datagen is assumed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5001')
+    parser.add_argument('--scanners', type=int, default=1000, help='concurrent scanner connections')
+    parser.add_argument('--scans', type=int, default=20, help='scans sent by each scanner')
+    parser.add_argument('--cards', type=int, default=5000, help='synthetic card IDs when no database is given')
+    parser.add_argument('--database-url', help='read active card IDs from this database')
+    parser.add_argument('--ramp', type=float, default=1.0, help='seconds over which scanners connect')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def load_card_ids(args):
+    if not args.database_url:
+        return [f'BCARD{number:07d}' for number in range(args.cards)]
+    os.environ['DATABASE_URL'] = args.database_url
+    from main import app
+    from app import db
+    from models import Student
+    with app.app_context():
+        return [card_id for card_id, in db.session.query(Student.card_id).filter(Student.is_active == True)]  # noqa: E712
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    body = await reader.readexactly(length)
+    return status, json.loads(body)
+
+async def scanner(number, args, target, card_ids, latencies, outcomes):
+    rng = random.Random(args.seed + number)
+    await asyncio.sleep(rng.random() * args.ramp)
+    reader, writer = await asyncio.open_connection(target.hostname, target.port or 80)
+    try:
+        for _ in range(args.scans):
+            scanned_at = datetime.now() - timedelta(days=rng.randint(0, 30), seconds=rng.randint(0, 3600))
+            body = json.dumps({
+                'card_id': rng.choice(card_ids),
+                'timestamp': scanned_at.isoformat(timespec='seconds'),
+                'scanner_id': f'load-{number}',
+                'location': 'Load Test'
+            }).encode()
+            request = (f"POST {target.path.rstrip('/')}/api/biometric/scan HTTP/1.1\r\n"
+                       f"Host: {target.netloc}\r\nContent-Type: application/json\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, payload = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status != 200 or not payload.get('success'):
+                outcome = payload.get('message', f'HTTP {status}')
+            elif payload.get('duplicate'):
+                outcome = 'duplicate'
+            else:
+                outcome = 'recorded'
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        writer.close()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(args, card_ids):
+    target = urlsplit(args.url)
+    latencies = []
+    outcomes = {}
+    started = time.perf_counter()
+    results = await asyncio.gather(*(scanner(number, args, target, card_ids, latencies, outcomes)
+                                     for number in range(args.scanners)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    errors = [result for result in results if isinstance(result, Exception)]
+    return latencies, outcomes, errors, elapsed
+
+def main():
+    args = parse_args()
+    card_ids = load_card_ids(args)
+    if not card_ids:
+        sys.exit("No card IDs to scan")
+
+    latencies, outcomes, errors, elapsed = asyncio.run(run(args, card_ids))
+    latencies.sort()
+    print(f"Scanners: {args.scanners}  scans: {len(latencies)}  elapsed: {elapsed:.2f}s  "
+          f"throughput: {len(latencies) / elapsed:.0f} scans/s")
+    if latencies:
+        print(f"Ack latency  p50={percentile(latencies, 0.50) * 1000:.1f}ms  "
+              f"p99={percentile(latencies, 0.99) * 1000:.1f}ms  max={latencies[-1] * 1000:.1f}ms")
+    print(f"Outcomes: {json.dumps(outcomes, sort_keys=True)}")
+    if errors:
+        print(f"Connection errors: {len(errors)} (first: {errors[0]!r})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Caller-side cost of logging one scan: the previous eagerly formatted
+logging.info through a synchronous handler against log_event through the
+background queue, writing to the same file. --sink-delay-ms stalls every
+write the way a full stderr pipe or a slow disk does.
+
+    python -m benchmarks.log_pipeline --events 50000 --sink-delay-ms 0.2
+
+The caller's time is what a scan request pays; the writer thread's time
+is not measured. With a stalled sink the queue fills up and the excess is
+dropped, which the output reports.
+"""
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import date, time as clock
+import log_events
+from log_events import log_event, BackgroundQueueHandler, JsonFormatter
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50_000)
+    parser.add_argument('--sink-delay-ms', type=float, default=0.0)
+    parser.add_argument('--duplicate-share', type=float, default=0.3, help='share of scans that are duplicates')
+    parser.add_argument('--duplicate-sample-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path, delay):
+        super().__init__(path)
+        self.delay = delay
+
+    def emit(self, record):
+        if self.delay:
+            time.sleep(self.delay)
+        super().emit(record)
+
+class Student:
+    def __init__(self, number):
+        self.name = f'Student {number}'
+        self.roll_number = f'{number:05d}'
+        self.session = 'AN'
+
+def legacy_scan_log(student, duplicate, scan_date, scan_time):
+    """The per-scan log lines routes.py wrote before log_events existed"""
+    if duplicate:
+        logging.info(f"Duplicate scan attempt for student {student.roll_number} on {scan_date}")
+    else:
+        logging.info(f"Attendance recorded for {student.name} ({student.roll_number}) at {scan_time}")
+
+def event_scan_log(student, duplicate, scan_date, scan_time):
+    if duplicate:
+        log_event('scan.duplicate', roll_number=student.roll_number, scan_date=scan_date, previous_time=scan_time)
+    else:
+        log_event('scan.recorded', roll_number=student.roll_number, session=student.session, scan_date=scan_date,
+                  scan_time=scan_time, status='present', scanner_id='S1')
+
+def run(log_scan, scans):
+    latencies = []
+    for student, duplicate, scan_date, scan_time in scans:
+        started = time.perf_counter()
+        log_scan(student, duplicate, scan_date, scan_time)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'mean_us': sum(latencies) / len(latencies) * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+        'max_us': latencies[-1] * 1e6,
+        'total_s': sum(latencies)
+    }
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    scans = [(Student(rng.randrange(5000)), rng.random() < args.duplicate_share,
+              date(2025, 7, 1), clock(9, rng.randrange(60), rng.randrange(60))) for _ in range(args.events)]
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    delay = args.sink_delay_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        sink = SlowFileHandler(f'{directory}/before.log', delay)
+        sink.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        root.handlers = [sink]
+        before = run(legacy_scan_log, scans)
+
+        sink = SlowFileHandler(f'{directory}/after.log', delay)
+        sink.setFormatter(JsonFormatter())
+        handler = BackgroundQueueHandler([sink])
+        handler.start()
+        root.handlers = [handler]
+        log_events.SAMPLE_RATES['scan.duplicate'] = args.duplicate_sample_rate
+        after = run(event_scan_log, scans)
+        drain_started = time.perf_counter()
+        handler.stop()
+        after['writer_drain_s'] = time.perf_counter() - drain_started
+        after['dropped'] = handler.dropped
+        root.handlers = []
+
+    print(f"{args.events} scan log calls, sink delay {args.sink_delay_ms}ms, "
+          f"duplicates sampled at {args.duplicate_sample_rate}")
+    print(f"{'path':<10}{'mean us':>10}{'p99 us':>10}{'max us':>10}{'caller s':>10}")
+    for label, result in (('before', before), ('after', after)):
+        print(f"{label:<10}{result['mean_us']:>10.1f}{result['p99_us']:>10.1f}{result['max_us']:>10.0f}{result['total_s']:>10.2f}")
+    print(f"after: writer drained the rest in {after['writer_drain_s']:.2f}s, dropped {after['dropped']} records")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Per-request CPU of building and running the attendance filter query: the
+previous ORM Query rebuilt on every call against the per-shape cached
+statements in attendance_query, for a first page of the attendance table
+under each filter shape.
+
+    python -m benchmarks.query_builder --database-url sqlite:////tmp/bench.db
+
+Small pages make statement construction and SQL compilation the dominant
+cost, which is what the statement cache removes; database time is the same
+for both paths.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from benchmarks.datagen import populate
+
+FILTER_SHAPES = {
+    'no filters': {},
+    'session': {'session': 'AN'},
+    'session+campus+course': {'session': 'AN', 'campus': 'AEC', 'course': 'CSE'},
+    'date range': {'date_from': -7, 'date_to': 0},
+    'all filters': {'session': 'FN', 'campus': 'ACET', 'course': 'ME', 'date_from': -30, 'date_to': 0},
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--requests', type=int, default=2000, help='queries per filter shape and path')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def legacy_page(db, Student, AttendanceRecord, filters, limit):
+    """The filter_attendance query as built before attendance_query existed"""
+    columns = (
+        AttendanceRecord.id, Student.name, Student.roll_number, Student.session, Student.campus,
+        Student.course, AttendanceRecord.scan_date, AttendanceRecord.scan_time, AttendanceRecord.location,
+        AttendanceRecord.status, AttendanceRecord.scan_datetime
+    )
+    query = db.session.query(*columns).join(Student, AttendanceRecord.student_id == Student.id)
+    if filters.get('session'):
+        query = query.filter(Student.session == filters['session'])
+    if filters.get('campus'):
+        query = query.filter(Student.campus == filters['campus'])
+    if filters.get('course'):
+        query = query.filter(Student.course == filters['course'])
+    if filters.get('date_from'):
+        query = query.filter(AttendanceRecord.scan_date >= datetime.strptime(filters['date_from'], '%Y-%m-%d').date())
+    if filters.get('date_to'):
+        query = query.filter(AttendanceRecord.scan_date <= datetime.strptime(filters['date_to'], '%Y-%m-%d').date())
+    return query.order_by(AttendanceRecord.scan_datetime.desc(), AttendanceRecord.id.desc()).limit(limit).all()
+
+def cpu_per_request(run, requests):
+    started = time.process_time()
+    for _ in range(requests):
+        run()
+    return (time.process_time() - started) / requests * 1e6
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from main import app
+    from app import db
+    from models import Student, AttendanceRecord
+    from attendance_query import AttendanceFilters, fetch_attendance
+
+    with app.app_context():
+        print(f"Preparing {args.students} students x {args.days} days...", file=sys.stderr)
+        populate(args.students, args.days, args.seed)
+        last_day = db.session.query(db.func.max(AttendanceRecord.scan_date)).scalar()
+
+        print(f"Database: {db.engine.dialect.name}, {args.requests} requests per shape, page size {args.page_size}")
+        print(f"{'filter shape':<24}{'before us/req':>15}{'after us/req':>15}{'speedup':>10}")
+        for label, shape in FILTER_SHAPES.items():
+            filters = {key: (last_day + timedelta(days=value)).isoformat() if key.startswith('date') else value
+                       for key, value in shape.items()}
+            limit = args.page_size + 1
+
+            before_rows = legacy_page(db, Student, AttendanceRecord, filters, limit)
+            after_rows = fetch_attendance(AttendanceFilters.from_report_filters(filters), 'page', limit=limit)
+            assert [tuple(row) for row in before_rows] == [tuple(row) for row in after_rows], label
+
+            before = cpu_per_request(lambda: legacy_page(db, Student, AttendanceRecord, filters, limit), args.requests)
+            after = cpu_per_request(
+                lambda: fetch_attendance(AttendanceFilters.from_report_filters(filters), 'page', limit=limit),
+                args.requests)
+            print(f"{label:<24}{before:>15.0f}{after:>15.0f}{before / after:>9.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Seed a large attendance table and report the EXPLAIN plan and latency of
+the attendance filter query for each filter combination.
+
+    python -m benchmarks.query_plans --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.query_plans --database-url postgresql://localhost/bench
+
+The database is filled by benchmarks.datagen, and reused when it already
+holds the same number of benchmark students.
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+from datetime import timedelta
+
+from benchmarks.datagen import populate
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per filter combination')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def explain(db, statement, params):
+    """Return the database's plan for a SELECT with its bind parameter values"""
+    engine = db.engine
+    compiled = statement.compile(bind=engine)
+    values = compiled.construct_params(params)
+    if engine.dialect.name == 'sqlite':
+        values = tuple(values[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), values).all()
+        return '\n'.join(f'  {row[-1]}' for row in rows)
+    rows = db.session.connection().exec_driver_sql('EXPLAIN ' + str(compiled), values).all()
+    return '\n'.join(f'  {row[0]}' for row in rows)
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from main import app
+    from app import db
+    from models import AttendanceRecord
+    from attendance_query import AttendanceFilters, attendance_statement
+
+    with app.app_context():
+        print(f"Preparing {args.students} students x {args.days} days...", file=sys.stderr)
+        populate(args.students, args.days, args.seed)
+
+        last_day = db.session.query(db.func.max(AttendanceRecord.scan_date)).scalar()
+        date_ranges = [
+            ('', ''),
+            ((last_day - timedelta(days=6)).isoformat(), last_day.isoformat()),
+            ((last_day - timedelta(days=29)).isoformat(), last_day.isoformat()),
+        ]
+        combinations = itertools.product(['', 'AN'], ['', 'AEC'], ['', 'CSE'], date_ranges)
+
+        print(f"Database: {db.engine.dialect.name}")
+        for session_filter, campus_filter, course_filter, (date_from, date_to) in combinations:
+            filters = {'session': session_filter, 'campus': campus_filter, 'course': course_filter,
+                       'date_from': date_from, 'date_to': date_to}
+            statement, params = attendance_statement(AttendanceFilters.from_report_filters(filters))
+
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                count = len(db.session.execute(statement, params).all())
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+
+            label = ' '.join(f'{key}={value}' for key, value in filters.items() if value) or 'no filters'
+            print(f"\n[{label}] rows={count} median={timings[len(timings) // 2] * 1000:.1f}ms min={timings[0] * 1000:.1f}ms")
+            print(explain(db, statement, params))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Microbenchmark of scan payload parsing: the previous validate-then-reparse
+path against the single-pass parse_scan/parse_scans, per timestamp style.
+
+Only naive timestamps get faster. The legacy path never converted aware
+(Z or offset) timestamps to institution time, so for those styles
+parse_scan does more work and is slower; there is no separate fast path
+for them. A fixed-offset shortcut in place of astimezone was tried and
+measured no faster.
+
+    python -m benchmarks.scan_parsing --scans 100000
+"""
+import random
+import timeit
+import argparse
+from datetime import datetime, timedelta, timezone
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scans', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+TIMESTAMP_STYLES = {
+    'naive local': lambda scanned_at: scanned_at.isoformat(),
+    'UTC with Z': lambda scanned_at: scanned_at.isoformat() + 'Z',
+    '+05:30 offset': lambda scanned_at: scanned_at.replace(tzinfo=timezone(timedelta(hours=5, minutes=30))).isoformat(),
+}
+
+def make_payloads(count, rng, style):
+    """Scanner payloads whose timestamps all use one of TIMESTAMP_STYLES"""
+    start = datetime(2025, 7, 1, 8, 0)
+    payloads = []
+    for number in range(count):
+        scanned_at = start + timedelta(seconds=rng.randint(0, 180 * 86400))
+        timestamp = TIMESTAMP_STYLES[style](scanned_at)
+        payloads.append({'card_id': f'CARD{number % 5000:05d}', 'timestamp': timestamp,
+                         'scanner_id': f'S{number % 40}', 'location': 'Main Campus'})
+    return payloads
+
+def legacy_path(payloads):
+    """The per-scan work done before parse_scan existed"""
+    parsed = []
+    for data in payloads:
+        if not isinstance(data, dict):
+            continue
+        if any(field not in data or not data[field] for field in ('card_id', 'timestamp')):
+            continue
+        try:
+            datetime.fromisoformat(data.get('timestamp').replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        scan_datetime = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))
+        parsed.append((data['card_id'], scan_datetime, scan_datetime.date(), scan_datetime.time(),
+                       data.get('scanner_id', 'unknown'), data.get('location', 'Main Campus')))
+    return parsed
+
+def main():
+    args = parse_args()
+    from utils import parse_scan, parse_scans
+
+    for style in TIMESTAMP_STYLES:
+        payloads = make_payloads(args.scans, random.Random(args.seed), style)
+        cases = [
+            ('legacy validate + reparse', lambda: legacy_path(payloads)),
+            ('parse_scan per payload', lambda: [parse_scan(data) for data in payloads]),
+            ('parse_scans batch', lambda: parse_scans(payloads)),
+        ]
+        print(f"\n{style} timestamps ({args.scans} scans, best of {args.repeat})")
+        baseline = None
+        for label, run in cases:
+            best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            per_scan = best / args.scans * 1e6
+            baseline = baseline or per_scan
+            print(f"  {label:28s} {best * 1000:8.1f}ms  {per_scan:6.2f}us/scan  {baseline / per_scan:5.2f}x")
+
+if __name__ == '__main__':
+    main()
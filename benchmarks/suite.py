@@ -0,0 +1,333 @@
+"""Scenario benchmarks for the scan and report paths, written to a JSON file
+so runs can be compared across commits.
+
+    python -m benchmarks.suite --database-url sqlite:////tmp/bench.db --students 5000 --days 200
+    python -m benchmarks.suite --database-url sqlite:////tmp/bench.db --compare benchmarks/results/<earlier>.json
+
+The database is filled by benchmarks.datagen on first use (same seed, same
+rows) and reused afterwards. Requests go through the Flask test client, so
+the numbers cover the application and database but not a WSGI server; use
+benchmarks.gateway_load for that. Scans are sent for today, after the
+generated history, and removed again when the run ends.
+
+Scenarios:
+  scan_single      sequential first scans of the day
+  scan_concurrent  first scans from --threads concurrent scanners
+  swipe_storm      a few cards swiping over and over (mostly duplicates)
+  filter           first and second page for each filter shape
+  download         Excel, CSV, NDJSON and gzipped CSV downloads of about 10k/100k/1M rows
+  dashboard        dashboard stats, cold (response cache cleared) and warm
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.datagen import populate, card_id
+
+SCENARIOS = ('scan_single', 'scan_concurrent', 'swipe_storm', 'filter', 'download', 'dashboard')
+FILTER_SHAPES = {
+    'no filters': {},
+    'session': {'session': 'AN'},
+    'session+campus+course': {'session': 'AN', 'campus': 'AEC', 'course': 'CSE'},
+    'last 7 days': {'days': 7},
+    'all filters, 30 days': {'session': 'FN', 'campus': 'ACET', 'course': 'ME', 'days': 30},
+}
+DOWNLOAD_SIZES = (10_000, 100_000, 1_000_000)
+DOWNLOAD_FORMATS = ('xlsx', 'csv', 'ndjson', 'csv+gzip')
+SUITE_SCANNER = 'bench-suite'
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset to run')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scan/filter/dashboard scenario')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent scanners for scan_concurrent')
+    parser.add_argument('--storm-cards', type=int, default=20, help='cards swiping in swipe_storm')
+    parser.add_argument('--output', help='result file (defaults to benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='earlier result file to print changes against')
+    return parser.parse_args()
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(latencies, elapsed=None, **extra):
+    ordered = sorted(latencies)
+    result = {
+        'requests': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+    if elapsed:
+        result['throughput_per_s'] = round(len(ordered) / elapsed, 1)
+    result.update(extra)
+    return result
+
+def timed(call):
+    started = time.perf_counter()
+    response = call()
+    return time.perf_counter() - started, response
+
+def logged_in_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_role'] = 'admin'
+    return client
+
+def scan_body(card, scanned_at):
+    return {'card_id': card, 'timestamp': scanned_at.isoformat(timespec='seconds'),
+            'scanner_id': SUITE_SCANNER, 'location': 'Main Campus'}
+
+class Suite:
+    def __init__(self, app, args, dataset):
+        self.app = app
+        self.args = args
+        self.dataset = dataset
+        self.rng = random.Random(args.seed)
+        self.cards = [card_id(number) for number in range(dataset['students'])]
+        self.rng.shuffle(self.cards)
+        self.next_card = 0
+        self.client = logged_in_client(app)
+
+    def fresh_cards(self, count):
+        """Cards with no scan yet today; each scan scenario takes its own"""
+        cards = self.cards[self.next_card:self.next_card + count]
+        if len(cards) < count:
+            raise SystemExit(f'Not enough students for {count} more first scans; raise --students')
+        self.next_card += count
+        return cards
+
+    def scan_time(self):
+        from utils import institution_today
+        return datetime.combine(institution_today(), datetime.min.time()).replace(hour=9, minute=self.rng.randint(0, 59))
+
+    def post_scans(self, client, cards):
+        latencies = []
+        outcomes = {}
+        for card in cards:
+            body = scan_body(card, self.scan_time())
+            elapsed, response = timed(lambda: client.post('/api/biometric/scan', json=body))
+            latencies.append(elapsed)
+            payload = response.get_json()
+            if payload.get('duplicate'):
+                outcome = 'duplicate'
+            else:
+                outcome = 'recorded' if payload.get('success') else payload.get('message', 'error')
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        return latencies, outcomes
+
+    def scan_single(self):
+        latencies, outcomes = self.post_scans(self.client, self.fresh_cards(self.args.requests))
+        return summarize(latencies, sum(latencies), outcomes=outcomes)
+
+    def scan_concurrent(self):
+        threads = self.args.threads
+        cards = self.fresh_cards(self.args.requests)
+        shares = [cards[index::threads] for index in range(threads)]
+
+        def run(share):
+            return self.post_scans(self.app.test_client(), share)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(run, shares))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for share_latencies, _ in results for latency in share_latencies]
+        outcomes = {}
+        for _, share_outcomes in results:
+            for outcome, count in share_outcomes.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+        return summarize(latencies, elapsed, threads=threads, outcomes=outcomes)
+
+    def swipe_storm(self):
+        cards = self.fresh_cards(self.args.storm_cards)
+        swipes = [self.rng.choice(cards) for _ in range(self.args.requests)]
+        latencies, outcomes = self.post_scans(self.client, swipes)
+        return summarize(latencies, sum(latencies), cards=len(cards), outcomes=outcomes)
+
+    def filter(self):
+        last_day = datetime.strptime(self.dataset['last_day'], '%Y-%m-%d').date()
+        results = {}
+        for label, shape in FILTER_SHAPES.items():
+            body = {key: value for key, value in shape.items() if key != 'days'}
+            if 'days' in shape:
+                body['date_from'] = (last_day - timedelta(days=shape['days'] - 1)).isoformat()
+                body['date_to'] = last_day.isoformat()
+            first_pages, second_pages = [], []
+            for _ in range(self.args.requests):
+                self.clear_response_cache()
+                elapsed, response = timed(lambda: self.client.post('/api/attendance/filter', json=body))
+                first_pages.append(elapsed)
+                cursor = response.get_json().get('next_cursor')
+                if cursor:
+                    elapsed, _ = timed(lambda: self.client.post('/api/attendance/filter', json={**body, 'cursor': cursor}))
+                    second_pages.append(elapsed)
+            results[label] = {'first_page': summarize(first_pages)}
+            if second_pages:
+                results[label]['next_page'] = summarize(second_pages)
+        return results
+
+    def download_ranges(self):
+        """Date ranges ending on the last generated day holding about each target row count"""
+        from models import DailyAttendanceRollup
+        from app import db
+        per_day = db.session.query(
+            DailyAttendanceRollup.scan_date,
+            db.func.sum(DailyAttendanceRollup.present + DailyAttendanceRollup.late + DailyAttendanceRollup.absent)
+        ).group_by(DailyAttendanceRollup.scan_date).order_by(DailyAttendanceRollup.scan_date.desc()).all()
+        ranges = []
+        for target in DOWNLOAD_SIZES:
+            total = 0
+            first_day = None
+            for scan_date, count in per_day:
+                total += count
+                first_day = scan_date
+                if total >= target:
+                    break
+            ranges.append((target, first_day, total))
+        return per_day[0][0] if per_day else None, ranges
+
+    def download(self):
+        with self.app.app_context():
+            last_day, ranges = self.download_ranges()
+        results = {}
+        for target, first_day, rows in ranges:
+            for export_format in DOWNLOAD_FORMATS:
+                body = {'date_from': first_day.isoformat(), 'date_to': last_day.isoformat()}
+                name, _, compress = export_format.partition('+')
+                if name != 'xlsx':
+                    body.update(format=name, gzip=bool(compress))
+                # Streamed formats are produced while the body is read, so time both
+                elapsed, data = timed(lambda: self.client.post('/api/attendance/download', json=body).get_data())
+                key = f'{target}_rows' if export_format == 'xlsx' else f'{target}_rows_{export_format}'
+                results[key] = {
+                    'rows': rows,
+                    'capped': rows < target,
+                    'seconds': round(elapsed, 3),
+                    'rows_per_s': round(rows / elapsed, 1),
+                    'bytes': len(data)
+                }
+        return results
+
+    def clear_response_cache(self):
+        from response_cache import response_cache
+        response_cache.clear()
+
+    def dashboard(self):
+        cold, warm = [], []
+        for _ in range(self.args.requests):
+            self.clear_response_cache()
+            cold.append(timed(lambda: self.client.get('/api/dashboard/stats'))[0])
+            warm.append(timed(lambda: self.client.get('/api/dashboard/stats'))[0])
+        return {'cold': summarize(cold), 'warm': summarize(warm)}
+
+    def cleanup(self):
+        """Remove today's suite scans so the next run starts from the same data"""
+        from app import db
+        from models import AttendanceRecord
+        from rollups import rebuild_rollups
+        from cache import scan_index
+        from utils import institution_today
+        with self.app.app_context():
+            db.session.query(AttendanceRecord).filter(AttendanceRecord.scanner_id == SUITE_SCANNER)\
+                .delete(synchronize_session=False)
+            db.session.commit()
+            today = institution_today()
+            rebuild_rollups(today, today)
+            scan_index.clear()
+            self.clear_response_cache()
+
+def environment(app):
+    from app import db
+    import sqlalchemy
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                    text=True, cwd=os.path.dirname(__file__)).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+        'database': dialect
+    }
+
+def compare(results, baseline_path):
+    """Print p50 changes for every scenario result present in both runs"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def walk(current, previous, path):
+        if not isinstance(current, dict) or not isinstance(previous, dict):
+            return
+        for key in ('p50_ms', 'seconds'):
+            if key in current and key in previous and previous[key]:
+                change = (current[key] - previous[key]) / previous[key] * 100
+                print(f"{'/'.join(path):<56}{key:>8} {previous[key]:>10.2f} -> {current[key]:>10.2f} ({change:+.1f}%)")
+        for key, value in current.items():
+            walk(value, previous.get(key), path + [key])
+
+    print(f"\nCompared with {baseline_path} (commit {baseline['environment'].get('commit')})")
+    walk(results['scenarios'], baseline.get('scenarios', {}), [])
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+    selected = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    import logging
+    from main import app
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        print(f"Preparing {args.students} students x {args.days} days...", file=sys.stderr)
+        dataset = populate(args.students, args.days, args.seed)
+    results = {'environment': environment(app), 'arguments': vars(args), 'dataset': dataset, 'scenarios': {}}
+
+    suite = Suite(app, args, dataset)
+    try:
+        for name in selected:
+            print(f"Running {name}...", file=sys.stderr)
+            results['scenarios'][name] = getattr(suite, name)()
+    finally:
+        suite.cleanup()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        output = os.path.join(RESULTS_DIR, f"{results['environment']['commit'] or 'unknown'}-{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(json.dumps(results['scenarios'], indent=2, default=str))
+    print(f"\nResults written to {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app import db
+from models import Student, AttendanceRecord
+from response_cache import response_cache
+from live import broadcaster, publish_event
+from utils import institution_today
+
+STUDENT_CACHE_SIZE = int(os.environ.get("STUDENT_CACHE_SIZE", "20000"))
+# Seconds a cached student is trusted; bounds how long a change made where no
+# students.changed event reaches this worker (no shared LIVE_BUS) stays unseen
+STUDENT_CACHE_TTL = int(os.environ.get("STUDENT_CACHE_TTL", "300"))
+
+class StudentRecord:
+    """Compact, read-only view of an active student used on the scan path"""
+    __slots__ = ('id', 'card_id', 'name', 'roll_number', 'session', 'campus', 'course')
+
+    def __init__(self, id, card_id, name, roll_number, session, campus, course):
+        self.id = id
+        self.card_id = card_id
+        self.name = name
+        self.roll_number = roll_number
+        self.session = session
+        self.campus = campus
+        self.course = course
+
+    def __repr__(self):
+        return f"<StudentRecord {self.card_id} {self.roll_number}>"
+
+_RECORD_COLUMNS = (Student.id, Student.card_id, Student.name, Student.roll_number,
+                   Student.session, Student.campus, Student.course)
+
+class StudentCache:
+    """LRU cache of active students keyed by card_id, each entry kept for at most ttl seconds"""
+
+    def __init__(self, maxsize=STUDENT_CACHE_SIZE, ttl=STUDENT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _put(self, record, generation):
+        with self._lock:
+            # Drop loads that raced with an invalidation
+            if generation != self._generation:
+                return
+            self._records[record.card_id] = (record, time.monotonic() + self.ttl)
+            self._records.move_to_end(record.card_id)
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+
+    def _cached(self, card_id, now):
+        # Caller holds the lock
+        entry = self._records.get(card_id)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._records[card_id]
+            return None
+        self._records.move_to_end(card_id)
+        return entry[0]
+
+    def _load(self, card_ids):
+        rows = db.session.query(*_RECORD_COLUMNS)\
+            .filter(Student.card_id.in_(card_ids), Student.is_active == True)\
+            .all()  # noqa: E712
+        return [StudentRecord(*row) for row in rows]
+
+    def get(self, card_id):
+        """Return the active student for a card ID, or None"""
+        with self._lock:
+            record = self._cached(card_id, time.monotonic())
+            if record is not None:
+                self.hits += 1
+                return record
+            self.misses += 1
+            generation = self._generation
+
+        records = self._load([card_id])
+        if not records:
+            return None
+        self._put(records[0], generation)
+        return records[0]
+
+    def peek(self, card_id):
+        """Return the cached student for a card ID without querying the database, or None"""
+        with self._lock:
+            return self._cached(card_id, time.monotonic())
+
+    def get_many(self, card_ids):
+        """Resolve several card IDs, querying the database once for all misses"""
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for card_id in card_ids:
+                record = self._cached(card_id, now)
+                if record is not None:
+                    found[card_id] = record
+                else:
+                    missing.append(card_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            for record in self._load(missing):
+                self._put(record, generation)
+                found[record.card_id] = record
+        return found
+
+    def invalidate(self, *card_ids):
+        with self._lock:
+            self._generation += 1
+            for card_id in card_ids:
+                self._records.pop(card_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._records.clear()
+
+    def warm(self):
+        """Preload active students up to the cache size"""
+        try:
+            with self._lock:
+                generation = self._generation
+            rows = db.session.query(*_RECORD_COLUMNS)\
+                .filter(Student.is_active == True)\
+                .order_by(Student.id.desc())\
+                .limit(self.maxsize).all()  # noqa: E712
+            for row in reversed(rows):
+                self._put(StudentRecord(*row), generation)
+            logging.info(f"Student cache warmed with {len(rows)} students")
+        except Exception as e:
+            logging.error(f"Student cache warm-up error: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._records),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0
+            }
+
+class ScanDayIndex:
+    """Index of student_id -> first scan time for the most recent scan day.
+
+    Seeded from the database the first time a day is seen and rolled over
+    when the first scan of a newer day arrives. A miss only means "not known
+    here": callers fall back to the database, and the unique constraint stays
+    the final arbiter.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._day = None
+        self._seeded = False
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def _seed(self, scan_date):
+        rows = db.session.query(AttendanceRecord.student_id, AttendanceRecord.scan_time)\
+            .filter(AttendanceRecord.scan_date == scan_date).all()
+        with self._lock:
+            if self._day == scan_date:
+                for student_id, scan_time in rows:
+                    self._scans.setdefault(student_id, scan_time)
+        logging.info(f"Scan index seeded with {len(rows)} records for {scan_date}")
+
+    def _roll(self, scan_date, seed=True):
+        """Move the index to scan_date if it is newer; returns True if the day is indexed.
+
+        With seed, the day's stored scans are loaded the first time it is looked up.
+        """
+        # A scanner with a wrong clock must not drag the index away from today
+        if scan_date > institution_today() + timedelta(days=1):
+            return False
+        with self._lock:
+            if self._day is not None and scan_date < self._day:
+                return False
+            if scan_date != self._day:
+                self._day = scan_date
+                self._seeded = False
+                self._scans = {}
+            if not seed or self._seeded:
+                return True
+            self._seeded = True
+        try:
+            self._seed(scan_date)
+        except Exception:
+            with self._lock:
+                self._seeded = False
+            raise
+        return True
+
+    def lookup(self, student_id, scan_date):
+        """Return the first scan time recorded for the student on scan_date, or None"""
+        if not self._roll(scan_date):
+            return None
+        with self._lock:
+            scan_time = self._scans.get(student_id)
+            if scan_time is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return scan_time
+
+    def peek(self, student_id, scan_date):
+        """Return the first scan time known in memory for the student on scan_date, or None"""
+        with self._lock:
+            return self._scans.get(student_id) if scan_date == self._day else None
+
+    def record(self, student_id, scan_date, scan_time):
+        """Remember a stored or journaled scan so later swipes that day are answered from memory"""
+        if not self._roll(scan_date, seed=False):
+            return
+        with self._lock:
+            if scan_date == self._day:
+                self._scans.setdefault(student_id, scan_time)
+
+    def clear(self):
+        with self._lock:
+            self._day = None
+            self._seeded = False
+            self._scans = {}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'day': self._day.isoformat() if self._day else None,
+                'size': len(self._scans),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0
+            }
+
+student_cache = StudentCache()
+scan_index = ScanDayIndex()
+# Scans acknowledged from the scan journal before the drainer stores them; kept
+# apart from scan_index, which ingest trusts to mean "already stored"
+journaled_scans = ScanDayIndex()
+
+# Card IDs changed in a session's transaction, or None once every student must go
+CHANGED_STUDENTS_KEY = 'changed_student_card_ids'
+
+def _note_changed_students(session, card_ids):
+    changed = session.info.get(CHANGED_STUDENTS_KEY, set())
+    if changed is not None:
+        changed = None if card_ids is None else changed | card_ids
+    session.info[CHANGED_STUDENTS_KEY] = changed
+
+@event.listens_for(Student, 'after_insert')
+@event.listens_for(Student, 'after_update')
+@event.listens_for(Student, 'after_delete')
+def _collect_changed_student(mapper, connection, target):
+    """Note a changed student's current and previous card IDs for eviction at commit"""
+    card_ids = {target.card_id}
+    card_ids.update(inspect(target).attrs.card_id.history.deleted or ())
+    _note_changed_students(object_session(target), card_ids)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_student_changes(orm_execute_state):
+    """Bulk UPDATE/DELETE statements bypass mapper events, so evict everything at commit"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Student:
+            _note_changed_students(orm_execute_state.session, None)
+
+@event.listens_for(Session, 'after_commit')
+def _evict_committed_students(session):
+    """Evict once the change is visible to other connections, so no worker reloads the old row"""
+    if CHANGED_STUDENTS_KEY in session.info:
+        card_ids = session.info.pop(CHANGED_STUDENTS_KEY)
+        publish_students_changed(card_ids)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_students(session, previous_transaction):
+    # A rolled-back savepoint leaves the outer transaction's changes to commit
+    if previous_transaction.parent is None:
+        session.info.pop(CHANGED_STUDENTS_KEY, None)
+
+def evict_students(card_ids=None):
+    """Drop changed students, or all students when card_ids is None, from this worker's caches"""
+    if card_ids is None:
+        student_cache.clear()
+    else:
+        student_cache.invalidate(*card_ids)
+    response_cache.clear()
+
+def publish_students_changed(card_ids=None):
+    """Evict changed students here at once and in every other worker through the live bus"""
+    evict_students(card_ids)
+    publish_event({'type': 'students.changed', 'card_ids': sorted(card_ids) if card_ids is not None else None})
+
+def _on_live_event(event):
+    if event.get('type') == 'students.changed':
+        evict_students(event.get('card_ids'))
+
+# Student changes committed by any worker or CLI command evict this worker's entries
+broadcaster.add_listener(_on_live_event)
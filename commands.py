@@ -0,0 +1,212 @@
+import logging
+from datetime import datetime, time
+from functools import wraps
+import click
+from flask import Blueprint, current_app
+from app import db, init_database
+from db_engines import lift_statement_timeout
+from models import User, Student, AttendanceSession
+from rollups import rebuild_rollups
+from roster_import import import_roster, iter_roster_rows, IMPORT_CHUNK_SIZE
+from attendance_status import materialize_absences, sessions_open_at, default_absence_day
+
+# Commands register at the top level of the flask CLI, not under a group.
+# Modules only some commands need (the gateway, the attendance matrix,
+# archiving, partitioning) are imported inside them, so web workers that
+# register this blueprint do not load them at boot
+bp = Blueprint('commands', __name__, cli_group=None)
+
+def create_default_data():
+    """Create default users and sample data if they don't exist"""
+    try:
+        # Create default admin user
+        if not User.query.filter_by(username='Shanmukh').first():
+            admin = User(username='Shanmukh', full_name='Shanmukh Admin', role='admin')
+            admin.set_password('1234')
+            db.session.add(admin)
+            
+        # Create default attendance sessions
+        if not AttendanceSession.query.first():
+            morning_session = AttendanceSession(
+                session_name='Morning Session',
+                session_code='AN',
+                start_time=time(9, 0),
+                end_time=time(12, 0)
+            )
+            afternoon_session = AttendanceSession(
+                session_name='Afternoon Session', 
+                session_code='FN',
+                start_time=time(13, 0),
+                end_time=time(17, 0)
+            )
+            db.session.add(morning_session)
+            db.session.add(afternoon_session)
+            
+        # Create sample students
+        if not Student.query.first():
+            students = [
+                Student(roll_number='001', card_id='CARD001', name='John Doe', 
+                       session='AN', campus='AEC', course='CE'),
+                Student(roll_number='002', card_id='CARD002', name='Jane Smith',
+                       session='AN', campus='AEC', course='EEE'),
+                Student(roll_number='003', card_id='CARD003', name='Alice Johnson',
+                       session='FN', campus='ACET', course='CSE'),
+                Student(roll_number='004', card_id='CARD004', name='Bob Wilson',
+                       session='AN', campus='ACOE', course='ME'),
+                Student(roll_number='005', card_id='CARD005', name='Carol Brown',
+                       session='FN', campus='AEC', course='ECE'),
+            ]
+            for student in students:
+                db.session.add(student)
+                
+        db.session.commit()
+        logging.info("Default data created successfully")
+    except Exception as e:
+        logging.error(f"Error creating default data: {e}")
+        db.session.rollback()
+
+def untimed(command):
+    """Run a command with no statement timeout on any engine.
+
+    Imports, rebuilds and archiving legitimately run long; the web workers
+    and the scanner gateway keep the configured timeout.
+    """
+    @wraps(command)
+    def wrapper(*args, **kwargs):
+        for engine in db.engines.values():
+            lift_statement_timeout(engine)
+        return command(*args, **kwargs)
+    return wrapper
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+@bp.cli.command('init-db')
+@untimed
+def init_db_command():
+    """Create missing tables and rollups; run once per deploy, not per worker"""
+    init_database()
+    click.echo("Database initialised")
+
+@bp.cli.command('seed')
+def seed_command():
+    """Create the default admin user, attendance sessions and sample students if missing"""
+    create_default_data()
+    click.echo("Default data ensured")
+
+@bp.cli.command('rebuild-rollups')
+@click.option('--date-from', help='First scan date to rebuild (YYYY-MM-DD)')
+@click.option('--date-to', help='Last scan date to rebuild (YYYY-MM-DD)')
+@untimed
+def rebuild_rollups_command(date_from, date_to):
+    """Recompute the daily attendance rollups from attendance records"""
+    count = rebuild_rollups(_parse_date(date_from), _parse_date(date_to))
+    click.echo(f"Rebuilt {count} daily rollup rows")
+
+@bp.cli.command('create-indexes')
+@untimed
+def create_indexes_command():
+    """Create indexes declared in models.py that are missing from an existing database"""
+    db.create_all(bind_key=None)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            click.echo(f"Ensured index {index.name} on {table.name}")
+
+@bp.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='Write rejected rows to this CSV file')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per upsert statement')
+@untimed
+def import_students_command(path, errors_path, chunk_size):
+    """Bulk import or update students from a CSV or XLSX roster"""
+    with open(path, 'rb') as stream:
+        report = import_roster(iter_roster_rows(stream, path), chunk_size=chunk_size)
+
+    click.echo(f"Imported {report.imported} of {report.rows} rows in {report.elapsed:.2f}s "
+               f"({report.rows_per_second} rows/s), {len(report.errors)} errors")
+    if errors_path and report.errors:
+        with open(errors_path, 'w', newline='') as output:
+            report.write_errors(output)
+        click.echo(f"Rejected rows written to {errors_path}")
+
+@bp.cli.command('mark-absent')
+@click.option('--date', 'day', help='Day to mark (YYYY-MM-DD); defaults to the latest day whose sessions have ended')
+@click.option('--force', is_flag=True, help='Mark even though a session of that day has not ended yet')
+@untimed
+def mark_absent_command(day, force):
+    """Record 'absent' for active students with no attendance on a working day"""
+    day = _parse_date(day) or default_absence_day()
+    open_sessions = sessions_open_at(day)
+    if open_sessions and not force:
+        raise click.UsageError(f"Sessions {', '.join(open_sessions)} have not ended on {day}; pass --force to mark anyway")
+    inserted = materialize_absences(day)
+    if not inserted:
+        click.echo(f"{day} is not a working day for any session")
+    for code, count in inserted.items():
+        click.echo(f"Marked {count} {code} students absent on {day}")
+
+@bp.cli.command('save-attendance-matrix')
+@click.option('--path', help='Snapshot path (defaults to ATTENDANCE_MATRIX_PATH)')
+@untimed
+def save_attendance_matrix_command(path):
+    """Build the attendance bit matrix and write a snapshot for workers to map at startup"""
+    from attendance_matrix import attendance_matrix, ATTENDANCE_MATRIX_PATH
+
+    path = path or ATTENDANCE_MATRIX_PATH
+    if not path:
+        raise click.UsageError('Pass --path or set ATTENDANCE_MATRIX_PATH')
+    attendance_matrix.build()
+    attendance_matrix.save(path)
+    stats = attendance_matrix.stats()
+    click.echo(f"Saved {stats['students']} students x {stats['days']} days ({stats['bytes']} bytes) to {path}")
+
+@bp.cli.command('serve-gateway')
+@click.option('--host', default='0.0.0.0', show_default=True)
+@click.option('--port', default=5001, show_default=True)
+def serve_gateway_command(host, port):
+    """Run the asyncio scanner gateway for high-concurrency scan ingestion"""
+    from scan_gateway import run_gateway
+
+    run_gateway(current_app._get_current_object(), host, port)
+
+@bp.cli.command('archive-term')
+@click.argument('name')
+@click.option('--date-from', required=True, help='First day of the term (YYYY-MM-DD)')
+@click.option('--date-to', required=True, help='Last day of the term (YYYY-MM-DD)')
+@untimed
+def archive_term_command(name, date_from, date_to):
+    """Move a closed term's attendance records into a compressed archive that reports still read"""
+    from archive import archive_term
+
+    try:
+        term = archive_term(name, _parse_date(date_from), _parse_date(date_to))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Archived {term['rows']} records of {name} to {term['file']}")
+
+@bp.cli.command('partition-attendance')
+@click.option('--months-ahead', default=3, show_default=True, help='Future monthly partitions to create')
+@untimed
+def partition_attendance_command(months_ahead):
+    """Convert attendance_records to a PostgreSQL table partitioned by month"""
+    from partitions import convert_to_partitioned
+
+    try:
+        moved, created = convert_to_partitioned(months_ahead)
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Moved {moved} records into {len(created)} monthly partitions")
+
+@bp.cli.command('ensure-partitions')
+@click.option('--months-ahead', default=3, show_default=True, help='Future monthly partitions to create')
+@untimed
+def ensure_partitions_command(months_ahead):
+    """Create upcoming monthly attendance partitions (run from cron)"""
+    from partitions import ensure_future_partitions
+
+    try:
+        created = ensure_future_partitions(months_ahead)
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Created {', '.join(created)}" if created else "All partitions already exist")
@@ -0,0 +1,264 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from flask_sqlalchemy.session import Session
+
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL")
+REPLICA_BIND = 'replica'
+# How often a replica that failed, or has not been checked yet, is probed
+REPLICA_CHECK_INTERVAL = 5
+# Scan ingest and roster import upsert with INSERT ... ON CONFLICT
+SUPPORTED_BACKENDS = ('postgresql', 'sqlite')
+
+# Pool defaults per role: scans want a short checkout timeout, reports tolerate
+# waiting and run long queries. The primary also serves filters, downloads,
+# report jobs and CLI commands, so it has no statement timeout of its own;
+# scans cap theirs with limit_statement_time, and long-running commands lift
+# any configured one with lift_statement_timeout
+POOL_DEFAULTS = {
+    'DB': {'POOL_SIZE': 10, 'MAX_OVERFLOW': 10, 'POOL_TIMEOUT': 5, 'STATEMENT_TIMEOUT_MS': 0},
+    'DB_READ': {'POOL_SIZE': 5, 'MAX_OVERFLOW': 5, 'POOL_TIMEOUT': 30, 'STATEMENT_TIMEOUT_MS': 60000},
+}
+
+_reading = ContextVar('reading_from_replica', default=False)
+
+class PoolWaitStats:
+    """Checkout wait counters for one pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            # Anything over a millisecond had to wait for a connection or open one
+            self.waited += seconds > 0.001
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'waited': self.waited,
+                'timeouts': self.timeouts,
+                'wait_total_ms': round(self.wait_total * 1000, 1),
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                'wait_max_ms': round(self.wait_max * 1000, 1)
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # Keep counting across pool resets (dispose, invalidation)
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+def _env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+# Cap on each statement of a scan's transaction, so a stuck query fails the scan fast
+SCAN_STATEMENT_TIMEOUT_MS = _env_int('SCAN_STATEMENT_TIMEOUT_MS', 5000)
+
+def limit_statement_time(session, timeout_ms=SCAN_STATEMENT_TIMEOUT_MS):
+    """Cap statements for the rest of the session's current transaction with SET LOCAL.
+
+    Only PostgreSQL has a statement timeout; elsewhere this does nothing.
+    """
+    if timeout_ms and session.get_bind().dialect.name == 'postgresql':
+        session.execute(text(f'SET LOCAL statement_timeout = {int(timeout_ms)}'))
+
+def engine_options(url, prefix='DB'):
+    """Engine options for a role, read from <prefix>_POOL_SIZE, <prefix>_MAX_OVERFLOW,
+    <prefix>_POOL_TIMEOUT and <prefix>_STATEMENT_TIMEOUT_MS.
+
+    PostgreSQL gets a server-side statement_timeout per connection, unless
+    the setting is 0. SQLite
+    has no statement timeout, so its pool timeout doubles as the busy
+    timeout, and in-memory databases keep SQLAlchemy's default pool. Other
+    databases are rejected here rather than on the first scan.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unsupported database {parsed.get_backend_name()!r} in {prefix}: "
+                         f"use one of {', '.join(SUPPORTED_BACKENDS)}")
+    defaults = POOL_DEFAULTS[prefix]
+    options = {
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return options
+
+    pool_timeout = _env_int(f'{prefix}_POOL_TIMEOUT', defaults['POOL_TIMEOUT'])
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=_env_int(f'{prefix}_POOL_SIZE', defaults['POOL_SIZE']),
+        max_overflow=_env_int(f'{prefix}_MAX_OVERFLOW', defaults['MAX_OVERFLOW']),
+        pool_timeout=pool_timeout,
+    )
+    timeout_ms = _env_int(f'{prefix}_STATEMENT_TIMEOUT_MS', defaults['STATEMENT_TIMEOUT_MS'])
+    if parsed.get_backend_name() == 'postgresql' and timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout_ms}'}
+    elif parsed.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': pool_timeout}
+    return options
+
+def lift_statement_timeout(engine):
+    """Let every statement on engine run to completion, for CLI commands that
+    import, rebuild or archive.
+
+    New connections reset statement_timeout as they connect, and pooled ones
+    are discarded so none keeps the configured timeout. Only PostgreSQL has
+    a statement timeout; elsewhere this does nothing.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _without_statement_timeout(dbapi_connection, connection_record):
+        # Outside a transaction, so a later rollback does not restore the timeout
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET statement_timeout = 0')
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+    engine.dispose()
+
+def is_connection_error(error):
+    """Whether error means the database could not be reached, rather than a statement failing"""
+    if isinstance(error, (exc.OperationalError, exc.TimeoutError)):
+        return True
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+class ReplicaHealth:
+    """Whether the replica may be used, probed at most every REPLICA_CHECK_INTERVAL.
+
+    A failed probe, or a disconnect seen by any replica query, sends reads
+    to the primary until the next successful probe.
+    """
+
+    def __init__(self, check_interval=REPLICA_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.healthy = False
+        self.fallbacks = 0
+        self.last_error = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def usable(self, engine):
+        now = time.monotonic()
+        if self._checked_at is not None and (self.healthy or now - self._checked_at < self.check_interval):
+            return self.healthy
+        with self._lock:
+            if self._checked_at is None or (not self.healthy and now - self._checked_at >= self.check_interval):
+                self._checked_at = now
+                try:
+                    with engine.connect() as connection:
+                        connection.exec_driver_sql('SELECT 1')
+                    if not self.healthy:
+                        logging.info("Read replica is available")
+                    self.healthy = True
+                except Exception as e:
+                    self.mark_down(e)
+        return self.healthy
+
+    def fell_back(self):
+        """Count a read that used the primary because the replica was down"""
+        with self._lock:
+            self.fallbacks += 1
+
+    def mark_down(self, error):
+        if self.healthy or self.last_error is None:
+            logging.warning(f"Read replica unavailable, reading from the primary: {error}")
+        self.healthy = False
+        self.last_error = str(error)
+        self._checked_at = time.monotonic()
+
+    def stats(self):
+        return {'healthy': self.healthy, 'fallbacks': self.fallbacks, 'last_error': self.last_error}
+
+replica_health = ReplicaHealth()
+
+def watch_replica(engine):
+    """Mark the replica down as soon as one of its connections is found dead"""
+    @event.listens_for(engine, 'handle_error')
+    def _on_replica_error(context):
+        if context.is_disconnect:
+            replica_health.mark_down(context.original_exception)
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica inside read_replica scopes.
+
+    Writes, and everything outside a read scope, use the primary. Without
+    a configured replica, or while it is down, reads use the primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _reading.get() and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if replica_health.usable(replica):
+                    return replica
+                replica_health.fell_back()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@contextmanager
+def reading_from_replica():
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+def read_replica(view):
+    """Run a read-only view against the read replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with reading_from_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+def pool_stats(engines):
+    """Pool occupancy and checkout waits for every engine, keyed by bind name"""
+    stats = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        entry = {'url': engine.url.render_as_string(hide_password=True), 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        if isinstance(pool, TimedQueuePool):
+            entry['checkout_wait'] = pool.wait_stats.snapshot()
+        stats[key or 'primary'] = entry
+    return stats
@@ -0,0 +1,86 @@
+import io
+import os
+import csv
+import json
+import zlib
+from itertools import islice
+
+# Row shape of the 'export' projection and archived_rows, as CSV header and NDJSON keys
+EXPORT_COLUMNS = ('name', 'roll_number', 'session', 'campus', 'course', 'scan_date', 'scan_time', 'location', 'status')
+
+# Streamed formats: mimetype and file extension
+STREAM_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Rows fetched from the cursor and encoded per response chunk
+EXPORT_BATCH_SIZE = 5000
+# zlib level for gzipped exports; 1 is fastest, 9 smallest
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 5))
+
+def row_batches(rows, size=EXPORT_BATCH_SIZE):
+    """Group an iterable of rows into lists of up to size rows"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def formatted_rows(batch):
+    """Export rows with scan_date as YYYY-MM-DD and scan_time as HH:MM:SS.
+
+    Live and archived rows both carry date and time objects; formatting
+    them here, rather than casting in SQL, gives the same text on every
+    database and drops the microseconds an archived scan_time may have.
+    """
+    return [(name, roll_number, session, campus, course, scan_date.isoformat(),
+             scan_time.isoformat(timespec='seconds'), location, status)
+            for name, roll_number, session, campus, course, scan_date, scan_time, location, status in batch]
+
+def csv_chunks(batches):
+    """Encode batches of export rows as CSV, one bytes chunk per batch, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def ndjson_chunks(batches):
+    """Encode batches of export rows as newline-delimited JSON objects, one bytes chunk per batch.
+
+    Each line is filled into a template rather than built as a dict and
+    serialised: only the string columns go through the JSON encoder, and
+    scan_date and scan_time, already formatted by formatted_rows, are
+    written as they are.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for batch in batches:
+        yield ''.join([
+            f'{{"name":{encode(name)},"roll_number":{encode(roll_number)},"session":{encode(session)},'
+            f'"campus":{encode(campus)},"course":{encode(course)},"scan_date":"{scan_date}",'
+            f'"scan_time":"{scan_time}","location":{encode(location)},"status":{encode(status)}}}\n'
+            for name, roll_number, session, campus, course, scan_date, scan_time, location, status in batch
+        ]).encode()
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    """Compress a stream of bytes chunks into one gzip member without buffering the whole stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+ENCODERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks}
+
+def export_chunks(batches, export_format, compress=False):
+    """Response body for a streamed export of batches of 'export' projection rows"""
+    chunks = ENCODERS[export_format](map(formatted_rows, batches))
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,45 @@
+"""Gunicorn settings, read automatically from the working directory.
+
+The app is imported once in the master (preload_app) and forked into the
+workers, so a worker restart skips importing Flask, SQLAlchemy and the
+routes. The database is initialised once in the master before any worker
+starts; workers only start their own background services after the fork.
+"""
+import os
+import logging
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Create tables and default data in the master; set to 0 when a deploy step
+# runs flask init-db and flask seed instead
+INIT_DB_ON_START = os.environ.get("INIT_DB_ON_START", "1") == "1"
+
+def on_starting(server):
+    if not INIT_DB_ON_START:
+        return
+    from main import app
+    from app import db, init_database
+    from commands import create_default_data
+    try:
+        with app.app_context():
+            init_database()
+            create_default_data()
+            # Connections opened here must not be shared with forked workers
+            for engine in db.engines.values():
+                engine.dispose()
+    except Exception as e:
+        # Workers still boot; requests fail until the database is reachable
+        logging.error(f"Database initialisation error: {e}")
+
+def post_worker_init(worker):
+    from app import db, start_services
+    from live import limit_subscribers_to_threads
+    app = worker.wsgi
+    # Thread-per-request workers would run out of threads for scans to open live feeds
+    if worker.cfg.worker_class_str in ('sync', 'gthread'):
+        limit_subscribers_to_threads(worker.cfg.threads)
+    with app.app_context():
+        # Drop any pooled connections inherited from the master without closing them under it
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    start_services(app)
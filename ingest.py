@@ -0,0 +1,207 @@
+import logging
+from app import db
+from models import AttendanceRecord, DailyAttendanceRollup
+from cache import student_cache, scan_index
+from live import publish_scans, scan_event
+from utils import parse_scans, institution_today
+from attendance_status import classify_scan, OUTSIDE_SESSION, OUTSIDE_SESSION_MESSAGE
+from log_events import log_event
+from db_engines import limit_statement_time, SUPPORTED_BACKENDS
+
+MAX_BATCH_SIZE = 5000
+ROLLUP_STATUSES = ('present', 'late', 'absent')
+
+def dialect_insert(table):
+    """Return an INSERT construct supporting ON CONFLICT for the active database;
+    engine_options rejects any other database at startup"""
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Unsupported database {dialect_name!r}: use one of {', '.join(SUPPORTED_BACKENDS)}")
+    return insert(table)
+
+def insert_attendance_ignore_duplicates(rows):
+    """Insert attendance rows in one statement, skipping rows that violate
+    unique_student_daily_attendance. Returns the (student_id, scan_date) keys inserted."""
+    if not rows:
+        return set()
+
+    stmt = dialect_insert(AttendanceRecord.__table__)\
+        .on_conflict_do_nothing(index_elements=['student_id', 'scan_date'])\
+        .returning(AttendanceRecord.student_id, AttendanceRecord.scan_date)
+    result = db.session.execute(stmt, rows)
+    return {(row.student_id, row.scan_date) for row in result}
+
+def record_rollup_counts(counts):
+    """Add per-group status counts to the daily rollups in the current transaction.
+
+    counts maps (scan_date, session, campus, course) to a {status: n} dict.
+    """
+    if not counts:
+        return
+
+    rows = []
+    for (scan_date, session, campus, course), statuses in counts.items():
+        rows.append({
+            'scan_date': scan_date,
+            'session': session,
+            'campus': campus,
+            'course': course,
+            'present': statuses.get('present', 0),
+            'late': statuses.get('late', 0),
+            'absent': statuses.get('absent', 0)
+        })
+
+    table = DailyAttendanceRollup.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['scan_date', 'session', 'campus', 'course'],
+        set_={status: table.c[status] + stmt.excluded[status] for status in ROLLUP_STATUSES}
+    )
+    db.session.execute(stmt, rows)
+
+def fetch_existing_scan_times(keys):
+    """Look up scan times already stored for a set of (student_id, scan_date) keys"""
+    if not keys:
+        return {}
+
+    student_ids = {student_id for student_id, _ in keys}
+    scan_dates = {scan_date for _, scan_date in keys}
+    rows = db.session.query(
+        AttendanceRecord.student_id, AttendanceRecord.scan_date, AttendanceRecord.scan_time
+    ).filter(
+        AttendanceRecord.student_id.in_(student_ids),
+        AttendanceRecord.scan_date.in_(scan_dates)
+    ).all()
+    return {(row.student_id, row.scan_date): row.scan_time for row in rows if (row.student_id, row.scan_date) in keys}
+
+def ingest_scan_batch(payloads):
+    """Record a batch of biometric scans in a single transaction.
+
+    Malformed items are marked invalid without failing the others, card IDs
+    are resolved with one query, duplicates are removed within the batch and
+    against the database with one insert-or-ignore statement, and per-item
+    results are returned in input order.
+    """
+    return ingest_scans(parse_scans(payloads))
+
+def ingest_scans(scans):
+    """Record scans already parsed with parse_scan, as ingest_scan_batch does;
+    None entries are the payloads that failed to parse"""
+    results = [None] * len(scans)
+    parsed = []
+
+    # Validate each scan on its own; a malformed one is marked invalid and the rest go ahead
+    for index, scan in enumerate(scans):
+        if scan is None:
+            results[index] = {'success': False, 'invalid': True, 'message': 'Invalid biometric data format'}
+            continue
+        parsed.append((index, scan))
+
+    # Keep a stuck statement from holding the scanners' batch
+    limit_statement_time(db.session)
+
+    # Resolve all card IDs through the cache with at most one query
+    card_ids = {scan.card_id for _, scan in parsed}
+    students = student_cache.get_many(card_ids) if card_ids else {}
+
+    # Keep the earliest scan per student per day
+    winners = {}
+    accepted = []
+    for index, scan in parsed:
+        student = students.get(scan.card_id)
+        if not student:
+            log_event('scan.unknown_card', logging.WARNING, card_id=scan.card_id)
+            results[index] = {'success': False, 'message': 'Student not found'}
+            continue
+        key = (student.id, scan.scan_date)
+        accepted.append((index, scan, student, key))
+        if key not in winners or scan.scan_datetime < winners[key][1].scan_datetime:
+            winners[key] = (index, scan, student)
+
+    # Swipes already answered from the in-memory day index skip the insert
+    existing = {}
+    for key in winners:
+        previous_time = scan_index.lookup(*key)
+        if previous_time is not None:
+            existing[key] = previous_time
+
+    rows = []
+    statuses = {}
+    outside = set()
+    for index, scan, student in sorted(winners.values(), key=lambda winner: winner[0]):
+        key = (student.id, scan.scan_date)
+        if key in existing:
+            continue
+        status = classify_scan(student.session, scan.scan_time)
+        if status == OUTSIDE_SESSION:
+            log_event('scan.outside_session', logging.WARNING, roll_number=student.roll_number,
+                      session=student.session, scan_date=scan.scan_date, scan_time=scan.scan_time)
+            outside.add(key)
+            continue
+        statuses[key] = status
+        rows.append({
+            'student_id': student.id,
+            'card_id': scan.card_id,
+            'scan_datetime': scan.scan_datetime,
+            'scan_date': scan.scan_date,
+            'scan_time': scan.scan_time,
+            'location': scan.location,
+            'scanner_id': scan.scanner_id,
+            'status': status
+        })
+
+    inserted = insert_attendance_ignore_duplicates(rows)
+    existing.update(fetch_existing_scan_times(set(winners) - inserted - set(existing)))
+
+    rollup_counts = {}
+    for key in inserted:
+        student = winners[key][2]
+        group = (key[1], student.session, student.campus, student.course)
+        counts = rollup_counts.setdefault(group, {})
+        counts[statuses[key]] = counts.get(statuses[key], 0) + 1
+    record_rollup_counts(rollup_counts)
+    db.session.commit()
+
+    for key, previous_time in existing.items():
+        scan_index.record(*key, previous_time)
+    for key in inserted:
+        scan_index.record(*key, winners[key][1].scan_time)
+
+    today = institution_today()
+    publish_scans([
+        scan_event(student, scan.scan_datetime, scan.location, today, statuses[(student.id, scan.scan_date)])
+        for index, scan, student in sorted(winners.values(), key=lambda winner: winner[0])
+        if (student.id, scan.scan_date) in inserted
+    ])
+
+    # Build per-item results
+    for index, scan, student, key in accepted:
+        winner_index, winner_scan, _ = winners[key]
+        if key in inserted and index == winner_index:
+            results[index] = {
+                'success': True,
+                'message': 'Attendance recorded successfully',
+                'student_name': student.name,
+                'roll_number': student.roll_number,
+                'scan_time': scan.scan_time.strftime('%H:%M:%S'),
+                'status': statuses[key]
+            }
+            continue
+        if key in outside and key not in existing:
+            results[index] = {'success': False, 'message': OUTSIDE_SESSION_MESSAGE}
+            continue
+        previous_time = existing[key] if key in existing else winner_scan.scan_time
+        results[index] = {
+            'success': True,
+            'message': 'Attendance already recorded',
+            'duplicate': True,
+            'student_name': student.name,
+            'previous_time': previous_time.strftime('%H:%M:%S')
+        }
+
+    log_event('scan.batch', scans=len(scans), recorded=len(inserted))
+    return results
@@ -0,0 +1,212 @@
+import os
+import json
+import queue
+import logging
+import threading
+import time
+
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "100"))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_MAX_SUBSCRIBERS", "500"))
+# A live-feed client holds a request thread for as long as it stays connected,
+# so a threaded worker gives the feed at most one in this many of its threads
+LIVE_THREAD_SHARE = int(os.environ.get("LIVE_THREAD_SHARE", "4"))
+# Shared file bus is truncated once it grows past this size
+LIVE_BUS_MAX_BYTES = 64 * 1024 * 1024
+# Events meant for other workers' listeners, never sent to live-feed clients
+INTERNAL_EVENT_TYPES = ('students.changed', 'responses.changed')
+
+class Subscriber:
+    """One live-feed client with a bounded event queue"""
+
+    def __init__(self, maxsize=LIVE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A slow client drops events and is told to resynchronise instead
+            self.overflowed = True
+
+    def next_event(self, timeout):
+        """Return the next event, a resync marker after an overflow, or None on timeout"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            return {'type': 'resync'}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class Broadcaster:
+    """Fans events out from this process to live-feed subscribers and in-process listeners"""
+
+    def __init__(self, max_subscribers=LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a new subscriber, or return None when the limit is reached"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber()
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def add_listener(self, callback):
+        """Call callback(event) for every event delivered to this process"""
+        self._listeners.append(callback)
+
+    def deliver(self, event):
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Live event listener error: {e}")
+        if event.get('type') in INTERNAL_EVENT_TYPES:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+class LocalBus:
+    """Single-process bus: events go straight to this process's broadcaster"""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.broadcaster.deliver(event)
+
+class FileBus:
+    """Multi-worker stand-in for a pub/sub server.
+
+    Every worker appends events as JSON lines to one shared file and runs a
+    tailer thread that delivers lines written by any worker to its own
+    broadcaster. Suitable for several workers on one host.
+    """
+
+    def __init__(self, broadcaster, path, poll_interval=0.05):
+        self.broadcaster = broadcaster
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads and descriptors do not survive a fork, so start once per process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            threading.Thread(target=self._tail, name='live-bus-tailer', daemon=True).start()
+
+    def start(self):
+        self._ensure_started()
+
+    def publish(self, event):
+        self._ensure_started()
+        line = (json.dumps(event) + '\n').encode()
+        # A single O_APPEND write keeps lines from different workers intact
+        os.write(self._fd, line)
+        if os.fstat(self._fd).st_size > LIVE_BUS_MAX_BYTES:
+            os.truncate(self.path, 0)
+
+    def _tail(self):
+        while True:
+            try:
+                self._follow()
+            except OSError as e:
+                logging.error(f"Live bus tailer error: {e}")
+                time.sleep(1)
+
+    def _follow(self):
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pending = b''
+            while True:
+                chunk = f.readline()
+                if not chunk:
+                    if os.path.getsize(self.path) < f.tell():
+                        f.seek(0)
+                        pending = b''
+                    time.sleep(self.poll_interval)
+                    continue
+                pending += chunk
+                if not pending.endswith(b'\n'):
+                    continue
+                try:
+                    self.broadcaster.deliver(json.loads(pending))
+                except ValueError:
+                    logging.warning("Skipping malformed live bus line")
+                pending = b''
+
+def make_bus(broadcaster, spec):
+    """Build the bus named by LIVE_BUS: unset for in-process, or file:<path>"""
+    if spec and spec.startswith('file:'):
+        return FileBus(broadcaster, spec[len('file:'):])
+    return LocalBus(broadcaster)
+
+broadcaster = Broadcaster()
+bus = make_bus(broadcaster, os.environ.get("LIVE_BUS"))
+
+def limit_subscribers_to_threads(threads):
+    """Cap live-feed clients so a threaded worker keeps most of its threads for scans.
+
+    With 16 threads that is 4 clients; further dashboards get a 503 and
+    fall back to polling. A single-threaded worker serves no live feed.
+    """
+    broadcaster.max_subscribers = min(LIVE_MAX_SUBSCRIBERS, threads // LIVE_THREAD_SHARE)
+
+def publish_event(event):
+    """Publish one event to every worker; never raises"""
+    try:
+        bus.publish(event)
+    except Exception as e:
+        logging.error(f"Live publish error: {e}")
+
+def publish_scans(events):
+    """Publish committed scans to the live feed; never raises"""
+    for event in events:
+        publish_event(event)
+
+def scan_event(student, scan_datetime, location, today, status='present'):
+    """Build the live-feed event for a newly recorded scan"""
+    scan_date = scan_datetime.date()
+    return {
+        'type': 'scan',
+        'student_id': student.id,
+        'name': student.name,
+        'roll_number': student.roll_number,
+        'session': student.session,
+        'campus': student.campus,
+        'course': student.course,
+        'scan_date': scan_date.isoformat(),
+        'scan_time': scan_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'location': location,
+        'status': status,
+        'delta': {'today_attendance': 1 if scan_date == today else 0}
+    }
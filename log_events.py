@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "attendance.scan=WARNING,sqlalchemy.engine=INFO"
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+# json for log shippers, text for reading in a terminal
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Also write to this file (reopened after rotation); stderr otherwise
+LOG_FILE = os.environ.get("LOG_FILE")
+# Fraction of each high-volume event kept, e.g. "scan.duplicate=0.1,scan.recorded=0.25"
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+# Records waiting for the writer thread; beyond this they are dropped, not waited for
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+EVENT_LOGGER_PREFIX = 'attendance'
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in value.split(','):
+        name, sep, setting = item.partition('=')
+        if sep and name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+SAMPLE_RATES = {name: float(rate) for name, rate in _parse_pairs(LOG_SAMPLE_RATES).items()}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, then the event fields or message"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+            entry.update(record.fields)
+        else:
+            entry['message'] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class EventMessage:
+    """Message of a structured event, rendered as "event key=value ..." only when a text formatter asks"""
+    __slots__ = ('event', 'fields')
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join([self.event] + [f'{key}={value}' for key, value in self.fields.items()])
+
+class BackgroundQueueHandler(QueueHandler):
+    """QueueHandler that hands records to a writer thread without ever blocking.
+
+    Formatting happens on the writer thread. The queue and thread do not
+    survive a fork, so each process gets its own after forking. When the
+    writer falls behind by LOG_QUEUE_SIZE records, new records are dropped
+    and counted rather than stalling the request that logged them.
+    """
+
+    def __init__(self, targets, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = targets
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+
+    def start(self):
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def restart_after_fork(self):
+        # The parent's writer thread does not exist here and its queue may hold a locked mutex
+        self.queue = queue.Queue(self.maxsize)
+        self.dropped = 0
+        self.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Keep the record unformatted; only a traceback is rendered now, while its frames exist
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'dropped': self.dropped}
+
+_handler = None
+_event_loggers = {}
+
+def configure_logging():
+    """Route all logging through one background writer, once per process tree.
+
+    Sets the root level from LOG_LEVEL and per-logger levels from
+    LOG_LEVELS. Handlers already on the root logger are replaced.
+    """
+    global _handler
+    if _handler is not None:
+        return _handler
+
+    target = WatchedFileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+
+    _handler = BackgroundQueueHandler([target])
+    _handler.start()
+    os.register_at_fork(after_in_child=_handler.restart_after_fork)
+    atexit.register(_handler.stop)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    return _handler
+
+def log_stats():
+    """Depth of this process's log queue and records dropped because it was full"""
+    return _handler.stats() if _handler is not None else {'queued': 0, 'dropped': 0}
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log a structured event such as 'scan.recorded' with keyword fields.
+
+    Events go to the logger attendance.<category>, so LOG_LEVELS can quiet
+    a whole category. Events listed in LOG_SAMPLE_RATES are kept at that
+    rate and carry a sample_rate field so counts can be scaled back up.
+    Nothing is formatted unless the event is kept.
+    """
+    category = event.partition('.')[0]
+    logger = _event_loggers.get(category)
+    if logger is None:
+        logger = _event_loggers[category] = logging.getLogger(f'{EVENT_LOGGER_PREFIX}.{category}')
+    if not logger.isEnabledFor(level):
+        return
+    rate = SAMPLE_RATES.get(event)
+    if rate is not None and rate < 1:
+        if random.random() >= rate:
+            return
+        fields['sample_rate'] = rate
+    logger.log(level, EventMessage(event, fields), extra={'event': event, 'fields': fields})
@@ -1,5 +1,13 @@
-from app import app
-import routes  # noqa: F401
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
+    # The development server initialises its own database; deployments run
+    # flask init-db and flask seed, or let gunicorn.conf.py do it once
+    from app import init_database
+    from commands import create_default_data
+    with app.app_context():
+        init_database()
+        create_default_data()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-worker snapshots are merged from here when set, so any gunicorn worker
+# can answer a scrape for all of them
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_MAX_CHARS = 500
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Queries outside any request (journal drain, report jobs, CLI)
+BACKGROUND = 'background'
+# Server-Sent Event feeds stay open for hours, so they are left out of the
+# in-flight gauge and the latency histograms
+STREAMING_ENDPOINTS = ('main.live_stream',)
+
+_request_db = ContextVar('request_db', default=None)
+
+class Histogram:
+    """Cumulative-on-export bucket counts plus sum and count"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+    def merge(self, data):
+        self.counts = [a + b for a, b in zip(self.counts, data['counts'])]
+        self.sum += data['sum']
+        self.count += data['count']
+
+class Metrics:
+    """Request and SQL counters for this process.
+
+    Updates take one lock and touch a few dict entries, so the cost per
+    request is a few microseconds. Everything is keyed by Flask endpoint
+    name, which keeps label cardinality bounded by the route table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}          # (endpoint, method, status) -> count
+        self.errors = {}            # endpoint -> count
+        self.in_flight = {}         # endpoint -> gauge
+        self.latency = {}           # endpoint -> Histogram (seconds)
+        self.db_time = {}           # endpoint -> Histogram (seconds per request)
+        self.db_queries = {}        # endpoint -> Histogram (queries per request)
+        self.queries = {}           # endpoint -> count, including background work
+        self.slow_queries = 0
+        self._flusher_pid = None
+
+    def _histogram(self, table, key, buckets):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def request_started(self, endpoint):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def request_finished(self, endpoint, method, status, seconds, queries, db_seconds, failed):
+        with self._lock:
+            self.in_flight[endpoint] -= 1
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if failed:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            self._histogram(self.latency, endpoint, LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.db_queries, endpoint, QUERY_COUNT_BUCKETS).observe(queries)
+            self._histogram(self.db_time, endpoint, LATENCY_BUCKETS).observe(db_seconds)
+
+    def query(self, endpoint, slow):
+        with self._lock:
+            self.queries[endpoint] = self.queries.get(endpoint, 0) + 1
+            self.slow_queries += slow
+
+    # Multi-worker aggregation
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': [[*key, value] for key, value in self.requests.items()],
+                'errors': dict(self.errors),
+                'in_flight': dict(self.in_flight),
+                'latency': {key: value.to_dict() for key, value in self.latency.items()},
+                'db_time': {key: value.to_dict() for key, value in self.db_time.items()},
+                'db_queries': {key: value.to_dict() for key, value in self.db_queries.items()},
+                'queries': dict(self.queries),
+                'slow_queries': self.slow_queries
+            }
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if not METRICS_DIR or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Metrics flush error: {e}")
+            time.sleep(METRICS_FLUSH_INTERVAL)
+
+    def flush(self):
+        path = os.path.join(METRICS_DIR, f'worker-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """This worker's snapshot merged with live workers' latest flushed ones"""
+        merged = Metrics()
+        snapshots = [self.snapshot()]
+        if METRICS_DIR:
+            for name in os.listdir(METRICS_DIR):
+                if not name.startswith('worker-') or not name.endswith('.json'):
+                    continue
+                pid = int(name[len('worker-'):-len('.json')])
+                if pid == os.getpid():
+                    continue
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    os.remove(os.path.join(METRICS_DIR, name))
+                    continue
+                except PermissionError:
+                    pass
+                try:
+                    with open(os.path.join(METRICS_DIR, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        for snapshot in snapshots:
+            for endpoint, method, status, value in snapshot['requests']:
+                key = (endpoint, method, status)
+                merged.requests[key] = merged.requests.get(key, 0) + value
+            for table in ('errors', 'in_flight', 'queries'):
+                target = getattr(merged, table)
+                for key, value in snapshot[table].items():
+                    target[key] = target.get(key, 0) + value
+            for table, buckets in (('latency', LATENCY_BUCKETS), ('db_time', LATENCY_BUCKETS),
+                                   ('db_queries', QUERY_COUNT_BUCKETS)):
+                for key, value in snapshot[table].items():
+                    merged._histogram(getattr(merged, table), key, buckets).merge(value)
+            merged.slow_queries += snapshot['slow_queries']
+        return merged
+
+metrics = Metrics()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _histogram_lines(lines, name, help_text, table):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for endpoint, histogram in sorted(table.items()):
+        label = f'endpoint="{_escape(endpoint)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{label}}} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+def render_prometheus(extra=()):
+    """Render all workers' metrics in the Prometheus text exposition format.
+
+    extra is an iterable of (name, type, help, {labels tuple: value}) for
+    values owned by other modules, such as pool occupancy; they are read
+    from this worker only.
+    """
+    merged = metrics.collect()
+    lines = [
+        '# HELP attendance_http_requests_total Requests handled, by endpoint, method and status',
+        '# TYPE attendance_http_requests_total counter'
+    ]
+    for (endpoint, method, status), value in sorted(merged.requests.items()):
+        lines.append(f'attendance_http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status}"}} {value}')
+
+    lines += ['# HELP attendance_http_errors_total Requests that failed with a 5xx or logged an error',
+              '# TYPE attendance_http_errors_total counter']
+    lines += [f'attendance_http_errors_total{{endpoint="{_escape(key)}"}} {value}' for key, value in sorted(merged.errors.items())]
+
+    lines += ['# HELP attendance_http_in_flight Requests currently being handled',
+              '# TYPE attendance_http_in_flight gauge']
+    lines += [f'attendance_http_in_flight{{endpoint="{_escape(key)}"}} {value}' for key, value in sorted(merged.in_flight.items())]
+
+    _histogram_lines(lines, 'attendance_http_request_duration_seconds', 'Request latency', merged.latency)
+    _histogram_lines(lines, 'attendance_db_time_per_request_seconds', 'Time spent in SQL per request', merged.db_time)
+    _histogram_lines(lines, 'attendance_db_queries_per_request', 'SQL statements per request', merged.db_queries)
+
+    lines += ['# HELP attendance_db_queries_total SQL statements executed, by endpoint or background',
+              '# TYPE attendance_db_queries_total counter']
+    lines += [f'attendance_db_queries_total{{endpoint="{_escape(key)}"}} {value}' for key, value in sorted(merged.queries.items())]
+    lines += ['# HELP attendance_db_slow_queries_total Statements slower than SLOW_QUERY_MS',
+              '# TYPE attendance_db_slow_queries_total counter',
+              f'attendance_db_slow_queries_total {merged.slow_queries}']
+
+    for name, metric_type, help_text, values in extra:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+        for labels, value in sorted(values.items()):
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+# SQL accounting
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    current = _request_db.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    metrics.query(current[2] if current is not None else BACKGROUND, slow)
+    if slow:
+        logging.warning(f"Slow query ({elapsed * 1000:.0f}ms, {conn.engine.url.database}): "
+                        f"{' '.join(statement.split())[:SLOW_QUERY_MAX_CHARS]}")
+
+@event.listens_for(Engine, 'handle_error')
+def _on_query_error(context):
+    # after_cursor_execute does not run for a failed statement
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+# Request hooks
+
+class _ErrorCounter(logging.Handler):
+    """Count errors the views log and swallow: they answer 200 with success False"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        if has_request_context():
+            request.environ['metrics.failed'] = True
+
+def init_metrics(app):
+    """Instrument every view of app and count errors logged while handling them"""
+    # The root logger outlives the app; a second app must not count each error twice
+    root = logging.getLogger()
+    if not any(isinstance(handler, _ErrorCounter) for handler in root.handlers):
+        root.addHandler(_ErrorCounter())
+
+    @app.before_request
+    def _start_timer():
+        metrics._ensure_flusher()
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint in STREAMING_ENDPOINTS:
+            return
+        request.environ['metrics.started'] = time.perf_counter()
+        request.environ['metrics.db'] = [0, 0.0, endpoint]
+        request.environ['metrics.token'] = _request_db.set(request.environ['metrics.db'])
+        metrics.request_started(endpoint)
+
+    @app.after_request
+    def _record_status(response):
+        request.environ['metrics.status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_timer(error=None):
+        started = request.environ.pop('metrics.started', None)
+        if started is None:
+            return
+        queries, db_seconds, endpoint = request.environ.pop('metrics.db')
+        status = 500 if error is not None else request.environ.get('metrics.status', 500)
+        failed = status >= 500 or request.environ.get('metrics.failed', False)
+        metrics.request_finished(endpoint, request.method, status, time.perf_counter() - started,
+                                 queries, db_seconds, failed)
+        try:
+            _request_db.reset(request.environ.pop('metrics.token'))
+        except ValueError:
+            # Streamed responses finish in a different context
+            _request_db.set(None)
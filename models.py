@@ -45,6 +45,13 @@ class Student(db.Model):
     # Relationship with attendance records
     attendance_records = db.relationship('AttendanceRecord', backref='student', lazy=True)
     
+    __table_args__ = (
+        # Report filters narrow by session/campus/course
+        db.Index('ix_students_session_campus_course', 'session', 'campus', 'course'),
+        # Covers the active-card lookup on the scan path
+        db.Index('ix_students_card_id_active', 'card_id', 'is_active'),
+    )
+    
     def __init__(self, roll_number=None, card_id=None, name=None, session=None, campus=None, course=None, year=1, **kwargs):
         super().__init__(**kwargs)
         if roll_number:
@@ -76,8 +83,13 @@ class AttendanceRecord(db.Model):
     status = db.Column(db.String(20), default='present')  # present, late, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Ensure one record per student per day
-    __table_args__ = (db.UniqueConstraint('student_id', 'scan_date', name='unique_student_daily_attendance'),)
+    __table_args__ = (
+        # Ensure one record per student per day
+        db.UniqueConstraint('student_id', 'scan_date', name='unique_student_daily_attendance'),
+        # Date range filters and newest-first ordering
+        db.Index('ix_attendance_records_scan_date', 'scan_date'),
+        db.Index('ix_attendance_records_scan_datetime', 'scan_datetime', 'id'),
+    )
     
     def __init__(self, student_id=None, card_id=None, scan_datetime=None, scan_date=None, scan_time=None, location='Main Campus', scanner_id=None, status='present', **kwargs):
         super().__init__(**kwargs)
@@ -118,3 +130,37 @@ class AttendanceSession(db.Model):
             self.start_time = start_time
         if end_time:
             self.end_time = end_time
+
+class DailyAttendanceRollup(db.Model):
+    """Pre-aggregated daily attendance counts per session, campus and course"""
+    __tablename__ = 'daily_attendance_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scan_date = db.Column(db.Date, nullable=False)
+    session = db.Column(db.String(10), nullable=False)
+    campus = db.Column(db.String(10), nullable=False)
+    course = db.Column(db.String(20), nullable=False)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    
+    # One row per group per day
+    __table_args__ = (db.UniqueConstraint('scan_date', 'session', 'campus', 'course', name='unique_daily_rollup_group'),)
+
+class AcademicHoliday(db.Model):
+    """Non-working days excluded from attendance percentages"""
+    __tablename__ = 'academic_holidays'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    holiday_date = db.Column(db.Date, nullable=False, index=True)
+    session_code = db.Column(db.String(10))  # AN, FN, or NULL for the whole day
+    description = db.Column(db.String(120), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __init__(self, holiday_date=None, description=None, session_code=None, **kwargs):
+        super().__init__(**kwargs)
+        if holiday_date:
+            self.holiday_date = holiday_date
+        if description:
+            self.description = description
+        self.session_code = session_code
@@ -0,0 +1,148 @@
+import logging
+from datetime import date
+from sqlalchemy import text
+from app import db
+
+PARTITIONED_TABLE = 'attendance_records'
+DEFAULT_PARTITION = f'{PARTITIONED_TABLE}_default'
+
+def month_start(day):
+    return day.replace(day=1)
+
+def next_month(day):
+    return date(day.year + (day.month == 12), day.month % 12 + 1, 1)
+
+def partition_name(month):
+    return f'{PARTITIONED_TABLE}_y{month.year}m{month.month:02d}'
+
+def _require_postgresql(connection):
+    if connection.dialect.name != 'postgresql':
+        raise RuntimeError('Native partitioning needs PostgreSQL; use archive-term to keep SQLite tables small')
+
+def is_partitioned(connection):
+    """True once attendance_records has been converted to a partitioned table"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': PARTITIONED_TABLE}).first() is not None
+
+def existing_partitions(connection):
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"
+    ), {'table': PARTITIONED_TABLE})
+    return {name for name, in rows}
+
+def _create_month_partition(connection, month):
+    """Create the partition for month, moving any of its rows out of the default partition.
+
+    PostgreSQL refuses to attach a range the default partition already holds
+    rows for, so those rows are detached, copied into the new partition and
+    the default is reattached, all inside the caller's transaction.
+    """
+    name = partition_name(month)
+    bounds = {'start': month, 'end': next_month(month)}
+    stray = connection.execute(text(
+        f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE scan_date >= :start AND scan_date < :end"
+    ), bounds).scalar()
+    if stray:
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    if stray:
+        connection.execute(text(
+            f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE scan_date >= :start AND scan_date < :end"
+        ), bounds)
+        connection.execute(text(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE scan_date >= :start AND scan_date < :end"
+        ), bounds)
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+        logging.info(f"Moved {stray} rows from {DEFAULT_PARTITION} into {name}")
+    return name
+
+def ensure_partitions(connection, date_from, date_to):
+    """Create the monthly partitions covering date_from..date_to that do not exist yet"""
+    existing = existing_partitions(connection)
+    created = []
+    month = month_start(date_from)
+    while month <= date_to:
+        if partition_name(month) not in existing:
+            created.append(_create_month_partition(connection, month))
+        month = next_month(month)
+    return created
+
+def convert_to_partitioned(months_ahead=3):
+    """Rebuild attendance_records as a table range-partitioned by month on scan_date.
+
+    Runs in one transaction: the plain table is renamed, a partitioned table
+    with the same columns takes its name, monthly partitions are created
+    for every month with data plus months_ahead future months (and a default
+    partition for anything outside them), rows are copied across and the
+    id sequence is handed over before the old table is dropped. Unique
+    constraints on a partitioned table must include the partition key, so
+    the primary key becomes (id, scan_date); one-record-per-student-per-day
+    is already keyed on scan_date and is unchanged. Date-filtered queries
+    are pruned to the matching partitions by the planner.
+    """
+    from utils import institution_today
+
+    with db.engine.begin() as connection:
+        _require_postgresql(connection)
+        if is_partitioned(connection):
+            raise RuntimeError(f'{PARTITIONED_TABLE} is already partitioned')
+
+        first, last = connection.execute(text(f"SELECT min(scan_date), max(scan_date) FROM {PARTITIONED_TABLE}")).first()
+        today = institution_today()
+        first = first or today
+        last = max(last or today, today)
+        horizon = month_start(last)
+        for _ in range(months_ahead):
+            horizon = next_month(horizon)
+
+        old = f'{PARTITIONED_TABLE}_unpartitioned'
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {old}"))
+        connection.execute(text(
+            f"CREATE TABLE {PARTITIONED_TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (scan_date)"
+        ))
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} DEFAULT"))
+        created = ensure_partitions(connection, first, horizon)
+        moved = connection.execute(text(f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {old}")).rowcount
+        connection.execute(text(f"ALTER SEQUENCE {PARTITIONED_TABLE}_id_seq OWNED BY {PARTITIONED_TABLE}.id"))
+        connection.execute(text(f"DROP TABLE {old}"))
+
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ADD PRIMARY KEY (id, scan_date)"))
+        connection.execute(text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT unique_student_daily_attendance UNIQUE (student_id, scan_date)"
+        ))
+        connection.execute(text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ADD FOREIGN KEY (student_id) REFERENCES students (id)"
+        ))
+        connection.execute(text(f"CREATE INDEX ix_attendance_records_scan_date ON {PARTITIONED_TABLE} (scan_date)"))
+        connection.execute(text(
+            f"CREATE INDEX ix_attendance_records_scan_datetime ON {PARTITIONED_TABLE} (scan_datetime, id)"
+        ))
+
+    logging.info(f"Partitioned {PARTITIONED_TABLE}: {moved} rows across {len(created)} monthly partitions")
+    return moved, created
+
+def ensure_future_partitions(months_ahead=3):
+    """Create partitions for the current month and the next months_ahead months"""
+    from utils import institution_today
+
+    with db.engine.begin() as connection:
+        _require_postgresql(connection)
+        if not is_partitioned(connection):
+            raise RuntimeError(f'{PARTITIONED_TABLE} is not partitioned yet; run partition-attendance first')
+        start = month_start(institution_today())
+        end = start
+        for _ in range(months_ahead):
+            end = next_month(end)
+        created = ensure_partitions(connection, start, end)
+
+    if created:
+        logging.info(f"Created attendance partitions {', '.join(created)}")
+    return created
@@ -0,0 +1,150 @@
+import os
+import bisect
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, and_, or_, false
+from app import db
+from models import Student, AttendanceRecord, AttendanceSession, AcademicHoliday
+from utils import institution_today, INSTITUTION_TIMEZONE
+from archive import archived_rows
+from attendance_query import AttendanceFilters
+
+# Weekdays classes run on (Monday is 0); Sunday is off unless configured
+WORKING_WEEKDAYS = frozenset(int(day) for day in os.environ.get("WORKING_WEEKDAYS", "0,1,2,3,4,5").split(',') if day.strip())
+DEFAULTER_THRESHOLD = float(os.environ.get("DEFAULTER_THRESHOLD", "75"))
+ATTENDED_STATUSES = ('present', 'late')
+
+def working_days(date_from, date_to):
+    """Return {session_code: [working dates]} between two dates, inclusive.
+
+    A date is a working day for a session when it falls on a working
+    weekday, the session is active in attendance_sessions, and no holiday
+    covers either the whole day or that session.
+    """
+    codes = sorted(code for code, in db.session.query(AttendanceSession.session_code)
+                   .filter(AttendanceSession.is_active == True).distinct())  # noqa: E712
+
+    closed = {}
+    holidays = db.session.query(AcademicHoliday.holiday_date, AcademicHoliday.session_code)\
+        .filter(AcademicHoliday.holiday_date.between(date_from, date_to)).all()
+    for holiday_date, session_code in holidays:
+        closed.setdefault(holiday_date, set()).add(session_code)
+
+    days = {code: [] for code in codes}
+    day = date_from
+    while day <= date_to:
+        if day.weekday() in WORKING_WEEKDAYS:
+            off = closed.get(day, ())
+            if None not in off:
+                for code in codes:
+                    if code not in off:
+                        days[code].append(day)
+        day += timedelta(days=1)
+    return days
+
+def percentage_date_range(filters):
+    """Resolve the date range for a percentage report; date_to defaults to today and never passes it"""
+    if not filters.get('date_from'):
+        raise ValueError('date_from is required')
+    date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date()
+    today = institution_today()
+    date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date() if filters.get('date_to') else today
+    date_to = min(date_to, today)
+    if date_to < date_from:
+        raise ValueError('date_to is before date_from')
+    return date_from, date_to
+
+def archived_attended_dates(date_from, date_to):
+    """{roll_number: set of attended dates} from archived terms overlapping the range"""
+    attended = {}
+    for row in archived_rows(AttendanceFilters(date_from=date_from, date_to=date_to)):
+        roll_number, scan_date, status = row[1], row[5], row[8]
+        if status.lower() in ATTENDED_STATUSES:
+            attended.setdefault(roll_number, set()).add(scan_date)
+    return attended
+
+def enrollment_date(created_at):
+    """The institution-local date a student was added; created_at is naive UTC"""
+    if created_at is None:
+        return None
+    return created_at.replace(tzinfo=timezone.utc).astimezone(INSTITUTION_TIMEZONE).date()
+
+def attendance_percentages(filters, threshold=DEFAULTER_THRESHOLD, defaulters_only=False):
+    """Per-student attended days over working days for the filtered students.
+
+    Attended days for every student come from one grouped outer join, with
+    only attended statuses on that student's session working days counted.
+    Days in archived terms are no longer in attendance_records, so they are
+    read from the archive files and added by roll number. A student's
+    working days start on the day they enrolled, or on their first attended
+    day if that is earlier (a roster imported after attendance began).
+    Returns (rows sorted by percentage, summary dict).
+    """
+    date_from, date_to = percentage_date_range(filters)
+    days = working_days(date_from, date_to)
+    archived = archived_attended_dates(date_from, date_to)
+    working_sets = {code: set(dates) for code, dates in days.items()}
+
+    on_working_day = or_(*(and_(Student.session == code, AttendanceRecord.scan_date.in_(dates))
+                           for code, dates in days.items() if dates)) if any(days.values()) else false()
+    query = db.session.query(
+        Student.id, Student.name, Student.roll_number, Student.session, Student.campus, Student.course,
+        Student.created_at, func.count(AttendanceRecord.id), func.min(AttendanceRecord.scan_date)
+    ).outerjoin(AttendanceRecord, and_(
+        AttendanceRecord.student_id == Student.id,
+        AttendanceRecord.scan_date.between(date_from, date_to),
+        func.lower(AttendanceRecord.status).in_(ATTENDED_STATUSES),
+        on_working_day
+    )).filter(Student.is_active == True)  # noqa: E712
+
+    if filters.get('session'):
+        query = query.filter(Student.session == filters['session'])
+    if filters.get('campus'):
+        query = query.filter(Student.campus == filters['campus'])
+    if filters.get('course'):
+        query = query.filter(Student.course == filters['course'])
+
+    rows = []
+    students = 0
+    defaulters = 0
+    for student_id, name, roll_number, session, campus, course, created_at, attended, first_attended in \
+            query.group_by(Student.id).all():
+        session_days = days.get(session, [])
+        archived_days = archived.get(roll_number, set()) & working_sets.get(session, set())
+        attended += len(archived_days)
+        enrolled = enrollment_date(created_at)
+        if enrolled is None:
+            working = len(session_days)
+        else:
+            start = min(enrolled, first_attended or enrolled, min(archived_days, default=enrolled))
+            working = len(session_days) - bisect.bisect_left(session_days, start)
+        percentage = round(attended / working * 100, 1) if working else None
+        defaulter = percentage is not None and percentage < threshold
+        students += 1
+        defaulters += defaulter
+        if defaulters_only and not defaulter:
+            continue
+        rows.append({
+            'student_id': student_id,
+            'name': name,
+            'roll_number': roll_number,
+            'session': session,
+            'campus': campus,
+            'course': course,
+            'attended_days': attended,
+            'working_days': working,
+            'percentage': percentage,
+            'defaulter': defaulter
+        })
+
+    rows.sort(key=lambda row: (row['percentage'] is None, row['percentage'] or 0, row['roll_number']))
+    summary = {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'threshold': threshold,
+        'working_days': {code: len(dates) for code, dates in days.items()},
+        'students': students,
+        'defaulters': defaulters
+    }
+    logging.info(f"Computed attendance percentages for {students} students, {defaulters} below {threshold}%")
+    return rows, summary
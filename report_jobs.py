@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from utils import write_excel_report
+from db_engines import reading_from_replica
+from attendance_query import AttendanceFilters, count_attendance, stream_attendance
+from archive import archived_rows, archived_row_estimate
+from log_events import log_event
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+REPORT_JOB_TTL = int(os.environ.get("REPORT_JOB_TTL", "3600"))
+# A queued/running job whose metadata has not been touched for this long is
+# assumed to belong to a dead worker and is no longer coalesced onto
+REPORT_JOB_STALE_AFTER = 600
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def normalize_report_filters(data):
+    """Reduce a filter payload to the fields that affect a report"""
+    data = data or {}
+    return {
+        'session': (data.get('session') or '').strip(),
+        'campus': (data.get('campus') or '').strip(),
+        'course': (data.get('course') or '').strip(),
+        'date_from': data.get('date_from') or '',
+        'date_to': data.get('date_to') or ''
+    }
+
+class ReportJobs:
+    """Background Excel report generation with on-disk job state.
+
+    Job metadata and finished files live in a shared directory so any web
+    worker can answer status and download requests. Identical queued or
+    running requests are coalesced onto one job through a per-filter marker
+    file, and finished artifacts are removed once their TTL expires.
+    """
+
+    def __init__(self, directory=None, max_workers=REPORT_WORKERS, ttl=REPORT_JOB_TTL):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+    def _dir(self, app):
+        if self.directory is None:
+            self.directory = os.environ.get("REPORT_JOB_DIR") or os.path.join(app.instance_path, 'reports')
+        os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _get_executor(self):
+        # Worker threads do not survive a fork, so build one pool per process
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _read_json(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, name, payload):
+        tmp_path = self._path(f'{name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _save(self, job, **changes):
+        job.update(changes, updated_at=time.time())
+        self._write_json(f"{job['job_id']}.json", job)
+
+    def _in_flight(self, job, now):
+        return job is not None and job['status'] in ('queued', 'running') and now - job['updated_at'] < REPORT_JOB_STALE_AFTER
+
+    def _marker_is_stale(self, name, now):
+        """Whether an in-flight marker no longer points at a live job"""
+        marker = self._read_json(name)
+        if marker is None:
+            # Empty or torn: left by a crash between creating and writing it,
+            # unless a submit is writing it right now
+            try:
+                return now - os.path.getmtime(self._path(name)) >= REPORT_JOB_STALE_AFTER
+            except FileNotFoundError:
+                return False
+        job = self._read_json(f"{marker.get('job_id')}.json") if _JOB_ID_PATTERN.match(marker.get('job_id') or '') else None
+        return not self._in_flight(job, now)
+
+    def _claim(self, key, job_id):
+        """Create the in-flight marker for key; O_EXCL lets exactly one submit win"""
+        try:
+            fd = os.open(self._path(f'{key}.inflight'), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'job_id': job_id}, f)
+        return True
+
+    def purge_expired(self):
+        """Delete finished jobs whose TTL has passed, fail jobs abandoned by a dead
+        worker and drop in-flight markers that point at no live job (at most once a minute)"""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        for name in os.listdir(self.directory):
+            if name.endswith('.inflight'):
+                if self._marker_is_stale(name, now):
+                    self._remove(name)
+                continue
+            if not name.endswith('.json'):
+                continue
+            job = self._read_json(name)
+            if not job:
+                continue
+            if job.get('expires_at') and job['expires_at'] < now:
+                self._remove(name)
+                self._remove(f"{job['job_id']}.xlsx")
+                log_event('report.expired', job_id=job['job_id'])
+            elif job['status'] in ('queued', 'running') and not self._in_flight(job, now):
+                self._save(job, status='failed', error='Report worker stopped', finished_at=now, expires_at=now + self.ttl)
+                log_event('report.abandoned', logging.WARNING, job_id=job['job_id'])
+
+    def submit(self, app, filters):
+        """Queue a report for filters, or return the identical job already in flight"""
+        self._dir(app)
+        self.purge_expired()
+
+        key = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+        now = time.time()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'key': key,
+            'status': 'queued',
+            'filters': filters,
+            'rows_written': 0,
+            'total_rows': None,
+            'progress': 0,
+            'created_at': now,
+            'finished_at': None,
+            'expires_at': None,
+            'summary': None,
+            'error': None
+        }
+        # Saved before the marker is claimed, so a coalescing submit always finds the job
+        self._save(job)
+        for _ in range(2):
+            if self._claim(key, job['job_id']):
+                break
+            marker = self._read_json(f'{key}.inflight')
+            current = self.get(marker.get('job_id')) if marker else None
+            if self._in_flight(current, time.time()):
+                self._remove(f"{job['job_id']}.json")
+                return current, True
+            if self._marker_is_stale(f'{key}.inflight', time.time()):
+                # Left by a dead worker; at worst two racing submits both replace
+                # it and run the same report twice
+                self._remove(f'{key}.inflight')
+            elif os.path.exists(self._path(f'{key}.inflight')):
+                # Another submit is still writing its marker; run this one uncoalesced
+                break
+
+        self._get_executor().submit(self._run, app, dict(job))
+        log_event('report.queued', job_id=job['job_id'], filters=filters)
+        return job, False
+
+    def get(self, job_id):
+        if not _JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        self._dir(current_app)
+        # Status polls keep expiry going between submits
+        self.purge_expired()
+        return self._read_json(f'{job_id}.json')
+
+    def artifact_path(self, job_id):
+        return self._path(f'{job_id}.xlsx')
+
+    def _run(self, app, job):
+        part_path = self._path(f"{job['job_id']}.xlsx.part")
+        last_saved = [0.0]
+
+        def progress(rows_written):
+            # Throttle metadata writes; progress is advisory
+            if time.time() - last_saved[0] >= 1:
+                last_saved[0] = time.time()
+                percent = round(rows_written / job['total_rows'] * 100, 1) if job['total_rows'] else 0
+                self._save(job, rows_written=rows_written, progress=min(percent, 99.9))
+
+        try:
+            with app.app_context(), reading_from_replica():
+                criteria = AttendanceFilters.from_report_filters(job['filters'])
+                total_rows = count_attendance(criteria) + archived_row_estimate(criteria)
+                self._save(job, status='running', total_rows=total_rows)
+                rows = chain(stream_attendance(criteria), archived_rows(criteria))
+                with open(part_path, 'wb') as output:
+                    summary = write_excel_report(rows, job['filters'], output, progress=progress)
+            os.replace(part_path, self.artifact_path(job['job_id']))
+            finished = time.time()
+            self._save(job, status='done', rows_written=summary['total'], progress=100,
+                       summary=summary, finished_at=finished, expires_at=finished + self.ttl)
+            log_event('report.finished', job_id=job['job_id'], rows=summary['total'],
+                      seconds=round(finished - job['created_at'], 3))
+        except Exception as e:
+            logging.error(f"Report job {job['job_id']} failed: {e}")
+            self._remove(f"{job['job_id']}.xlsx.part")
+            finished = time.time()
+            self._save(job, status='failed', error='Failed to generate report',
+                       finished_at=finished, expires_at=finished + self.ttl)
+        finally:
+            marker = self._read_json(f"{job['key']}.inflight")
+            if marker and marker.get('job_id') == job['job_id']:
+                self._remove(f"{job['key']}.inflight")
+
+report_jobs = ReportJobs()
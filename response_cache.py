@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict, deque
+from utils import institution_today
+from flask import request, session, make_response, Response
+from live import broadcaster, publish_event
+from report_jobs import normalize_report_filters
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "30"))
+# Recent scans kept to tell whether one landed while a response was computed
+RECENT_SCANS = 1000
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'expires', 'kind', 'filters')
+
+    def __init__(self, body, etag, expires, kind, filters):
+        self.body = body
+        self.etag = etag
+        self.expires = expires
+        self.kind = kind
+        self.filters = filters
+
+    def matches_scan(self, event):
+        """Whether a new scan could change this response"""
+        if self.kind == 'dashboard':
+            return True
+        if self.kind != 'attendance':
+            return False
+        for field in ('session', 'campus', 'course'):
+            if self.filters[field] and self.filters[field] != event[field]:
+                return False
+        # ISO dates compare correctly as strings
+        if self.filters['date_from'] and event['scan_date'] < self.filters['date_from']:
+            return False
+        if self.filters['date_to'] and event['scan_date'] > self.filters['date_to']:
+            return False
+        return True
+
+class ResponseCache:
+    """Size-bounded TTL cache of JSON response bodies for authenticated read endpoints"""
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._generations = {kind: 0 for kind in ('attendance', 'dashboard', 'students')}
+        self._scan_seq = 0
+        self._recent_scans = deque(maxlen=RECENT_SCANS)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def _scanned_since(self, entry, scan_seq):
+        # Caller holds the lock. True if a scan after scan_seq could change the entry,
+        # or if too many scans arrived since to tell
+        if scan_seq == self._scan_seq:
+            return False
+        if not self._recent_scans or self._recent_scans[0][0] > scan_seq + 1:
+            return True
+        return any(seq > scan_seq and entry.matches_scan(event) for seq, event in self._recent_scans)
+
+    def put(self, key, body, kind, filters, generation):
+        entry = CachedResponse(body, hashlib.sha1(body).hexdigest(), time.monotonic() + self.ttl, kind, filters)
+        kind_generation, scan_seq = generation
+        with self._lock:
+            # Don't store a body computed before an invalidation that applies to it ran
+            if kind_generation != self._generations.get(kind, 0) or self._scanned_since(entry, scan_seq):
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate_scan(self, event):
+        """Drop only the entries a new scan could affect.
+
+        Responses being computed meanwhile are checked against the scan when
+        stored, so one scan does not stop everything else from being cached.
+        """
+        with self._lock:
+            self._scan_seq += 1
+            self._recent_scans.append((self._scan_seq, event))
+            stale = [key for key, entry in self._entries.items() if entry.matches_scan(event)]
+            for key in stale:
+                del self._entries[key]
+
+    def generation(self, kind):
+        """Token to pass to put, taken before the response is computed"""
+        with self._lock:
+            return self._generations.get(kind, 0), self._scan_seq
+
+    def clear(self):
+        with self._lock:
+            for kind in self._generations:
+                self._generations[kind] += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0
+            }
+
+response_cache = ResponseCache()
+
+def publish_responses_changed():
+    """Clear cached responses here and in every other worker, after holidays,
+    absences, archiving or rollups changed what they report"""
+    response_cache.clear()
+    publish_event({'type': 'responses.changed'})
+
+def _on_live_event(event):
+    if event.get('type') == 'scan':
+        response_cache.invalidate_scan(event)
+    elif event.get('type') == 'responses.changed':
+        response_cache.clear()
+
+# Scans and clears published by any worker invalidate this worker's entries
+broadcaster.add_listener(_on_live_event)
+
+def _cache_key(kind):
+    """Normalise the request into a cache key and the filters used for invalidation"""
+    if kind == 'attendance':
+        payload = request.get_json(silent=True) or {}
+        filters = normalize_report_filters(payload)
+        key_fields = dict(filters, limit=payload.get('limit'), cursor=payload.get('cursor'),
+                          threshold=payload.get('threshold'), defaulters_only=payload.get('defaulters_only'),
+                          group_by=payload.get('group_by'),
+                          path=request.path)
+    elif kind == 'dashboard':
+        filters = None
+        key_fields = {'today': institution_today().isoformat()}
+    else:
+        filters = None
+        key_fields = {}
+    return kind + json.dumps(key_fields, sort_keys=True), filters
+
+def cached_response(kind):
+    """Serve a view's successful JSON responses from the response cache.
+
+    kind selects the invalidation rule: 'attendance' entries are dropped by
+    scans matching their filters, 'dashboard' entries by any scan and
+    'students' entries only by roster changes. Unauthenticated requests are
+    passed straight through so the view can reject them.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if 'user_id' not in session:
+                return view(*args, **kwargs)
+
+            key, filters = _cache_key(kind)
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation(kind)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or not response.is_json or not response.get_json().get('success'):
+                    return response
+                entry = response_cache.put(key, response.get_data(), kind, filters, generation)
+
+            if entry.etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = Response(entry.body, mimetype='application/json')
+            response.set_etag(entry.etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
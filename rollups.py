@@ -0,0 +1,160 @@
+import logging
+from datetime import datetime
+from sqlalchemy import func, case, insert, event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from models import Student, AttendanceRecord, DailyAttendanceRollup
+from response_cache import publish_responses_changed
+
+# Student columns a daily rollup is grouped on
+GROUP_COLUMNS = ('session', 'campus', 'course')
+
+def rebuild_rollups(date_from=None, date_to=None):
+    """Recompute daily rollups from attendance_records with one grouped INSERT ... SELECT.
+
+    Dates inside archived terms are left alone, since their records are no
+    longer in attendance_records.
+    """
+    from archive import archived_date_clause
+
+    status = func.lower(AttendanceRecord.status)
+    select_counts = db.select(
+        AttendanceRecord.scan_date,
+        Student.session,
+        Student.campus,
+        Student.course,
+        func.sum(case((status == 'present', 1), else_=0)),
+        func.sum(case((status == 'late', 1), else_=0)),
+        func.sum(case((status == 'absent', 1), else_=0))
+    ).join(Student, AttendanceRecord.student_id == Student.id)\
+        .group_by(AttendanceRecord.scan_date, Student.session, Student.campus, Student.course)
+
+    select_counts = select_counts.where(~archived_date_clause(AttendanceRecord.scan_date))
+    delete_rollups = db.delete(DailyAttendanceRollup).where(~archived_date_clause(DailyAttendanceRollup.scan_date))
+    if date_from:
+        select_counts = select_counts.where(AttendanceRecord.scan_date >= date_from)
+        delete_rollups = delete_rollups.where(DailyAttendanceRollup.scan_date >= date_from)
+    if date_to:
+        select_counts = select_counts.where(AttendanceRecord.scan_date <= date_to)
+        delete_rollups = delete_rollups.where(DailyAttendanceRollup.scan_date <= date_to)
+
+    try:
+        db.session.execute(delete_rollups)
+        result = db.session.execute(insert(DailyAttendanceRollup).from_select(
+            ['scan_date', 'session', 'campus', 'course', 'present', 'late', 'absent'], select_counts
+        ))
+        db.session.commit()
+        logging.info(f"Rebuilt {result.rowcount} daily attendance rollups")
+        publish_responses_changed()
+        return result.rowcount
+    except Exception as e:
+        logging.error(f"Rollup rebuild error: {e}")
+        db.session.rollback()
+        raise
+
+def move_student_rollups(moves):
+    """Move regrouped students' attendance counts between rollups in the current transaction.
+
+    moves maps student_id to its (old_group, new_group) pair of (session,
+    campus, course) tuples. Rollups are grouped on the student's current
+    group, so without this a student's past days stay counted under the old
+    one until the next rebuild. Dates inside archived terms are left alone.
+    """
+    from archive import archived_date_clause
+    from ingest import record_rollup_counts, ROLLUP_STATUSES
+
+    moves = {student_id: groups for student_id, groups in moves.items() if groups[0] != groups[1]}
+    if not moves:
+        return
+
+    status = func.lower(AttendanceRecord.status)
+    rows = db.session.execute(
+        db.select(AttendanceRecord.student_id, AttendanceRecord.scan_date, status, func.count())
+        .where(AttendanceRecord.student_id.in_(moves), ~archived_date_clause(AttendanceRecord.scan_date))
+        .group_by(AttendanceRecord.student_id, AttendanceRecord.scan_date, status)
+    )
+    counts = {}
+    for student_id, scan_date, status_key, records in rows:
+        if status_key not in ROLLUP_STATUSES:
+            continue
+        old_group, new_group = moves[student_id]
+        for group, delta in ((old_group, -records), (new_group, records)):
+            statuses = counts.setdefault((scan_date, *group), {})
+            statuses[status_key] = statuses.get(status_key, 0) + delta
+    if not counts:
+        return
+
+    record_rollup_counts(counts)
+    db.session.execute(db.delete(DailyAttendanceRollup).where(
+        DailyAttendanceRollup.scan_date.in_({key[0] for key in counts}),
+        DailyAttendanceRollup.present == 0,
+        DailyAttendanceRollup.late == 0,
+        DailyAttendanceRollup.absent == 0
+    ))
+
+@event.listens_for(Session, 'before_flush')
+def _move_regrouped_students(session, flush_context, instances):
+    """Keep rollups in step with ORM edits that move a student to another group"""
+    moves = {}
+    for target in session.dirty:
+        if not isinstance(target, Student) or target.id is None:
+            continue
+        attrs = inspect(target).attrs
+        new_group = tuple(getattr(target, column) for column in GROUP_COLUMNS)
+        old_group = tuple(attrs[column].history.deleted[0] if attrs[column].history.deleted else value
+                          for column, value in zip(GROUP_COLUMNS, new_group))
+        moves[target.id] = (old_group, new_group)
+    if any(old_group != new_group for old_group, new_group in moves.values()):
+        with session.no_autoflush:
+            move_student_rollups(moves)
+
+def ensure_rollups():
+    """Build rollups once for databases that have attendance but no rollups yet"""
+    try:
+        if db.session.query(DailyAttendanceRollup.id).first() is None and \
+                db.session.query(AttendanceRecord.id).first() is not None:
+            rebuild_rollups()
+    except Exception as e:
+        logging.error(f"Rollup initialisation error: {e}")
+
+def rollup_totals(filters, exclude_archived=False):
+    """Sum present/late/absent counts from the rollups matching report filters.
+
+    Rollups outlive the rows of archived terms; exclude_archived leaves
+    those dates out, to match what is still in attendance_records.
+    """
+    query = db.session.query(
+        func.coalesce(func.sum(DailyAttendanceRollup.present), 0),
+        func.coalesce(func.sum(DailyAttendanceRollup.late), 0),
+        func.coalesce(func.sum(DailyAttendanceRollup.absent), 0)
+    )
+    if filters.get('session'):
+        query = query.filter(DailyAttendanceRollup.session == filters['session'])
+    if filters.get('campus'):
+        query = query.filter(DailyAttendanceRollup.campus == filters['campus'])
+    if filters.get('course'):
+        query = query.filter(DailyAttendanceRollup.course == filters['course'])
+    if filters.get('scan_date'):
+        query = query.filter(DailyAttendanceRollup.scan_date == filters['scan_date'])
+    if filters.get('date_from'):
+        query = query.filter(DailyAttendanceRollup.scan_date >= datetime.strptime(filters['date_from'], '%Y-%m-%d').date())
+    if filters.get('date_to'):
+        query = query.filter(DailyAttendanceRollup.scan_date <= datetime.strptime(filters['date_to'], '%Y-%m-%d').date())
+    if exclude_archived:
+        from archive import archived_date_clause
+        query = query.filter(~archived_date_clause(DailyAttendanceRollup.scan_date))
+
+    present, late, absent = query.one()
+    return {'present': int(present), 'late': int(late), 'absent': int(absent)}
+
+def rollup_summary(filters, exclude_archived=False):
+    """Attendance summary in the format_attendance_summary shape, read from rollups"""
+    totals = rollup_totals(filters, exclude_archived)
+    total = totals['present'] + totals['late'] + totals['absent']
+    return {
+        'total': total,
+        'present': totals['present'],
+        'late': totals['late'],
+        'absent': totals['absent'],
+        'percentage': round(totals['present'] / total * 100, 1) if total > 0 else 0
+    }
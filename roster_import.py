@@ -0,0 +1,196 @@
+import io
+import csv
+import time
+import logging
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Student
+from ingest import dialect_insert
+from cache import publish_students_changed
+from rollups import move_student_rollups, GROUP_COLUMNS
+
+SESSIONS = ('AN', 'FN')
+CAMPUSES = ('AEC', 'ACET', 'ACOE')
+REQUIRED_COLUMNS = ('roll_number', 'card_id', 'name', 'session', 'campus', 'course')
+IMPORT_CHUNK_SIZE = 2000
+
+class ImportReport:
+    """Outcome of a roster import: counts, throughput and per-row errors"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0
+
+    def add_error(self, line, row, message):
+        self.errors.append({
+            'line': line,
+            'roll_number': row.get('roll_number', ''),
+            'card_id': row.get('card_id', ''),
+            'error': message
+        })
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        self.errors.sort(key=lambda error: error['line'])
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0
+
+    def write_errors(self, output):
+        """Write the per-row errors as CSV to a text stream"""
+        writer = csv.DictWriter(output, fieldnames=['line', 'roll_number', 'card_id', 'error'])
+        writer.writeheader()
+        writer.writerows(self.errors)
+
+    def to_dict(self, max_errors=None):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'failed': len(self.errors),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+            'errors': self.errors[:max_errors] if max_errors else self.errors
+        }
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+def iter_roster_rows(stream, filename):
+    """Yield (line_number, row dict) from a CSV or XLSX roster without loading it whole"""
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [_normalize_header(value) for value in next(rows, ())]
+            for line, values in enumerate(rows, 2):
+                if any(value is not None for value in values):
+                    yield line, dict(zip(header, values))
+        finally:
+            wb.close()
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.reader(text)
+        header = [_normalize_header(value) for value in next(reader, [])]
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield reader.line_num, dict(zip(header, values))
+
+def validate_roster_row(row):
+    """Return (student values, None) for a valid row, or (None, error message)"""
+    values = {}
+    for column in REQUIRED_COLUMNS:
+        value = row.get(column)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            return None, f"Missing {column}"
+        limit = Student.__table__.c[column].type.length
+        if len(value) > limit:
+            return None, f"{column} longer than {limit} characters"
+        values[column] = value
+
+    values['session'] = values['session'].upper()
+    values['campus'] = values['campus'].upper()
+    if values['session'] not in SESSIONS:
+        return None, f"Unknown session {values['session']}"
+    if values['campus'] not in CAMPUSES:
+        return None, f"Unknown campus {values['campus']}"
+
+    year = row.get('year')
+    try:
+        values['year'] = int(year) if year not in (None, '') else 1
+    except (TypeError, ValueError):
+        return None, f"Invalid year {year}"
+
+    values['is_active'] = True
+    return values, None
+
+def _upsert_students(rows):
+    """Insert or update students by roll_number in one statement, moving the
+    rollups of students whose session, campus or course changes"""
+    current = db.session.query(Student.id, Student.roll_number, *(getattr(Student, column) for column in GROUP_COLUMNS))\
+        .filter(Student.roll_number.in_([values['roll_number'] for values in rows])).all()
+    incoming = {values['roll_number']: tuple(values[column] for column in GROUP_COLUMNS) for values in rows}
+    moves = {student_id: (tuple(group), incoming[roll_number]) for student_id, roll_number, *group in current}
+
+    table = Student.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['roll_number'],
+        set_={column: stmt.excluded[column] for column in ('card_id', 'name', 'session', 'campus', 'course', 'year', 'is_active')}
+    )
+    db.session.execute(stmt, rows)
+    move_student_rollups(moves)
+
+def _flush_chunk(chunk, report):
+    # Card IDs may not move to a different student through an import
+    owners = dict(db.session.query(Student.card_id, Student.roll_number)
+                  .filter(Student.card_id.in_([values['card_id'] for _, _, values in chunk])).all())
+    rows = []
+    for line, row, values in chunk:
+        owner = owners.get(values['card_id'])
+        if owner is not None and owner != values['roll_number']:
+            report.add_error(line, row, f"card_id already assigned to roll number {owner}")
+        else:
+            rows.append((line, row, values))
+    if not rows:
+        return
+
+    try:
+        _upsert_students([values for _, _, values in rows])
+        db.session.commit()
+        report.imported += len(rows)
+    except IntegrityError:
+        # Isolate the offending rows by retrying one at a time
+        db.session.rollback()
+        for line, row, values in rows:
+            try:
+                _upsert_students([values])
+                db.session.commit()
+                report.imported += 1
+            except IntegrityError as e:
+                db.session.rollback()
+                report.add_error(line, row, f"Conflicts with an existing student: {e.orig}")
+
+def import_roster(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Validate, dedupe and upsert roster rows in chunks; returns an ImportReport"""
+    report = ImportReport()
+    seen_rolls = set()
+    seen_cards = set()
+    chunk = []
+
+    try:
+        for line, row in rows:
+            report.rows += 1
+            values, error = validate_roster_row(row)
+            if error:
+                report.add_error(line, row, error)
+                continue
+            if values['roll_number'] in seen_rolls:
+                report.add_error(line, row, "Duplicate roll_number in file")
+                continue
+            if values['card_id'] in seen_cards:
+                report.add_error(line, row, "Duplicate card_id in file")
+                continue
+            seen_rolls.add(values['roll_number'])
+            seen_cards.add(values['card_id'])
+
+            chunk.append((line, row, values))
+            if len(chunk) >= chunk_size:
+                _flush_chunk(chunk, report)
+                chunk = []
+
+        if chunk:
+            _flush_chunk(chunk, report)
+    finally:
+        # Core upserts bypass the Student mapper events; the web workers may be other processes
+        publish_students_changed()
+        report.finish()
+
+    logging.info(f"Roster import: {report.imported}/{report.rows} rows imported, "
+                 f"{len(report.errors)} errors, {report.rows_per_second} rows/s")
+    return report
@@ -1,66 +1,56 @@
+import base64
+import binascii
 import logging
-from datetime import datetime, date, time
-from flask import render_template, request, jsonify, session, redirect, url_for, make_response
-from app import app, db
-from models import User, Student, AttendanceRecord, AttendanceSession
-from utils import generate_excel_report, validate_biometric_data
+import tempfile
+import time
+from datetime import datetime
+from itertools import chain
+from flask import Blueprint, current_app, render_template, request, jsonify, session, redirect, url_for, make_response, send_file, Response, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import User, Student, AttendanceRecord, AttendanceSession, AcademicHoliday
+from utils import write_excel_report, write_percentage_report, parse_scan, institution_today, log_attendance_activity
+from ingest import ingest_scan_batch, record_rollup_counts, MAX_BATCH_SIZE
+from cache import student_cache, scan_index, journaled_scans
+from live import broadcaster, bus, publish_scans, scan_event
+from scan_journal import scan_journal
+from db_engines import read_replica, replica_health, pool_stats, limit_statement_time
+from metrics import render_prometheus, METRICS_TOKEN
+from log_events import log_event, log_stats
+from response_cache import cached_response, response_cache, publish_responses_changed
+from roster_import import import_roster, iter_roster_rows
+from rollups import rollup_totals, rollup_summary
+from percentages import attendance_percentages, DEFAULTER_THRESHOLD
+from attendance_matrix import attendance_matrix, GROUP_FIELDS
+from attendance_status import classify_scan, OUTSIDE_SESSION, OUTSIDE_SESSION_MESSAGE
+from archive import archived_rows
+from attendance_query import AttendanceFilters, fetch_attendance, stream_attendance
+from report_jobs import report_jobs, normalize_report_filters
+from exports import STREAM_FORMATS, EXPORT_BATCH_SIZE, row_batches, export_chunks
 import json
 
-def create_default_data():
-    """Create default users and sample data if they don't exist"""
-    try:
-        # Create default admin user
-        if not User.query.filter_by(username='Shanmukh').first():
-            admin = User(username='Shanmukh', full_name='Shanmukh Admin', role='admin')
-            admin.set_password('1234')
-            db.session.add(admin)
-            
-        # Create default attendance sessions
-        if not AttendanceSession.query.first():
-            morning_session = AttendanceSession(
-                session_name='Morning Session',
-                session_code='AN',
-                start_time=time(9, 0),
-                end_time=time(12, 0)
-            )
-            afternoon_session = AttendanceSession(
-                session_name='Afternoon Session', 
-                session_code='FN',
-                start_time=time(13, 0),
-                end_time=time(17, 0)
-            )
-            db.session.add(morning_session)
-            db.session.add(afternoon_session)
-            
-        # Create sample students
-        if not Student.query.first():
-            students = [
-                Student(roll_number='001', card_id='CARD001', name='John Doe', 
-                       session='AN', campus='AEC', course='CE'),
-                Student(roll_number='002', card_id='CARD002', name='Jane Smith',
-                       session='AN', campus='AEC', course='EEE'),
-                Student(roll_number='003', card_id='CARD003', name='Alice Johnson',
-                       session='FN', campus='ACET', course='CSE'),
-                Student(roll_number='004', card_id='CARD004', name='Bob Wilson',
-                       session='AN', campus='ACOE', course='ME'),
-                Student(roll_number='005', card_id='CARD005', name='Carol Brown',
-                       session='FN', campus='AEC', course='ECE'),
-            ]
-            for student in students:
-                db.session.add(student)
-                
-        db.session.commit()
-        logging.info("Default data created successfully")
-    except Exception as e:
-        logging.error(f"Error creating default data: {e}")
-        db.session.rollback()
+bp = Blueprint('main', __name__)
 
-@app.route('/')
+# Bytes of a streamed export kept in memory before spilling to disk
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Rejected roster rows listed in an import response
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Live feed: client reconnect delay and idle keepalive interval
+LIVE_RETRY_MS = 5000
+LIVE_KEEPALIVE_SECONDS = 15
+
+# Keyset pagination for the attendance table
+FILTER_PAGE_SIZE = 100
+FILTER_MAX_PAGE_SIZE = 1000
+
+@bp.route('/')
 def index():
     """Main page - login if not authenticated, dashboard if authenticated"""
     return render_template('index.html')
 
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     """Handle login authentication"""
     try:
@@ -76,70 +66,124 @@ def login():
             session['user_id'] = user.id
             session['username'] = user.username
             session['user_role'] = user.role
-            logging.info(f"User {username} logged in successfully")
+            log_event('auth.login', username=username)
             return jsonify({'success': True, 'message': 'Login successful'})
         else:
-            logging.warning(f"Failed login attempt for username: {username}")
+            log_event('auth.login_failed', logging.WARNING, username=username)
             return jsonify({'success': False, 'message': 'Invalid username or password'})
             
     except Exception as e:
         logging.error(f"Login error: {e}")
         return jsonify({'success': False, 'message': 'Login failed'})
 
-@app.route('/logout', methods=['POST'])
+@bp.route('/logout', methods=['POST'])
 def logout():
     """Handle user logout"""
     try:
         username = session.get('username', 'Unknown')
         session.clear()
-        logging.info(f"User {username} logged out")
+        log_event('auth.logout', username=username)
         return jsonify({'success': True, 'message': 'Logged out successfully'})
     except Exception as e:
         logging.error(f"Logout error: {e}")
         return jsonify({'success': False, 'message': 'Logout failed'})
 
-@app.route('/api/biometric/scan', methods=['POST'])
+def duplicate_scan_response(student, scan_date, previous_time):
+    """Build the response for a student who has already scanned on scan_date"""
+    log_event('scan.duplicate', roll_number=student.roll_number, scan_date=scan_date, previous_time=previous_time)
+    return jsonify({
+        'success': True, 
+        'message': 'Attendance already recorded', 
+        'duplicate': True,
+        'student_name': student.name,
+        'previous_time': previous_time.strftime('%H:%M:%S')
+    })
+
+def journal_scan(data, card_id, scan_date, scan_time):
+    """Acknowledge a scan once it is in the local journal.
+
+    Only the in-memory caches are consulted, so a slow or unreachable
+    database never delays the answer. A card they do not know is journaled
+    unresolved; the drainer resolves it, and dead-letters it if no active
+    student has it. Returns None if the journal cannot take the scan, so
+    the caller falls back to writing it directly.
+    """
+    student = student_cache.peek(card_id)
+    if student:
+        previous_time = scan_index.peek(student.id, scan_date) or journaled_scans.peek(student.id, scan_date)
+        if previous_time is not None:
+            return duplicate_scan_response(student, scan_date, previous_time)
+
+    try:
+        scan_journal.append(data)
+    except OSError as e:
+        logging.error(f"Scan journal append error: {e}")
+        return None
+
+    response = {
+        'success': True,
+        'message': 'Attendance recorded successfully',
+        'queued': True,
+        'scan_time': scan_time.strftime('%H:%M:%S')
+    }
+    if student:
+        # A second swipe before the drain gets the duplicate answer
+        journaled_scans.record(student.id, scan_date, scan_time)
+        response.update(student_name=student.name, roll_number=student.roll_number)
+    else:
+        response['message'] = 'Attendance queued for recording'
+    return jsonify(response)
+
+@bp.route('/api/biometric/scan', methods=['POST'])
 def biometric_scan():
     """API endpoint to receive attendance data from biometric scanners"""
     try:
         data = request.get_json()
         
-        if not validate_biometric_data(data):
+        scan = parse_scan(data)
+        if scan is None:
             return jsonify({'success': False, 'message': 'Invalid biometric data format'})
         
-        card_id = data.get('card_id')
-        scan_datetime_str = data.get('timestamp')
-        scanner_id = data.get('scanner_id', 'unknown')
-        location = data.get('location', 'Main Campus')
-        
-        # Parse timestamp
-        scan_datetime = datetime.fromisoformat(scan_datetime_str.replace('Z', '+00:00'))
-        scan_date = scan_datetime.date()
-        scan_time = scan_datetime.time()
-        
-        # Find student by card ID
-        student = Student.query.filter_by(card_id=card_id, is_active=True).first()
+        card_id = scan.card_id
+        scanner_id = scan.scanner_id
+        location = scan.location
+        scan_datetime = scan.scan_datetime
+        scan_date = scan.scan_date
+        scan_time = scan.scan_time
+        
+        # With a journal configured, acknowledge once the scan is on local disk
+        if scan_journal.enabled:
+            response = journal_scan(data, card_id, scan_date, scan_time)
+            if response is not None:
+                return response
+        
+        # Find student by card ID, with this scan's statements kept short
+        limit_statement_time(db.session)
+        student = student_cache.get(card_id)
         if not student:
-            logging.warning(f"Unknown card ID scanned: {card_id}")
+            log_event('scan.unknown_card', logging.WARNING, card_id=card_id)
             return jsonify({'success': False, 'message': 'Student not found'})
         
-        # Check if attendance already recorded for today
-        existing_record = AttendanceRecord.query.filter_by(
-            student_id=student.id, 
-            scan_date=scan_date
-        ).first()
-        
-        if existing_record:
-            logging.info(f"Duplicate scan attempt for student {student.roll_number} on {scan_date}")
-            return jsonify({
-                'success': True, 
-                'message': 'Attendance already recorded', 
-                'duplicate': True,
-                'student_name': student.name,
-                'previous_time': existing_record.scan_time.strftime('%H:%M:%S')
-            })
-        
-        # Create new attendance record
+        # Check if attendance already recorded for today, from memory first
+        previous_time = scan_index.lookup(student.id, scan_date)
+        if previous_time is None:
+            existing_record = AttendanceRecord.query.filter_by(
+                student_id=student.id, 
+                scan_date=scan_date
+            ).first()
+            if existing_record:
+                previous_time = existing_record.scan_time
+                scan_index.record(student.id, scan_date, previous_time)
+        
+        if previous_time is not None:
+            return duplicate_scan_response(student, scan_date, previous_time)
+        
+        # Create new attendance record, late if after the session's grace period
+        status = classify_scan(student.session, scan_time)
+        if status == OUTSIDE_SESSION:
+            log_event('scan.outside_session', logging.WARNING, roll_number=student.roll_number,
+                      session=student.session, scan_date=scan_date, scan_time=scan_time)
+            return jsonify({'success': False, 'message': OUTSIDE_SESSION_MESSAGE})
         attendance = AttendanceRecord(
             student_id=student.id,
             card_id=card_id,
@@ -148,20 +192,33 @@ def biometric_scan():
             scan_time=scan_time,
             location=location,
             scanner_id=scanner_id,
-            status='present'
+            status=status
         )
         
         db.session.add(attendance)
-        db.session.commit()
-        
-        logging.info(f"Attendance recorded for {student.name} ({student.roll_number}) at {scan_time}")
+        try:
+            record_rollup_counts({(scan_date, student.session, student.campus, student.course): {status: 1}})
+            db.session.commit()
+        except IntegrityError:
+            # Another worker recorded this student first
+            db.session.rollback()
+            existing_record = AttendanceRecord.query.filter_by(student_id=student.id, scan_date=scan_date).first()
+            scan_index.record(student.id, scan_date, existing_record.scan_time)
+            return duplicate_scan_response(student, scan_date, existing_record.scan_time)
+        
+        scan_index.record(student.id, scan_date, scan_time)
+        publish_scans([scan_event(student, scan_datetime, location, institution_today(), status)])
+        
+        log_event('scan.recorded', roll_number=student.roll_number, session=student.session, scan_date=scan_date,
+                  scan_time=scan_time, status=status, scanner_id=scanner_id)
         
         return jsonify({
             'success': True,
             'message': 'Attendance recorded successfully',
             'student_name': student.name,
             'roll_number': student.roll_number,
-            'scan_time': scan_time.strftime('%H:%M:%S')
+            'scan_time': scan_time.strftime('%H:%M:%S'),
+            'status': status
         })
         
     except Exception as e:
@@ -169,120 +226,459 @@ def biometric_scan():
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to record attendance'})
 
-@app.route('/api/attendance/filter', methods=['POST'])
+@bp.route('/api/biometric/scan/batch', methods=['POST'])
+def biometric_scan_batch():
+    """API endpoint to receive buffered attendance scans from biometric scanners in bulk"""
+    try:
+        data = request.get_json()
+        scans = data.get('scans') if isinstance(data, dict) else data
+
+        if not isinstance(scans, list) or not scans:
+            return jsonify({'success': False, 'message': 'Invalid biometric batch format'})
+        if len(scans) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'message': f'Batch too large (maximum {MAX_BATCH_SIZE} scans)'})
+
+        results = ingest_scan_batch(scans)
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'count': len(results),
+            'recorded': sum(1 for result in results if result['success'] and not result.get('duplicate')),
+            'duplicates': sum(1 for result in results if result.get('duplicate')),
+            'invalid': sum(1 for result in results if result.get('invalid')),
+            'failed': sum(1 for result in results if not result['success'])
+        })
+
+    except Exception as e:
+        logging.error(f"Biometric batch scan error: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to record attendance batch'})
+
+def encode_page_cursor(scan_datetime, record_id):
+    """Encode the (scan_datetime, id) keyset position of the last row on a page"""
+    return base64.urlsafe_b64encode(f"{scan_datetime.isoformat()}|{record_id}".encode()).decode()
+
+def decode_page_cursor(cursor):
+    """Decode a page cursor; raises ValueError if it is malformed"""
+    try:
+        scan_datetime, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(scan_datetime), int(record_id)
+    except (TypeError, AttributeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+@bp.route('/api/attendance/filter', methods=['POST'])
+@cached_response('attendance')
+@read_replica
 def filter_attendance():
-    """Filter attendance records based on session, campus, and course"""
+    """Filter attendance records based on session, campus, and course, one page at a time"""
     try:
         # Check authentication
         if 'user_id' not in session:
             return jsonify({'success': False, 'message': 'Authentication required'})
         
-        data = request.get_json()
-        session_filter = data.get('session', '').strip()
-        campus_filter = data.get('campus', '').strip()
-        course_filter = data.get('course', '').strip()
-        date_from = data.get('date_from')
-        date_to = data.get('date_to')
-        
-        # Build query
-        query = db.session.query(AttendanceRecord, Student).join(Student)
-        
-        # Apply filters
-        if session_filter:
-            query = query.filter(Student.session == session_filter)
-        if campus_filter:
-            query = query.filter(Student.campus == campus_filter)
-        if course_filter:
-            query = query.filter(Student.course == course_filter)
-        if date_from:
-            query = query.filter(AttendanceRecord.scan_date >= datetime.strptime(date_from, '%Y-%m-%d').date())
-        if date_to:
-            query = query.filter(AttendanceRecord.scan_date <= datetime.strptime(date_to, '%Y-%m-%d').date())
-        
-        # Execute query
-        results = query.order_by(AttendanceRecord.scan_datetime.desc()).all()
+        data = request.get_json() or {}
+        filters = normalize_report_filters(data)
+        limit = data.get('limit')
+        if limit is None or limit == '':
+            limit = FILTER_PAGE_SIZE
+        try:
+            if isinstance(limit, bool) or not isinstance(limit, (int, str)):
+                raise ValueError(limit)
+            limit = max(1, min(int(limit), FILTER_MAX_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Page limit must be an integer'}), 400
+        
+        cursor = data.get('cursor')
+        after = None
+        if cursor:
+            try:
+                after = decode_page_cursor(cursor)
+            except ValueError:
+                return jsonify({'success': False, 'message': 'Invalid page cursor'})
+        
+        # Fetch one extra row to know whether another page exists
+        results = fetch_attendance(AttendanceFilters.from_report_filters(filters), 'page', after, limit + 1)
+        has_more = len(results) > limit
+        results = results[:limit]
         
         # Format results
         attendance_data = []
-        for attendance, student in results:
+        for row in results:
             attendance_data.append({
-                'id': attendance.id,
-                'name': student.name,
-                'roll_number': student.roll_number,
-                'session': student.session,
-                'campus': student.campus,
-                'course': student.course,
-                'scan_date': attendance.scan_date.strftime('%Y-%m-%d'),
-                'scan_time': attendance.scan_time.strftime('%H:%M:%S'),
-                'location': attendance.location,
-                'status': attendance.status
+                'id': row.id,
+                'name': row.name,
+                'roll_number': row.roll_number,
+                'session': row.session,
+                'campus': row.campus,
+                'course': row.course,
+                'scan_date': row.scan_date.isoformat(),
+                'scan_time': row.scan_time.isoformat(timespec='seconds'),
+                'location': row.location,
+                'status': row.status
             })
         
-        return jsonify({
+        response = {
             'success': True,
             'data': attendance_data,
-            'count': len(attendance_data)
-        })
+            'count': len(attendance_data),
+            'next_cursor': encode_page_cursor(results[-1].scan_datetime, results[-1].id) if has_more else None
+        }
+        
+        # The total comes from the daily rollups, so only the first page pays for it;
+        # pages read live rows only, so archived dates are left out of it too
+        if not cursor:
+            response['total'] = rollup_summary(filters, exclude_archived=True)['total']
+        
+        return jsonify(response)
         
     except Exception as e:
         logging.error(f"Filter attendance error: {e}")
         return jsonify({'success': False, 'message': 'Failed to filter attendance data'})
 
-@app.route('/api/attendance/download', methods=['POST'])
+@bp.route('/api/attendance/download', methods=['POST'])
+@read_replica
 def download_attendance():
-    """Generate and download Excel report of filtered attendance data"""
+    """Download filtered attendance data as an Excel report, or streamed as CSV or NDJSON"""
     try:
         # Check authentication
         if 'user_id' not in session:
             return jsonify({'success': False, 'message': 'Authentication required'})
         
-        data = request.get_json()
-        session_filter = data.get('session', '').strip()
-        campus_filter = data.get('campus', '').strip()
-        course_filter = data.get('course', '').strip()
-        date_from = data.get('date_from')
-        date_to = data.get('date_to')
-        
-        # Build query (same as filter)
-        query = db.session.query(AttendanceRecord, Student).join(Student)
-        
-        if session_filter:
-            query = query.filter(Student.session == session_filter)
-        if campus_filter:
-            query = query.filter(Student.campus == campus_filter)
-        if course_filter:
-            query = query.filter(Student.course == course_filter)
-        if date_from:
-            query = query.filter(AttendanceRecord.scan_date >= datetime.strptime(date_from, '%Y-%m-%d').date())
-        if date_to:
-            query = query.filter(AttendanceRecord.scan_date <= datetime.strptime(date_to, '%Y-%m-%d').date())
-        
-        results = query.order_by(AttendanceRecord.scan_datetime.desc()).all()
-        
-        if not results:
+        data = request.get_json(silent=True) or {}
+        export_format = (data.get('format') or request.args.get('format') or 'xlsx').lower()
+        if export_format != 'xlsx' and export_format not in STREAM_FORMATS:
+            return jsonify({'success': False, 'message': 'Format must be xlsx, csv or ndjson'})
+        filters = normalize_report_filters(data)
+        criteria = AttendanceFilters.from_report_filters(filters)
+        
+        if export_format != 'xlsx':
+            compress = data.get('gzip') in (True, 1, '1', 'true') or request.args.get('gzip') in ('1', 'true')
+            return streamed_export(criteria, filters, export_format, compress)
+        
+        # Stream rows from a server-side cursor, then any archived terms in
+        # range, into a spooled temp file
+        rows = chain(stream_attendance(criteria), archived_rows(criteria))
+        output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+        summary = write_excel_report(rows, filters, output)
+        
+        if not summary['total']:
+            output.close()
             return jsonify({'success': False, 'message': 'No data found for the specified criteria'})
         
-        # Generate Excel file
-        excel_file = generate_excel_report(results, {
-            'session': session_filter,
-            'campus': campus_filter,
-            'course': course_filter,
-            'date_from': date_from,
-            'date_to': date_to
+        log_event('report.download', username=session.get('username'), format='xlsx', rows=summary['total'],
+                  filters=filters)
+        output.seek(0)
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'attendance_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        )
+        
+    except Exception as e:
+        logging.error(f"Download attendance error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to generate report'})
+
+def streamed_export(criteria, filters, export_format, compress):
+    """Stream matching rows, then archived ones, as CSV or NDJSON with chunked transfer.
+
+    Rows go from the cursor to the encoder a batch at a time, so the
+    response starts at once and memory stays flat. The first batch is
+    fetched up front so an empty result still gets a JSON answer.
+    """
+    result = stream_attendance(criteria, batch_size=EXPORT_BATCH_SIZE)
+    batches = chain(result.partitions(), row_batches(archived_rows(criteria)))
+    first = next(batches, None)
+    if first is None:
+        result.close()
+        return jsonify({'success': False, 'message': 'No data found for the specified criteria'})
+    
+    username = session.get('username')
+    started = time.perf_counter()
+    
+    def counted():
+        rows = 0
+        for batch in chain([first], batches):
+            rows += len(batch)
+            yield batch
+        log_event('report.download', username=username, format=export_format, gzip=compress, rows=rows,
+                  filters=filters, seconds=round(time.perf_counter() - started, 3))
+    
+    mimetype, extension = STREAM_FORMATS[export_format]
+    filename = f'attendance_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    if compress:
+        mimetype, filename = 'application/gzip', f'{filename}.gz'
+    response = Response(stream_with_context(export_chunks(counted(), export_format, compress)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@bp.route('/api/attendance/summary', methods=['POST'])
+@cached_response('attendance')
+@read_replica
+def attendance_summary():
+    """Get present/late/absent totals for the filtered range from the daily rollups"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        filters = normalize_report_filters(request.get_json())
+        
+        return jsonify({'success': True, 'summary': rollup_summary(filters)})
+        
+    except Exception as e:
+        logging.error(f"Attendance summary error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch attendance summary'})
+
+def percentage_request():
+    """Read filters, threshold and defaulters_only from a percentage request"""
+    data = request.get_json() or {}
+    try:
+        threshold = float(data.get('threshold') or DEFAULTER_THRESHOLD)
+    except (TypeError, ValueError):
+        raise ValueError('threshold must be a number')
+    return normalize_report_filters(data), threshold, bool(data.get('defaulters_only'))
+
+@bp.route('/api/attendance/percentages', methods=['POST'])
+@cached_response('attendance')
+@read_replica
+def attendance_percentage_report():
+    """Get per-student attendance percentages and defaulters over working days"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        try:
+            filters, threshold, defaulters_only = percentage_request()
+            rows, summary = attendance_percentages(filters, threshold, defaulters_only)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        return jsonify({'success': True, 'data': rows, 'summary': summary})
+        
+    except Exception as e:
+        logging.error(f"Attendance percentage error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to compute attendance percentages'})
+
+@bp.route('/api/attendance/percentages/download', methods=['POST'])
+@read_replica
+def download_attendance_percentages():
+    """Download per-student attendance percentages as an Excel sheet"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        try:
+            filters, threshold, defaulters_only = percentage_request()
+            rows, summary = attendance_percentages(filters, threshold, defaulters_only)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        if not rows:
+            return jsonify({'success': False, 'message': 'No students found for the specified criteria'})
+        
+        output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+        write_percentage_report(rows, summary, filters, output)
+        output.seek(0)
+        prefix = 'defaulters' if defaulters_only else 'attendance_percentage'
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'{prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        )
+        
+    except Exception as e:
+        logging.error(f"Download attendance percentage error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to generate percentage report'})
+
+@bp.route('/api/attendance/heatmap', methods=['POST'])
+@cached_response('attendance')
+def attendance_heatmap():
+    """Get attended students per day per group from the in-memory attendance matrix"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        data = request.get_json() or {}
+        filters = normalize_report_filters(data)
+        group_by = data.get('group_by') or list(GROUP_FIELDS)
+        if not isinstance(group_by, list) or any(field not in GROUP_FIELDS for field in group_by):
+            return jsonify({'success': False, 'message': f'group_by must be a list of {", ".join(GROUP_FIELDS)}'})
+        if not filters['date_from']:
+            return jsonify({'success': False, 'message': 'date_from is required'})
+        
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date()
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date() if filters['date_to'] else institution_today()
+        if (date_to - date_from).days > 366:
+            return jsonify({'success': False, 'message': 'Heatmap range is limited to one year'})
+        
+        totals = attendance_matrix.group_daily_totals(date_from, date_to, group_by, filters)
+        groups = [dict(zip(group_by, key), counts=counts) for key, counts in sorted(totals.items())]
+        
+        return jsonify({
+            'success': True,
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'group_by': group_by,
+            'groups': groups
         })
         
-        # Create response
-        response = make_response(excel_file.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response.headers['Content-Disposition'] = f'attachment; filename=attendance_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'})
+    except Exception as e:
+        logging.error(f"Attendance heatmap error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to build attendance heatmap'})
+
+@bp.route('/api/calendar/holidays', methods=['GET'])
+def list_holidays():
+    """List holidays excluded from working days, optionally within a date range"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        query = AcademicHoliday.query
+        if request.args.get('date_from'):
+            query = query.filter(AcademicHoliday.holiday_date >= datetime.strptime(request.args['date_from'], '%Y-%m-%d').date())
+        if request.args.get('date_to'):
+            query = query.filter(AcademicHoliday.holiday_date <= datetime.strptime(request.args['date_to'], '%Y-%m-%d').date())
+        
+        holidays = [{
+            'id': holiday.id,
+            'date': holiday.holiday_date.isoformat(),
+            'session': holiday.session_code,
+            'description': holiday.description
+        } for holiday in query.order_by(AcademicHoliday.holiday_date).all()]
         
-        return response
+        return jsonify({'success': True, 'data': holidays})
         
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'})
     except Exception as e:
-        logging.error(f"Download attendance error: {e}")
-        return jsonify({'success': False, 'message': 'Failed to generate report'})
+        logging.error(f"List holidays error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch holidays'})
+
+@bp.route('/api/calendar/holidays', methods=['POST'])
+def add_holiday():
+    """Mark a date, or one session of a date, as a holiday"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        if session.get('user_role') != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'})
+        
+        data = request.get_json() or {}
+        try:
+            holiday_date = datetime.strptime(data.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Holiday date must be YYYY-MM-DD'})
+        description = (data.get('description') or '').strip()
+        if not description:
+            return jsonify({'success': False, 'message': 'Holiday description required'})
+        
+        session_code = (data.get('session') or '').strip() or None
+        if session_code and not AttendanceSession.query.filter_by(session_code=session_code, is_active=True).first():
+            return jsonify({'success': False, 'message': f'Unknown session {session_code}'})
+        
+        holiday = AcademicHoliday(holiday_date=holiday_date, description=description[:120], session_code=session_code)
+        db.session.add(holiday)
+        db.session.commit()
+        # Working days changed, so every worker's cached percentages are stale
+        publish_responses_changed()
+        
+        return jsonify({'success': True, 'id': holiday.id})
+        
+    except Exception as e:
+        logging.error(f"Add holiday error: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to add holiday'})
+
+@bp.route('/api/calendar/holidays/<int:holiday_id>', methods=['DELETE'])
+def delete_holiday(holiday_id):
+    """Remove a holiday from the calendar"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        if session.get('user_role') != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'})
+        
+        holiday = db.session.get(AcademicHoliday, holiday_id)
+        if not holiday:
+            return jsonify({'success': False, 'message': 'Holiday not found'})
+        db.session.delete(holiday)
+        db.session.commit()
+        publish_responses_changed()
+        
+        return jsonify({'success': True})
+        
+    except Exception as e:
+        logging.error(f"Delete holiday error: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to delete holiday'})
+
+@bp.route('/api/reports', methods=['POST'])
+def create_report_job():
+    """Queue an Excel report for background generation"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        filters = normalize_report_filters(request.get_json())
+        job, coalesced = report_jobs.submit(current_app._get_current_object(), filters)
+        
+        return jsonify({'success': True, 'job': job, 'coalesced': coalesced})
+        
+    except Exception as e:
+        logging.error(f"Create report job error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to queue report'})
+
+@bp.route('/api/reports/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    """Get progress of a background report job"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        job = report_jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'message': 'Report job not found'}), 404
+        
+        return jsonify({'success': True, 'job': job})
+        
+    except Exception as e:
+        logging.error(f"Report job status error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch report job'})
 
-@app.route('/api/students', methods=['GET'])
+@bp.route('/api/reports/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    """Download the Excel file produced by a finished report job"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        
+        job = report_jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'message': 'Report job not found'}), 404
+        if job['status'] != 'done':
+            return jsonify({'success': False, 'message': f"Report is not ready (status: {job['status']})"})
+        if not job['summary']['total']:
+            return jsonify({'success': False, 'message': 'No data found for the specified criteria'})
+        
+        created = datetime.fromtimestamp(job['created_at'])
+        return send_file(
+            report_jobs.artifact_path(job_id),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'attendance_report_{created.strftime("%Y%m%d_%H%M%S")}.xlsx'
+        )
+        
+    except Exception as e:
+        logging.error(f"Download report job error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to download report'})
+
+@bp.route('/api/students', methods=['GET'])
+@cached_response('students')
+@read_replica
 def get_students():
     """Get all students for management"""
     try:
@@ -310,20 +706,48 @@ def get_students():
         logging.error(f"Get students error: {e}")
         return jsonify({'success': False, 'message': 'Failed to fetch students'})
 
-@app.route('/api/dashboard/stats', methods=['GET'])
+@bp.route('/api/students/import', methods=['POST'])
+def import_students():
+    """Bulk import or update students from an uploaded CSV or XLSX roster"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+        if session.get('user_role') != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'})
+        
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'success': False, 'message': 'Roster file required'})
+        if not upload.filename.lower().endswith(('.csv', '.xlsx')):
+            return jsonify({'success': False, 'message': 'Roster must be a .csv or .xlsx file'})
+        
+        report = import_roster(iter_roster_rows(upload.stream, upload.filename))
+        log_attendance_activity('ROSTER_IMPORT', username=session.get('username'), imported=report.imported, rows=report.rows)
+        
+        return jsonify({'success': True, 'report': report.to_dict(max_errors=IMPORT_MAX_REPORTED_ERRORS)})
+        
+    except Exception as e:
+        logging.error(f"Import students error: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to import students'})
+
+@bp.route('/api/dashboard/stats', methods=['GET'])
+@cached_response('dashboard')
+@read_replica
 def dashboard_stats():
     """Get dashboard statistics"""
     try:
         if 'user_id' not in session:
             return jsonify({'success': False, 'message': 'Authentication required'})
         
-        today = date.today()
+        today = institution_today()
         
         # Total students
         total_students = Student.query.filter_by(is_active=True).count()
         
-        # Today's attendance
-        today_attendance = AttendanceRecord.query.filter_by(scan_date=today).count()
+        # Today's attendance, from the daily rollups
+        today_totals = rollup_totals({'scan_date': today})
+        today_attendance = today_totals['present'] + today_totals['late']
         
         # Attendance percentage
         attendance_percentage = (today_attendance / total_students * 100) if total_students > 0 else 0
@@ -357,11 +781,115 @@ def dashboard_stats():
         logging.error(f"Dashboard stats error: {e}")
         return jsonify({'success': False, 'message': 'Failed to fetch dashboard stats'})
 
-@app.errorhandler(404)
+@bp.route('/api/live/stream', methods=['GET'])
+def live_stream():
+    """Server-Sent Events feed of new scans and dashboard counter deltas"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Authentication required'})
+    
+    bus.start()
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({'success': False, 'message': 'Too many live connections'}), 503
+    
+    def generate():
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n"
+            while True:
+                event = subscriber.next_event(timeout=LIVE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Get hit/miss counters for the in-process lookup caches"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+
+        return jsonify({'success': True, 'stats': {
+            'students': student_cache.stats(),
+            'scans_today': scan_index.stats(),
+            'responses': response_cache.stats(),
+            'attendance_matrix': attendance_matrix.stats()
+        }})
+
+    except Exception as e:
+        logging.error(f"Cache stats error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch cache stats'})
+
+@bp.route('/api/db/stats', methods=['GET'])
+def database_stats():
+    """Get connection pool occupancy, checkout waits and read replica health"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+
+        return jsonify({'success': True, 'stats': {
+            'pools': pool_stats(db.engines),
+            'replica': replica_health.stats()
+        }})
+
+    except Exception as e:
+        logging.error(f"Database stats error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch database stats'})
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; requires a bearer token when METRICS_TOKEN is set"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+
+    checked_out, waits, timeouts = {}, {}, {}
+    for bind, stats in pool_stats(db.engines).items():
+        labels = (('bind', bind),)
+        if 'checked_out' in stats:
+            checked_out[labels] = stats['checked_out']
+        if 'checkout_wait' in stats:
+            waits[labels] = stats['checkout_wait']['wait_total_ms'] / 1000
+            timeouts[labels] = stats['checkout_wait']['timeouts']
+    journal = scan_journal.stats()
+    logs = log_stats()
+
+    body = render_prometheus([
+        ('attendance_db_pool_checked_out', 'gauge', 'Connections currently checked out', checked_out),
+        ('attendance_db_pool_checkout_wait_seconds_total', 'counter', 'Time checkouts spent waiting for a connection', waits),
+        ('attendance_db_pool_checkout_timeouts_total', 'counter', 'Checkouts that gave up waiting', timeouts),
+        ('attendance_scan_journal_depth', 'gauge', 'Journaled scans not yet applied',
+         {(): journal['depth']} if 'depth' in journal else {}),
+        ('attendance_log_queue_depth', 'gauge', 'Log records waiting for the writer thread', {(): logs['queued']}),
+        ('attendance_log_dropped_total', 'counter', 'Log records dropped because the writer fell behind',
+         {(): logs['dropped']}),
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/journal/stats', methods=['GET'])
+def journal_stats():
+    """Get queue depth and lag of this worker's scan journal"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'})
+
+        return jsonify({'success': True, 'stats': scan_journal.stats()})
+
+    except Exception as e:
+        logging.error(f"Journal stats error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to fetch journal stats'})
+
+@bp.app_errorhandler(404)
 def not_found(error):
     return jsonify({'success': False, 'message': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return jsonify({'success': False, 'message': 'Internal server error'}), 500
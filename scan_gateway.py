@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils import parse_scan
+
+GATEWAY_BATCH_WINDOW = float(os.environ.get("GATEWAY_BATCH_WINDOW_MS", "5")) / 1000
+GATEWAY_MAX_BATCH = int(os.environ.get("GATEWAY_MAX_BATCH", "500"))
+GATEWAY_QUEUE_SIZE = int(os.environ.get("GATEWAY_QUEUE_SIZE", "10000"))
+GATEWAY_IDLE_TIMEOUT = 75
+GATEWAY_MAX_HEADER_BYTES = 16 * 1024
+GATEWAY_MAX_BODY_BYTES = 64 * 1024
+
+SCAN_PATH = '/api/biometric/scan'
+HEALTH_PATH = '/health'
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 431: 'Request Header Fields Too Large'}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, path, headers, body) or None at EOF"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, 'Incomplete request')
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, 'Request headers too large')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+        headers.setdefault('connection', 'close')
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HttpError(400, 'Chunked request bodies are not supported')
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, 'Invalid Content-Length')
+    if length > GATEWAY_MAX_BODY_BYTES:
+        raise HttpError(413, 'Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+class ScanGateway:
+    """Asyncio HTTP front end for biometric scanners.
+
+    Speaks just enough HTTP/1.1 for scanners: keep-alive connections and
+    POST /api/biometric/scan with the same request and response bodies as
+    the Flask endpoint. Valid scans from all connections are queued and
+    written in micro-batches: the batcher waits up to GATEWAY_BATCH_WINDOW
+    after the first scan, then hands the whole batch, parsed once on
+    arrival, to ingest_scans on a dedicated database thread, so thousands of idle or waiting
+    scanners cost one coroutine each instead of one worker thread.
+    """
+
+    def __init__(self, app, batch_window=GATEWAY_BATCH_WINDOW, max_batch=GATEWAY_MAX_BATCH):
+        self.app = app
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.connections = 0
+        self.batches = 0
+        self.scans = 0
+        self._queue = None
+        # One writer thread keeps batches in arrival order and off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gateway-db')
+
+    def _write_batch(self, scans):
+        from app import db
+        from ingest import ingest_scans
+
+        with self.app.app_context():
+            try:
+                return ingest_scans(scans)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            scans = [scan for scan, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._write_batch, scans)
+            except Exception as e:
+                logging.error(f"Gateway batch write error: {e}")
+                results = [{'success': False, 'message': 'Failed to record attendance'}] * len(batch)
+            self.batches += 1
+            self.scans += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def submit(self, scan):
+        """Queue one ScanPayload and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((scan, future))
+        return await future
+
+    async def _handle_scan(self, body):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        scan = parse_scan(data)
+        if scan is None:
+            return {'success': False, 'message': 'Invalid biometric data format'}
+        return await self.submit(scan)
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), GATEWAY_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HttpError as e:
+                    writer.write(_response(e.status, {'success': False, 'message': str(e)}, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if path == SCAN_PATH and method == 'POST':
+                    status, payload = 200, await self._handle_scan(body)
+                elif path == HEALTH_PATH and method == 'GET':
+                    status, payload = 200, {'success': True, 'stats': self.stats()}
+                elif path in (SCAN_PATH, HEALTH_PATH):
+                    status, payload = 405, {'success': False, 'message': 'Method not allowed'}
+                else:
+                    status, payload = 404, {'success': False, 'message': 'Endpoint not found'}
+
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'batches': self.batches,
+            'scans': self.scans,
+            'average_batch': round(self.scans / self.batches, 1) if self.batches else 0
+        }
+
+    async def serve(self, host, port):
+        self._queue = asyncio.Queue(maxsize=GATEWAY_QUEUE_SIZE)
+        batcher = asyncio.create_task(self._batcher())
+        server = await asyncio.start_server(self.handle_connection, host, port,
+                                            limit=GATEWAY_MAX_HEADER_BYTES, backlog=4096)
+        logging.info(f"Scan gateway listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+def run_gateway(app, host, port):
+    """Run the scanner gateway until interrupted"""
+    started = time.time()
+    gateway = ScanGateway(app)
+    try:
+        asyncio.run(gateway.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    logging.info(f"Scan gateway stopped after {time.time() - started:.0f}s: {gateway.stats()}")
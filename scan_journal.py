@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from db_engines import is_connection_error
+from log_events import log_event
+
+JOURNAL_SEGMENT_BYTES = int(os.environ.get("SCAN_JOURNAL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+JOURNAL_DRAIN_BATCH = int(os.environ.get("SCAN_JOURNAL_DRAIN_BATCH", "500"))
+JOURNAL_POLL_INTERVAL = 0.2
+JOURNAL_MAX_BACKOFF = 10
+# How often a drainer looks for lanes left behind by dead workers
+JOURNAL_ADOPT_INTERVAL = 5
+# Times a scan is retried on its own before it is moved to the dead-letter file
+JOURNAL_RECORD_ATTEMPTS = 3
+DEAD_LETTER_FILE = 'dead-letter.jsonl'
+
+SEGMENT_SUFFIX = '.log'
+
+class JournalLane:
+    """One directory of append-only segment files plus an applied-sequence checkpoint.
+
+    Each segment is named after the sequence number of its first record and
+    holds one JSON line per scan. A lane is owned by whichever process holds
+    the flock on its lock file, so worker processes never share a lane.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_fd = None
+        self.applied = 0
+        self.pending = []
+        self._reader = None
+        os.makedirs(path, exist_ok=True)
+
+    def try_lock(self):
+        fd = os.open(os.path.join(self.path, 'lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.lock_fd = fd
+        self.applied = self._read_checkpoint()
+        self.pending = []
+        self._close_reader()
+        return True
+
+    def unlock(self):
+        self._close_reader()
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def segments(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.path)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def segment_path(self, start):
+        return os.path.join(self.path, f'{start:020d}{SEGMENT_SUFFIX}')
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, 'applied')) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, seq):
+        tmp_path = os.path.join(self.path, 'applied.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, 'applied'))
+
+    def recover(self):
+        """Drop a torn final line left by a crash; returns the next sequence number"""
+        last_seq = self.applied
+        segments = self.segments()
+        if segments:
+            path = self.segment_path(segments[-1])
+            with open(path, 'rb') as f:
+                data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                logging.warning(f"Truncating torn journal record in {path}")
+                os.truncate(path, end)
+            for line in reversed(data[:end].splitlines()):
+                try:
+                    last_seq = max(last_seq, json.loads(line)['seq'])
+                    break
+                except (ValueError, KeyError):
+                    continue
+            else:
+                last_seq = max(last_seq, segments[-1] - 1)
+        return last_seq + 1
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader[1].close()
+            self._reader = None
+
+    def _open_reader(self, segments):
+        # Start from the last segment that can hold the record after the checkpoint
+        candidates = [start for start in segments if start <= self.applied + 1]
+        start = candidates[-1] if candidates else segments[0]
+        self._reader = (start, open(self.segment_path(start), 'rb'))
+
+    def read_batch(self, limit):
+        """Return up to limit unapplied records in sequence order.
+
+        Records stay pending until mark_applied, so a failed batch is retried
+        as-is on the next call.
+        """
+        if self.pending:
+            return self.pending
+        last_seq = self.applied
+        while len(self.pending) < limit:
+            if self._reader is None:
+                segments = self.segments()
+                if not segments:
+                    break
+                self._open_reader(segments)
+            start, f = self._reader
+            line = f.readline()
+            if line.endswith(b'\n'):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.error(f"Skipping corrupt journal record in {self.segment_path(start)}")
+                    continue
+                if record['seq'] > last_seq:
+                    self.pending.append(record)
+                    last_seq = record['seq']
+                continue
+            # End of the written data: move on only once a newer segment exists
+            if line:
+                f.seek(-len(line), os.SEEK_CUR)
+            if not any(later > start for later in self.segments()):
+                break
+            if line:
+                logging.warning(f"Skipping torn journal record in {self.segment_path(start)}")
+            self._close_reader()
+            later = [segment for segment in self.segments() if segment > start]
+            self._reader = (later[0], open(self.segment_path(later[0]), 'rb'))
+        return self.pending
+
+    def mark_applied(self, seq):
+        """Checkpoint seq and delete segments whose records are all applied"""
+        self._write_checkpoint(seq)
+        self.applied = seq
+        self.pending = [record for record in self.pending if record['seq'] > seq]
+        segments = self.segments()
+        for start, next_start in zip(segments, segments[1:]):
+            if next_start - 1 <= seq:
+                try:
+                    os.remove(self.segment_path(start))
+                except FileNotFoundError:
+                    pass
+
+class ScanJournal:
+    """Local write-ahead journal for biometric scans.
+
+    append() writes the scan to this worker's lane and returns once it is on
+    disk; concurrent appends share one fsync. A drainer thread applies the
+    journal to the database in sequence order through ingest_scan_batch,
+    which ignores scans already stored, so replaying after a crash between
+    commit and checkpoint is harmless. A batch that fails for any reason but
+    a lost connection is retried scan by scan, and scans that keep failing
+    are moved to dead-letter.jsonl so they cannot hold up the lane, as are
+    scans the database rejects, such as cards of no active student. Lanes of
+    dead workers are adopted and drained by the survivors, and a restarted
+    worker replays its own lane. Disabled unless SCAN_JOURNAL_DIR is set.
+    """
+
+    def __init__(self, directory=None, segment_bytes=JOURNAL_SEGMENT_BYTES, drain_batch=JOURNAL_DRAIN_BATCH):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.drain_batch = drain_batch
+        self.appended = 0
+        self.applied = 0
+        self.dead_letters = 0
+        self.syncs = 0
+        self.last_error = None
+        self._app = None
+        self._pid = None
+        self._lane = None
+        self._fd = None
+        self._segment_size = 0
+        self._next_seq = 1
+        self._synced = 0
+        self._syncing = False
+        self._write_lock = threading.Lock()
+        self._sync_cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def start(self, app):
+        """Remember the app for the drainer; the lane is claimed lazily per process"""
+        self._app = app
+        if self.enabled:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        # Locks, descriptors and threads do not survive a fork, so claim a lane once per process
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lane = self._claim_lane()
+            self._next_seq = self._lane.recover()
+            self._synced = self._next_seq - 1
+            self._open_segment()
+            threading.Thread(target=self._drain_loop, name='scan-journal-drainer', daemon=True).start()
+            logging.info(f"Scan journal lane {self._lane.path} claimed, "
+                         f"{self._next_seq - 1 - self._lane.applied} scans to replay")
+
+    def _lane_paths(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.startswith('lane-'))
+
+    def _claim_lane(self):
+        for path in self._lane_paths():
+            lane = JournalLane(path)
+            if lane.try_lock():
+                return lane
+        index = 0
+        while True:
+            path = os.path.join(self.directory, f'lane-{index:03d}')
+            if not os.path.exists(path):
+                lane = JournalLane(path)
+                if lane.try_lock():
+                    return lane
+            index += 1
+
+    def _open_segment(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        self._fd = os.open(self._lane.segment_path(self._next_seq), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment_size = 0
+
+    def append(self, scan):
+        """Durably journal a validated scan payload; returns its sequence number"""
+        self._ensure_started()
+        with self._write_lock:
+            seq = self._next_seq
+            line = (json.dumps({'seq': seq, 'received_at': time.time(), 'scan': scan},
+                               separators=(',', ':')) + '\n').encode()
+            if self._segment_size and self._segment_size + len(line) > self.segment_bytes:
+                self._open_segment()
+                with self._sync_cond:
+                    self._synced = seq - 1
+            os.write(self._fd, line)
+            self._segment_size += len(line)
+            self._next_seq += 1
+            self.appended += 1
+        self._sync_through(seq)
+        self._wakeup.set()
+        return seq
+
+    def _sync_through(self, seq):
+        """Wait until seq is on disk; the first waiter fsyncs for everyone queued behind it"""
+        with self._sync_cond:
+            while self._synced < seq:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._sync_cond.wait()
+            else:
+                return
+
+        synced = None
+        try:
+            with self._write_lock:
+                target = self._next_seq - 1
+                os.fsync(self._fd)
+            synced = target
+            self.syncs += 1
+        finally:
+            with self._sync_cond:
+                self._syncing = False
+                if synced is not None:
+                    self._synced = max(self._synced, synced)
+                self._sync_cond.notify_all()
+
+    def _drain_loop(self):
+        backoff = JOURNAL_POLL_INTERVAL
+        last_adopt = 0
+        while True:
+            try:
+                if time.time() - last_adopt >= JOURNAL_ADOPT_INTERVAL:
+                    last_adopt = time.time()
+                    self._adopt_orphans()
+                drained = self._drain(self._lane)
+                backoff = JOURNAL_POLL_INTERVAL
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logging.error(f"Scan journal drain error: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, JOURNAL_MAX_BACKOFF)
+                continue
+            if not drained:
+                self._wakeup.wait(JOURNAL_POLL_INTERVAL)
+                self._wakeup.clear()
+
+    def _apply(self, scans):
+        from app import db
+        from ingest import ingest_scan_batch
+
+        with self._app.app_context():
+            try:
+                return ingest_scan_batch(scans)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _dead_letter_rejected(self, lane, records, results):
+        """Keep scans the database rejected, such as unknown cards, for someone to review.
+
+        Their scanners were told the scan was recorded when it was journaled.
+        """
+        for record, result in zip(records, results):
+            if not result['success']:
+                self._dead_letter(lane, record, result['message'])
+        return sum(1 for result in results if result['success'])
+
+    def _drain(self, lane):
+        """Apply one batch from a lane; returns the number of records applied or dead-lettered"""
+        records = lane.read_batch(self.drain_batch)
+        if not records:
+            return 0
+        try:
+            results = self._apply([record['scan'] for record in records])
+        except Exception as e:
+            # A lost connection fails every scan alike; back off and retry the batch
+            if is_connection_error(e):
+                raise
+            logging.warning(f"Scan journal batch failed, applying {len(records)} scans one by one: {e}")
+            return self._drain_each(lane, records)
+        applied = self._dead_letter_rejected(lane, records, results)
+        lane.mark_applied(records[-1]['seq'])
+        if lane is self._lane:
+            self.applied += applied
+        return len(records)
+
+    def _drain_each(self, lane, records):
+        """Apply records one at a time, dead-lettering those that fail every attempt"""
+        for record in records:
+            for attempt in range(JOURNAL_RECORD_ATTEMPTS):
+                try:
+                    results = self._apply([record['scan']])
+                    error = None
+                    break
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    error = e
+            if error is not None:
+                self._dead_letter(lane, record, error)
+            elif self._dead_letter_rejected(lane, [record], results) and lane is self._lane:
+                self.applied += 1
+            lane.mark_applied(record['seq'])
+        return len(records)
+
+    def _dead_letter(self, lane, record, error):
+        """Append a record that cannot be applied to the journal's dead-letter file"""
+        line = (json.dumps({'lane': os.path.basename(lane.path), 'failed_at': time.time(), 'error': str(error), **record},
+                           separators=(',', ':'), default=str) + '\n').encode()
+        fd = os.open(os.path.join(self.directory, DEAD_LETTER_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.dead_letters += 1
+        log_event('journal.dead_letter', logging.ERROR, lane=os.path.basename(lane.path), seq=record['seq'], error=error)
+
+    def _adopt_orphans(self):
+        """Drain lanes whose owning worker has exited, then release them"""
+        for path in self._lane_paths():
+            if path == self._lane.path:
+                continue
+            lane = JournalLane(path)
+            if not lane.segments() or not lane.try_lock():
+                continue
+            try:
+                total = 0
+                while True:
+                    drained = self._drain(lane)
+                    if not drained:
+                        break
+                    total += drained
+                if total:
+                    logging.info(f"Replayed {total} scans from orphaned journal lane {path}")
+            finally:
+                lane.unlock()
+
+    def stats(self):
+        """Queue depth and lag for this worker's lane"""
+        if not self.enabled or self._lane is None:
+            return {'enabled': self.enabled}
+        with self._write_lock:
+            last_seq = self._next_seq - 1
+        pending = self._lane.pending
+        head = pending[0]['received_at'] if pending else None
+        depth = max(last_seq - self._lane.applied, 0)
+        return {
+            'enabled': True,
+            'lane': os.path.basename(self._lane.path),
+            'depth': depth,
+            'lag_seconds': round(time.time() - head, 3) if head and depth else 0,
+            'appended': self.appended,
+            'applied': self.applied,
+            'dead_letters': self.dead_letters,
+            'fsyncs': self.syncs,
+            'segments': len(self._lane.segments()),
+            'last_error': self.last_error
+        }
+
+scan_journal = ScanJournal(os.environ.get("SCAN_JOURNAL_DIR"))
@@ -15,6 +15,13 @@ document.addEventListener('DOMContentLoaded', () => {
 // Global variables
 let currentUser = null;
 let filteredData = [];
+let filterPayload = null;
+let nextCursor = null;
+let totalRecords = 0;
+let loadingPage = false;
+let liveSource = null;
+let liveConnected = false;
+let totalStudents = 0;
 
 // Initialize application
 function initializeApp() {
@@ -46,6 +53,19 @@ function setupEventListeners() {
     if (downloadButton) {
         downloadButton.addEventListener('click', handleDownloadReport);
     }
+    
+    // Load the next page of results on click, or when the button scrolls into view
+    const loadMoreButton = document.getElementById('loadMoreButton');
+    if (loadMoreButton) {
+        loadMoreButton.addEventListener('click', loadNextPage);
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadNextPage();
+                }
+            }).observe(loadMoreButton);
+        }
+    }
 }
 
 // Set default date range (last 7 days)
@@ -76,6 +96,7 @@ function checkAuthStatus() {
             currentUser = JSON.parse(userData);
             showDashboard();
             loadDashboardData();
+            connectLiveFeed();
         } catch (error) {
             console.error('Error parsing user data:', error);
             showLogin();
@@ -123,6 +144,7 @@ async function handleLogin(event) {
             // Show dashboard
             showDashboard();
             loadDashboardData();
+            connectLiveFeed();
         } else {
             showError(loginError, result.message || 'Login failed');
         }
@@ -147,6 +169,7 @@ async function handleLogout() {
         
         if (result.success) {
             // Clear user data
+            disconnectLiveFeed();
             currentUser = null;
             sessionStorage.removeItem('userData');
             
@@ -156,6 +179,7 @@ async function handleLogout() {
     } catch (error) {
         console.error('Logout error:', error);
         // Force logout on error
+        disconnectLiveFeed();
         currentUser = null;
         sessionStorage.removeItem('userData');
         showLogin();
@@ -200,6 +224,7 @@ async function loadDashboardStats() {
         
         if (result.success) {
             const stats = result.stats;
+            totalStudents = stats.total_students;
             
             document.getElementById('total-students').textContent = stats.total_students;
             document.getElementById('today-attendance').textContent = stats.today_attendance;
@@ -225,20 +250,7 @@ async function loadRecentAttendance() {
                 return;
             }
             
-            let html = '';
-            recentData.forEach(record => {
-                html += `
-                    <div class="recent-item">
-                        <div class="recent-info">
-                            <h6>${record.name}</h6>
-                            <small>Roll: ${record.roll_number} | Location: ${record.location}</small>
-                        </div>
-                        <div class="recent-time">${formatDateTime(record.scan_time)}</div>
-                    </div>
-                `;
-            });
-            
-            recentContainer.innerHTML = html;
+            recentContainer.innerHTML = recentData.map(renderRecentItem).join('');
         }
     } catch (error) {
         console.error('Error loading recent attendance:', error);
@@ -247,6 +259,79 @@ async function loadRecentAttendance() {
     }
 }
 
+// Render one recent attendance entry
+function renderRecentItem(record) {
+    return `
+        <div class="recent-item">
+            <div class="recent-info">
+                <h6>${record.name}</h6>
+                <small>Roll: ${record.roll_number} | Location: ${record.location}</small>
+            </div>
+            <div class="recent-time">${formatDateTime(record.scan_time)}</div>
+        </div>
+    `;
+}
+
+// Subscribe to the server-sent live attendance feed
+function connectLiveFeed() {
+    if (!('EventSource' in window) || liveSource) {
+        return;
+    }
+    
+    liveSource = new EventSource('/api/live/stream');
+    
+    liveSource.addEventListener('open', () => {
+        // Catch up on anything missed while disconnected
+        if (!liveConnected) {
+            liveConnected = true;
+            loadDashboardData();
+        }
+    });
+    
+    liveSource.addEventListener('error', () => {
+        liveConnected = false;
+    });
+    
+    liveSource.addEventListener('scan', event => {
+        applyLiveScan(JSON.parse(event.data));
+    });
+    
+    liveSource.addEventListener('resync', () => {
+        loadDashboardData();
+    });
+}
+
+function disconnectLiveFeed() {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+    liveConnected = false;
+}
+
+// Apply a pushed scan to the dashboard counters and recent list
+function applyLiveScan(scan) {
+    const todayElement = document.getElementById('today-attendance');
+    if (todayElement && scan.delta.today_attendance) {
+        const todayAttendance = (parseInt(todayElement.textContent, 10) || 0) + scan.delta.today_attendance;
+        todayElement.textContent = todayAttendance;
+        const percentage = totalStudents > 0 ? (todayAttendance / totalStudents * 100) : 0;
+        document.getElementById('attendance-percentage').textContent = `${Math.round(percentage * 10) / 10}%`;
+    }
+    
+    const recentContainer = document.getElementById('recent-attendance');
+    if (recentContainer) {
+        if (!recentContainer.querySelector('.recent-item')) {
+            recentContainer.innerHTML = '';
+        }
+        recentContainer.insertAdjacentHTML('afterbegin', renderRecentItem(scan));
+        const items = recentContainer.querySelectorAll('.recent-item');
+        for (let i = 10; i < items.length; i++) {
+            items[i].remove();
+        }
+    }
+}
+
 // Handle filter data
 async function handleFilterData() {
     const showButton = document.getElementById('showButton');
@@ -257,7 +342,7 @@ async function handleFilterData() {
     showButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Loading...';
     
     try {
-        const filterData = {
+        filterPayload = {
             session: document.getElementById('session').value,
             campus: document.getElementById('campus').value,
             course: document.getElementById('course').value,
@@ -265,20 +350,14 @@ async function handleFilterData() {
             date_to: document.getElementById('date-to').value
         };
         
-        const response = await fetch('/api/attendance/filter', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(filterData)
-        });
-        
-        const result = await response.json();
+        const result = await fetchAttendancePage(null);
         
         if (result.success) {
             filteredData = result.data;
+            totalRecords = result.total;
+            nextCursor = result.next_cursor;
             displayFilteredData(filteredData);
-            updateRecordCount(filteredData.length);
+            updateRecordCount(filteredData.length, totalRecords);
         } else {
             showAlert('danger', result.message || 'Failed to filter data');
         }
@@ -292,6 +371,45 @@ async function handleFilterData() {
     }
 }
 
+// Fetch one page of filtered attendance, starting after the given cursor
+async function fetchAttendancePage(cursor) {
+    const response = await fetch('/api/attendance/filter', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ ...filterPayload, cursor: cursor })
+    });
+    
+    return response.json();
+}
+
+// Append the next page of results to the table
+async function loadNextPage() {
+    if (!nextCursor || loadingPage) {
+        return;
+    }
+    
+    loadingPage = true;
+    try {
+        const result = await fetchAttendancePage(nextCursor);
+        
+        if (result.success) {
+            displayFilteredData(result.data, filteredData.length);
+            filteredData = filteredData.concat(result.data);
+            nextCursor = result.next_cursor;
+            updateRecordCount(filteredData.length, totalRecords);
+        } else {
+            showAlert('danger', result.message || 'Failed to load more records');
+        }
+    } catch (error) {
+        console.error('Load more error:', error);
+        showAlert('danger', 'Network error. Please try again.');
+    } finally {
+        loadingPage = false;
+    }
+}
+
 // Handle download report
 async function handleDownloadReport() {
     if (filteredData.length === 0) {
@@ -350,11 +468,11 @@ async function handleDownloadReport() {
     }
 }
 
-// Display filtered data in table
-function displayFilteredData(data) {
+// Display filtered data in table, appending after `offset` existing rows when given
+function displayFilteredData(data, offset = 0) {
     const tableBody = document.getElementById('data-table-body');
     
-    if (data.length === 0) {
+    if (data.length === 0 && offset === 0) {
         tableBody.innerHTML = `
             <tr>
                 <td colspan="10" class="text-center text-muted">
@@ -370,7 +488,7 @@ function displayFilteredData(data) {
         const statusClass = getStatusClass(record.status);
         html += `
             <tr>
-                <td>${index + 1}</td>
+                <td>${offset + index + 1}</td>
                 <td>${escapeHtml(record.name)}</td>
                 <td>${escapeHtml(record.roll_number)}</td>
                 <td>${escapeHtml(record.session)}</td>
@@ -384,14 +502,24 @@ function displayFilteredData(data) {
         `;
     });
     
-    tableBody.innerHTML = html;
+    if (offset === 0) {
+        tableBody.innerHTML = html;
+    } else {
+        tableBody.insertAdjacentHTML('beforeend', html);
+    }
 }
 
-// Update record count
-function updateRecordCount(count) {
+// Update record count and the load more button
+function updateRecordCount(count, total) {
     const recordCount = document.getElementById('record-count');
     if (recordCount) {
-        recordCount.textContent = `${count} record${count !== 1 ? 's' : ''}`;
+        const shown = `${count} record${count !== 1 ? 's' : ''}`;
+        recordCount.textContent = total > count ? `${shown} of ${total}` : shown;
+    }
+    
+    const loadMoreButton = document.getElementById('loadMoreButton');
+    if (loadMoreButton) {
+        loadMoreButton.style.display = nextCursor ? 'inline-block' : 'none';
     }
 }
 
@@ -479,9 +607,9 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
-// Periodic data refresh (every 30 seconds)
+// Periodic data refresh (every 30 seconds), only while the live feed is unavailable
 setInterval(() => {
-    if (currentUser && document.getElementById('data-page').style.display !== 'none') {
+    if (currentUser && !liveConnected && document.getElementById('data-page').style.display !== 'none') {
         loadDashboardStats();
         loadRecentAttendance();
     }
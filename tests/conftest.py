@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Every test run gets its own SQLite database and archive directory
+_workdir = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'attendance.db')}"
+os.environ['ARCHIVE_DIR'] = os.path.join(_workdir, 'archive')
+
+from main import app as flask_app  # noqa: E402
+import app as app_module  # noqa: E402
+from app import db, init_database  # noqa: E402
+from commands import create_default_data  # noqa: E402
+from cache import student_cache, scan_index, journaled_scans  # noqa: E402
+from response_cache import response_cache  # noqa: E402
+from attendance_matrix import attendance_matrix  # noqa: E402
+
+# Tests drive the caches and the matrix themselves; no warmup thread may race
+# the per-test database
+app_module._services_pid = os.getpid()
+
+@pytest.fixture
+def app():
+    """The application with freshly created tables, default data and empty caches"""
+    with flask_app.app_context():
+        shutil.rmtree(os.environ['ARCHIVE_DIR'], ignore_errors=True)
+        db.drop_all(bind_key=None)
+        init_database()
+        create_default_data()
+        student_cache.clear()
+        scan_index.clear()
+        journaled_scans.clear()
+        response_cache.clear()
+        attendance_matrix._reset()
+        yield flask_app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as the default admin"""
+    from models import User
+    client = app.test_client()
+    admin = User.query.filter_by(role='admin').first()
+    with client.session_transaction() as session:
+        session['user_id'] = admin.id
+        session['user_role'] = 'admin'
+        session['username'] = admin.username
+    return client
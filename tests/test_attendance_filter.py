@@ -0,0 +1,37 @@
+from datetime import date
+
+import pytest
+
+from archive import archive_term
+from ingest import ingest_scan_batch
+
+def filter_page(client, **payload):
+    return client.post('/api/attendance/filter', json=payload)
+
+@pytest.fixture
+def scans(app):
+    ingest_scan_batch([
+        {'card_id': 'CARD001', 'timestamp': '2025-06-30T09:05:00'},
+        {'card_id': 'CARD002', 'timestamp': '2025-06-30T09:06:00'},
+        {'card_id': 'CARD001', 'timestamp': '2025-07-01T09:05:00'},
+        {'card_id': 'CARD002', 'timestamp': '2025-07-01T09:06:00'},
+        {'card_id': 'CARD004', 'timestamp': '2025-07-01T09:07:00'},
+    ])
+
+@pytest.mark.parametrize('limit', [0, -5, '0'])
+def test_limit_below_one_still_returns_a_page(client, scans, limit):
+    body = filter_page(client, limit=limit).get_json()
+    assert body['success'] and body['count'] == 1 and body['next_cursor']
+
+@pytest.mark.parametrize('limit', ['ten', '2.5', 2.5, [3], True])
+def test_non_integer_limit_is_rejected(client, scans, limit):
+    response = filter_page(client, limit=limit)
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': 'Page limit must be an integer'}
+
+def test_total_counts_only_the_live_rows_pages_read(client, scans):
+    assert filter_page(client).get_json()['total'] == 5
+    archive_term('2025-june', date(2025, 6, 1), date(2025, 6, 30))
+    body = filter_page(client, limit=100).get_json()
+    assert body['count'] == 3
+    assert body['total'] == 3
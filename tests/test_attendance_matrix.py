@@ -0,0 +1,49 @@
+import threading
+from datetime import date, datetime, time
+
+from app import db
+from attendance_matrix import attendance_matrix
+from cache import student_cache
+from ingest import ingest_scan_batch
+from live import scan_event
+from models import Student
+from utils import institution_today
+
+def test_scan_for_a_new_student_applies_without_an_app_context(app):
+    attendance_matrix.build()
+    db.session.add(Student(roll_number='006', card_id='CARD006', name='Dan Green', session='AN', campus='AEC', course='CE'))
+    db.session.commit()
+    student = student_cache.get('CARD006')
+    today = institution_today()
+    event = scan_event(student, datetime.combine(today, time(9, 0)), 'Main Campus', today)
+
+    # The file bus delivers events on its tailer thread, outside any app context
+    errors = []
+    def deliver():
+        try:
+            attendance_matrix.apply_scan(event)
+        except Exception as e:
+            errors.append(e)
+    tailer = threading.Thread(target=deliver)
+    tailer.start()
+    tailer.join()
+
+    assert errors == []
+    assert attendance_matrix.is_present(student.id, today)
+
+def test_student_changes_reload_groups_before_the_next_query(app):
+    ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-07-01T09:10:00'}])
+    attendance_matrix.build()
+    day = date(2025, 7, 1)
+    john = Student.query.filter_by(card_id='CARD001').one()
+    jane = Student.query.filter_by(card_id='CARD002').one()
+    assert attendance_matrix.present_counts(day, day, {'course': 'CE'}) == {john.id: 1}
+
+    # The commit publishes students.changed, which every worker's matrix receives
+    john.course = 'CSE'
+    jane.is_active = False
+    db.session.commit()
+
+    assert attendance_matrix.present_counts(day, day, {'course': 'CE'}) == {}
+    assert attendance_matrix.present_counts(day, day, {'course': 'CSE', 'campus': 'AEC'}) == {john.id: 1}
+    assert jane.id not in attendance_matrix.present_counts(day, day)
@@ -0,0 +1,49 @@
+from datetime import date, time
+
+import pytest
+
+from app import db
+from attendance_status import classify_scan, materialize_absences, OUTSIDE_SESSION, LATE_GRACE_MINUTES
+from ingest import ingest_scan_batch
+from models import AttendanceRecord, AttendanceSession, DailyAttendanceRollup
+
+# The default AN session runs 09:00-12:00
+GRACE_END = time(9, LATE_GRACE_MINUTES)
+
+@pytest.mark.parametrize('scan_time, status', [
+    (time(8, 30), 'present'),
+    (time(9, 0), 'present'),
+    (GRACE_END, 'present'),
+    (time(9, LATE_GRACE_MINUTES, 1), 'late'),
+    (time(12, 0), 'late'),
+    (time(12, 0, 1), OUTSIDE_SESSION),
+    (time(23, 59), OUTSIDE_SESSION),
+])
+def test_scans_are_classified_against_the_session_window(app, scan_time, status):
+    assert classify_scan('AN', scan_time) == status
+
+def test_scan_between_windows_counts_towards_the_next_one(app):
+    db.session.add(AttendanceSession(session_name='Evening Lab', session_code='AN',
+                                     start_time=time(14, 0), end_time=time(16, 0)))
+    db.session.commit()
+    assert classify_scan('AN', time(13, 0)) == 'present'
+    assert classify_scan('AN', time(14, 30)) == 'late'
+    assert classify_scan('AN', time(16, 0, 1)) == OUTSIDE_SESSION
+
+def test_session_without_windows_is_always_present(app):
+    assert classify_scan('NONE', time(23, 0)) == 'present'
+
+def test_scan_after_the_session_is_not_recorded(app, client):
+    [batch_result] = ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-07-01T18:00:00'}])
+    single = client.post('/api/biometric/scan', json={'card_id': 'CARD002', 'timestamp': '2025-07-01T18:00:00'}).get_json()
+    assert batch_result == single == {'success': False, 'message': 'Scan outside session hours'}
+    assert AttendanceRecord.query.count() == 0
+
+def test_marking_absences_twice_inserts_each_absence_once(app):
+    day = date(2025, 7, 1)
+    ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-07-01T09:05:00'}])
+    first = materialize_absences(day)
+    assert first == {'AN': 2, 'FN': 2}
+    assert materialize_absences(day) == {'AN': 0, 'FN': 0}
+    assert AttendanceRecord.query.filter_by(scan_date=day, status='absent').count() == 4
+    assert sum(rollup.absent for rollup in DailyAttendanceRollup.query.filter_by(scan_date=day)) == 4
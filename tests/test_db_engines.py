@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+import click
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, IntegrityError, DBAPIError
+
+import db_engines
+from app import create_app, db
+from db_engines import engine_options, is_connection_error, reading_from_replica, ReplicaHealth, REPLICA_BIND
+from models import Student
+
+PG_URL = 'postgresql://attendance@db/attendance'
+
+def test_primary_has_no_statement_timeout_by_default(monkeypatch):
+    monkeypatch.delenv('DB_STATEMENT_TIMEOUT_MS', raising=False)
+    assert 'connect_args' not in engine_options(PG_URL, 'DB')
+
+def test_unsupported_databases_are_rejected_at_startup(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'mysql://attendance@db/attendance')
+    with pytest.raises(ValueError, match="Unsupported database 'mysql' in DB"):
+        create_app()
+
+def test_configured_statement_timeout_applies_under_flask_run(monkeypatch):
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT_MS', '3000')
+    monkeypatch.setenv('DATABASE_URL', PG_URL)
+    # Only the options are under test; no PostgreSQL driver is needed to build them
+    monkeypatch.setattr(db, 'init_app', lambda app: None)
+    assert engine_options(PG_URL, 'DB')['connect_args'] == {'options': '-c statement_timeout=3000'}
+    # flask run builds the app inside a click context too; only commands lift the timeout
+    with click.Context(click.Command('run')):
+        app = create_app()
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] == {'options': '-c statement_timeout=3000'}
+
+def test_connection_errors():
+    assert is_connection_error(OperationalError('SELECT 1', {}, Exception('server closed the connection')))
+    assert is_connection_error(DBAPIError('SELECT 1', {}, Exception('reset'), connection_invalidated=True))
+    assert not is_connection_error(IntegrityError('INSERT', {}, Exception('duplicate key')))
+    assert not is_connection_error(ValueError('bad scan'))
+
+@pytest.fixture
+def replica_app(monkeypatch):
+    """An app whose replica bind is a second SQLite file, with fresh replica health"""
+    workdir = tempfile.mkdtemp(prefix='replica-tests-')
+    app = Flask('replica-tests')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'primary.db')}"
+    app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: f"sqlite:///{os.path.join(workdir, 'replica.db')}"}
+    db.init_app(app)
+    monkeypatch.setattr(db_engines, 'replica_health', ReplicaHealth())
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+def bound_to(clause):
+    return db.session.get_bind(clause=clause)
+
+def test_reads_use_the_replica_only_inside_a_read_scope(replica_app):
+    read = db.select(Student)
+    assert bound_to(read) is db.engines[None]
+    with reading_from_replica():
+        assert bound_to(read) is db.engines[REPLICA_BIND]
+        assert bound_to(db.delete(Student)) is db.engines[None]
+
+def test_reads_fall_back_to_the_primary_while_the_replica_is_down(replica_app):
+    health = db_engines.replica_health
+    health.mark_down(OperationalError('SELECT 1', {}, Exception('server closed the connection')))
+    with reading_from_replica():
+        assert bound_to(db.select(Student)) is db.engines[None]
+        assert bound_to(db.select(Student)) is db.engines[None]
+    assert health.stats()['fallbacks'] == 2
+    assert not health.stats()['healthy']
+
+def test_unreachable_replica_is_marked_down_until_a_probe_succeeds(replica_app):
+    health = db_engines.replica_health
+    unreachable = create_engine('sqlite:////nonexistent/replica.db')
+    assert not health.usable(unreachable)
+    assert 'unable to open database file' in health.stats()['last_error']
+
+    # Within the check interval the failed probe is not retried
+    assert not health.usable(db.engines[REPLICA_BIND])
+    health._checked_at -= health.check_interval
+    assert health.usable(db.engines[REPLICA_BIND])
+
+def test_long_running_commands_lift_the_statement_timeout(app, monkeypatch):
+    import commands
+    lifted = []
+    monkeypatch.setattr(commands, 'lift_statement_timeout', lifted.append)
+    result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+    assert result.exit_code == 0, result.output
+    assert lifted == [db.engines[None]]
@@ -0,0 +1,25 @@
+import json
+from datetime import date
+
+import pytest
+
+from archive import archive_term
+from ingest import ingest_scan_batch
+
+def export(client, export_format):
+    response = client.post('/api/attendance/download', json={'format': export_format})
+    assert response.status_code == 200
+    return response.get_data(as_text=True).splitlines()
+
+@pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+def test_archived_rows_export_exactly_like_live_rows(client, export_format):
+    ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-06-30T09:05:07.654321'}])
+    live = export(client, export_format)
+    archive_term('2025-june', date(2025, 6, 1), date(2025, 6, 30))
+    archived = export(client, export_format)
+    assert archived == live
+    if export_format == 'csv':
+        assert live[1] == 'John Doe,001,AN,AEC,CE,2025-06-30,09:05:07,Main Campus,present'
+    else:
+        row = json.loads(live[0])
+        assert (row['scan_date'], row['scan_time']) == ('2025-06-30', '09:05:07')
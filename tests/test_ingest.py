@@ -0,0 +1,28 @@
+from ingest import ingest_scan_batch
+
+def scan(card_id='CARD001', timestamp='2025-07-01T09:10:00', **fields):
+    return {'card_id': card_id, 'timestamp': timestamp, **fields}
+
+def test_malformed_items_do_not_fail_the_batch(app):
+    results = ingest_scan_batch([
+        scan(card_id=['CARD001']),
+        scan(card_id='CARD002'),
+        'not a scan',
+        scan(timestamp='0001-01-01T00:00:00+05:30'),
+        scan(card_id='CARD003', location={'room': 1}),
+        scan(card_id='CARD004'),
+    ])
+    assert [result['success'] for result in results] == [False, True, False, False, False, True]
+    assert [bool(result.get('invalid')) for result in results] == [True, False, True, True, True, False]
+    assert results[1]['roll_number'] == '002'
+    assert results[5]['roll_number'] == '004'
+
+def test_unknown_card_is_not_marked_invalid(app):
+    results = ingest_scan_batch([scan(card_id='NOPE'), scan()])
+    assert results[0] == {'success': False, 'message': 'Student not found'}
+    assert results[1]['success']
+
+def test_earliest_scan_of_the_day_wins(app):
+    results = ingest_scan_batch([scan(timestamp='2025-07-01T09:30:00'), scan(timestamp='2025-07-01T09:10:00')])
+    assert results[1]['message'] == 'Attendance recorded successfully'
+    assert results[0]['duplicate'] and results[0]['previous_time'] == '09:10:00'
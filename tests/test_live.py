@@ -0,0 +1,18 @@
+from live import broadcaster, limit_subscribers_to_threads
+
+def test_threaded_worker_keeps_most_threads_for_scans(monkeypatch):
+    monkeypatch.setattr(broadcaster, 'max_subscribers', broadcaster.max_subscribers)
+    limit_subscribers_to_threads(16)
+    assert broadcaster.max_subscribers == 4
+    limit_subscribers_to_threads(1)
+    assert broadcaster.max_subscribers == 0
+
+def test_live_stream_refuses_clients_beyond_the_limit(client, monkeypatch):
+    monkeypatch.setattr(broadcaster, 'max_subscribers', 1)
+    held = broadcaster.subscribe()
+    try:
+        response = client.get('/api/live/stream')
+        assert response.status_code == 503
+        assert response.get_json()['message'] == 'Too many live connections'
+    finally:
+        broadcaster.unsubscribe(held)
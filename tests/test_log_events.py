@@ -0,0 +1,58 @@
+import io
+import json
+import logging
+
+import log_events
+from log_events import BackgroundQueueHandler, JsonFormatter, log_event
+
+def events(caplog):
+    return [record for record in caplog.records if record.name == 'attendance.test']
+
+def test_events_are_formatted_as_one_json_object(caplog):
+    caplog.set_level(logging.INFO, logger='attendance.test')
+    log_event('test.recorded', roll_number='001', scan_time='09:10:00')
+    [record] = events(caplog)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['event'] == 'test.recorded' and entry['roll_number'] == '001'
+    assert entry['logger'] == 'attendance.test' and entry['level'] == 'INFO'
+    assert record.getMessage() == 'test.recorded roll_number=001 scan_time=09:10:00'
+
+def test_quieted_categories_skip_the_event(caplog):
+    caplog.set_level(logging.WARNING, logger='attendance.test')
+    log_event('test.recorded', roll_number='001')
+    log_event('test.unknown_card', logging.WARNING, card_id='NOPE')
+    assert [record.event for record in events(caplog)] == ['test.unknown_card']
+
+def test_sampled_events_carry_their_rate(caplog, monkeypatch):
+    caplog.set_level(logging.INFO, logger='attendance.test')
+    monkeypatch.setattr(log_events, 'SAMPLE_RATES', {'test.duplicate': 0.25})
+    draws = iter([0.1, 0.9])
+    monkeypatch.setattr(log_events.random, 'random', lambda: next(draws))
+    log_event('test.duplicate', roll_number='001')
+    log_event('test.duplicate', roll_number='002')
+    assert [(record.fields['roll_number'], record.fields['sample_rate']) for record in events(caplog)] == [('001', 0.25)]
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = BackgroundQueueHandler([logging.NullHandler()], maxsize=2)
+    logger = logging.Logger('queue-test')
+    logger.addHandler(handler)
+    for index in range(5):
+        logger.error(f'record {index}')
+    assert handler.stats() == {'queued': 2, 'dropped': 3}
+
+def test_writer_thread_formats_and_writes_records():
+    output = io.StringIO()
+    target = logging.StreamHandler(output)
+    target.setFormatter(JsonFormatter())
+    handler = BackgroundQueueHandler([target])
+    handler.start()
+    logger = logging.Logger('writer-test')
+    logger.addHandler(handler)
+    try:
+        raise ValueError('bad scan')
+    except ValueError:
+        logger.exception('Scan failed')
+    handler.stop()
+    entry = json.loads(output.getvalue())
+    assert entry['message'] == 'Scan failed'
+    assert 'ValueError: bad scan' in entry['exc']
@@ -0,0 +1,39 @@
+import logging
+
+from app import create_app
+from metrics import metrics, render_prometheus, _ErrorCounter
+
+def error_counters():
+    return [handler for handler in logging.getLogger().handlers if isinstance(handler, _ErrorCounter)]
+
+def test_creating_another_app_does_not_add_another_error_counter(app):
+    before = len(error_counters())
+    create_app()
+    assert len(error_counters()) == before == 1
+
+def test_requests_are_counted_and_leave_the_in_flight_gauge(client):
+    before = metrics.requests.get(('main.get_students', 'GET', 200), 0)
+    assert client.get('/api/students').get_json()['success']
+    assert metrics.requests[('main.get_students', 'GET', 200)] == before + 1
+    assert metrics.in_flight['main.get_students'] == 0
+    assert 'attendance_http_requests_total{endpoint="main.get_students",method="GET",status="200"}' in render_prometheus()
+
+def test_logged_errors_count_as_failed_requests(client, monkeypatch):
+    import routes
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(routes, 'rollup_summary', broken)
+    before = metrics.errors.get('main.attendance_summary', 0)
+    assert not client.post('/api/attendance/summary', json={}).get_json()['success']
+    assert metrics.errors['main.attendance_summary'] == before + 1
+
+def test_live_stream_is_left_out_of_request_timing(client):
+    def timed():
+        histogram = metrics.latency.get('main.live_stream')
+        return histogram.count if histogram else 0
+    before = timed()
+    response = client.get('/api/live/stream')
+    assert response.mimetype == 'text/event-stream'
+    response.close()
+    assert timed() == before
+    assert 'main.live_stream' not in metrics.in_flight
@@ -0,0 +1,56 @@
+from datetime import date, time
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from utils import parse_scan, parse_scans, MAX_CARD_ID_LENGTH, MAX_SCANNER_ID_LENGTH, MAX_LOCATION_LENGTH
+
+KOLKATA = ZoneInfo('Asia/Kolkata')
+
+def payload(**fields):
+    data = {'card_id': 'CARD001', 'timestamp': '2025-07-01T09:10:00'}
+    data.update(fields)
+    return data
+
+def test_valid_payload_defaults():
+    scan = parse_scan(payload(), KOLKATA)
+    assert scan.card_id == 'CARD001'
+    assert scan.scan_date == date(2025, 7, 1)
+    assert scan.scan_time == time(9, 10)
+    assert scan.scanner_id == 'unknown'
+    assert scan.location == 'Main Campus'
+
+def test_card_id_is_stripped():
+    assert parse_scan(payload(card_id='  CARD001 \n'), KOLKATA).card_id == 'CARD001'
+
+@pytest.mark.parametrize('card_id', [['CARD001'], {'id': 'CARD001'}, 1001, 10.5, True, None, '', '   ',
+                                     'C' * (MAX_CARD_ID_LENGTH + 1)])
+def test_invalid_card_id(card_id):
+    assert parse_scan(payload(card_id=card_id), KOLKATA) is None
+
+@pytest.mark.parametrize('scanner_id', [['S1'], {'id': 'S1'}, 7, 'S' * (MAX_SCANNER_ID_LENGTH + 1)])
+def test_invalid_scanner_id(scanner_id):
+    assert parse_scan(payload(scanner_id=scanner_id), KOLKATA) is None
+
+@pytest.mark.parametrize('location', [['Gate'], {'name': 'Gate'}, 3, 'L' * (MAX_LOCATION_LENGTH + 1)])
+def test_invalid_location(location):
+    assert parse_scan(payload(location=location), KOLKATA) is None
+
+def test_text_fields_kept():
+    scan = parse_scan(payload(scanner_id='S1', location='North Gate'), KOLKATA)
+    assert (scan.scanner_id, scan.location) == ('S1', 'North Gate')
+
+@pytest.mark.parametrize('timestamp', [None, '', 20250701, ['2025-07-01T09:10:00'], 'yesterday'])
+def test_invalid_timestamp(timestamp):
+    assert parse_scan(payload(timestamp=timestamp), KOLKATA) is None
+
+@pytest.mark.parametrize('timestamp', ['2025-07-01T03:40:00Z', '2025-07-01T09:10:00+05:30',
+                                       '2025-06-30T23:40:00-04:00'])
+def test_aware_timestamps_convert_to_institution_time(timestamp):
+    scan = parse_scan(payload(timestamp=timestamp), KOLKATA)
+    assert (scan.scan_date, scan.scan_time) == (date(2025, 7, 1), time(9, 10))
+    assert scan.scan_datetime.tzinfo is None
+
+def test_parse_scans_marks_only_bad_entries():
+    parsed = parse_scans([payload(), payload(card_id=['x']), 'not a dict', payload(card_id='CARD002')], KOLKATA)
+    assert [scan.card_id if scan else None for scan in parsed] == ['CARD001', None, None, 'CARD002']
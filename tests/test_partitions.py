@@ -0,0 +1,58 @@
+from datetime import date
+
+from partitions import next_month, partition_name, ensure_partitions
+
+class FakeResult:
+    def __init__(self, rows=(), scalar=0):
+        self.rows = rows
+        self._scalar = scalar
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar(self):
+        return self._scalar
+
+class FakeConnection:
+    """Records statements; the catalog holds existing partitions and stray default rows per month"""
+
+    def __init__(self, existing=(), stray=None):
+        self.existing = existing
+        self.stray = stray or {}
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if 'pg_inherits' in sql:
+            return FakeResult([(name,) for name in self.existing])
+        if sql.startswith('SELECT count(*)'):
+            return FakeResult(scalar=self.stray.get(params['start'], 0))
+        return FakeResult()
+
+def test_months_roll_over_the_year():
+    assert next_month(date(2025, 12, 1)) == date(2026, 1, 1)
+    assert next_month(date(2025, 6, 1)) == date(2025, 7, 1)
+    assert partition_name(date(2025, 6, 1)) == 'attendance_records_y2025m06'
+
+def test_only_missing_months_are_created(app):
+    connection = FakeConnection(existing={'attendance_records_y2025m06'})
+    created = ensure_partitions(connection, date(2025, 6, 15), date(2025, 8, 1))
+    assert created == ['attendance_records_y2025m07', 'attendance_records_y2025m08']
+    creates = [sql for sql in connection.statements if sql.startswith('CREATE TABLE')]
+    assert creates[0].endswith("FOR VALUES FROM ('2025-07-01') TO ('2025-08-01')")
+    assert not any('DETACH' in sql for sql in connection.statements)
+
+def test_rows_in_the_default_partition_move_to_the_new_month(app):
+    connection = FakeConnection(stray={date(2025, 7, 1): 3})
+    ensure_partitions(connection, date(2025, 7, 1), date(2025, 7, 1))
+    steps = [' '.join(sql.split()[:2]) for sql in connection.statements[2:]]
+    assert steps == ['ALTER TABLE', 'CREATE TABLE', 'INSERT INTO', 'DELETE FROM', 'ALTER TABLE']
+    assert 'DETACH PARTITION' in connection.statements[2] and connection.statements[-1].endswith('DEFAULT')
+
+def test_partitioning_needs_postgresql(app):
+    result = app.test_cli_runner().invoke(args=['partition-attendance'])
+    assert result.exit_code != 0
+    assert 'Native partitioning needs PostgreSQL' in result.output
+    result = app.test_cli_runner().invoke(args=['ensure-partitions'])
+    assert 'Native partitioning needs PostgreSQL' in result.output
@@ -0,0 +1,72 @@
+from datetime import date, datetime
+
+from app import db
+from archive import archive_term
+from attendance_matrix import attendance_matrix
+from ingest import ingest_scan_batch
+from models import AcademicHoliday, Student
+from percentages import attendance_percentages, working_days
+
+JUNE = {'date_from': '2025-06-02', 'date_to': '2025-06-03'}
+
+def by_roll(rows):
+    return {row['roll_number']: row for row in rows}
+
+def record_june_scans():
+    ingest_scan_batch([
+        {'card_id': 'CARD001', 'timestamp': '2025-06-02T09:05:00'},
+        {'card_id': 'CARD001', 'timestamp': '2025-06-03T09:05:00'},
+        {'card_id': 'CARD002', 'timestamp': '2025-06-02T09:05:00'},
+    ])
+
+def test_archived_days_still_count_towards_percentages(app):
+    record_june_scans()
+    live = by_roll(attendance_percentages(JUNE)[0])
+    archive_term('2025-june', date(2025, 6, 1), date(2025, 6, 30))
+    archived = by_roll(attendance_percentages(JUNE)[0])
+    assert archived == live
+    assert archived['001']['percentage'] == 100.0 and not archived['001']['defaulter']
+    assert archived['002']['attended_days'] == 1 and archived['002']['working_days'] == 2
+
+def test_attendance_matrix_built_after_archiving_includes_archived_days(app):
+    record_june_scans()
+    archive_term('2025-june', date(2025, 6, 1), date(2025, 6, 30))
+    attendance_matrix.build()
+    totals = attendance_matrix.group_daily_totals(date(2025, 6, 2), date(2025, 6, 3), ('session',))
+    assert totals[('AN',)] == [2, 1]
+
+def test_working_days_skip_sundays_and_holidays(app):
+    # 2025-06-01 is a Sunday
+    db.session.add(AcademicHoliday(holiday_date=date(2025, 6, 3), description='Founders Day'))
+    db.session.add(AcademicHoliday(holiday_date=date(2025, 6, 4), description='FN exam', session_code='FN'))
+    db.session.commit()
+    days = working_days(date(2025, 6, 1), date(2025, 6, 4))
+    assert days == {'AN': [date(2025, 6, 2), date(2025, 6, 4)], 'FN': [date(2025, 6, 2)]}
+
+def test_working_days_start_when_a_student_enrolled(app):
+    record_june_scans()
+    late_joiner = Student(roll_number='006', card_id='CARD006', name='Dan Green', session='AN',
+                          campus='AEC', course='CE', created_at=datetime(2025, 6, 3, 4, 0))
+    db.session.add(late_joiner)
+    for student in Student.query.filter(Student.roll_number != '006'):
+        student.created_at = datetime(2025, 5, 1)
+    db.session.commit()
+    ingest_scan_batch([{'card_id': 'CARD006', 'timestamp': '2025-06-03T09:05:00'}])
+
+    rows = by_roll(attendance_percentages(JUNE)[0])
+    assert rows['006']['working_days'] == 1 and rows['006']['percentage'] == 100.0
+    assert rows['002']['working_days'] == 2 and rows['002']['percentage'] == 50.0
+    assert rows['004']['working_days'] == 2 and rows['004']['defaulter']
+
+def test_attendance_before_enrollment_extends_working_days(app):
+    # Students seeded today, with attendance recorded before that (a roster imported late)
+    record_june_scans()
+    rows = by_roll(attendance_percentages(JUNE)[0])
+    assert rows['001']['working_days'] == 2 and rows['001']['percentage'] == 100.0
+
+def test_holiday_session_must_be_a_configured_session(client):
+    response = client.post('/api/calendar/holidays', json={'date': '2025-06-03', 'description': 'Exam', 'session': 'XX'})
+    assert response.get_json() == {'success': False, 'message': 'Unknown session XX'}
+    response = client.post('/api/calendar/holidays', json={'date': '2025-06-03', 'description': 'Exam', 'session': 'FN'})
+    assert response.get_json()['success']
+    assert AcademicHoliday.query.one().session_code == 'FN'
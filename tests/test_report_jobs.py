@@ -0,0 +1,79 @@
+import os
+import json
+import time
+
+import pytest
+
+from ingest import ingest_scan_batch
+from report_jobs import ReportJobs, REPORT_JOB_STALE_AFTER, normalize_report_filters
+
+FILTERS = normalize_report_filters({'session': 'AN'})
+
+class HeldExecutor:
+    """Keeps submitted jobs queued until run() is called"""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run(self):
+        for fn, args in self.calls:
+            fn(*args)
+
+@pytest.fixture
+def jobs(app, tmp_path):
+    jobs = ReportJobs(directory=str(tmp_path))
+    jobs.executor = HeldExecutor()
+    jobs._get_executor = lambda: jobs.executor
+    return jobs
+
+def markers(jobs):
+    return [name for name in os.listdir(jobs.directory) if name.endswith('.inflight')]
+
+def test_identical_requests_share_one_job(app, jobs):
+    first, coalesced = jobs.submit(app, FILTERS)
+    assert not coalesced
+    second, coalesced = jobs.submit(app, dict(FILTERS))
+    assert coalesced and second['job_id'] == first['job_id']
+    assert len(jobs.executor.calls) == 1
+    assert len(markers(jobs)) == 1
+
+def test_only_one_claim_of_a_marker_wins(jobs):
+    assert jobs._claim('key', 'a' * 32)
+    assert not jobs._claim('key', 'b' * 32)
+    with open(os.path.join(jobs.directory, 'key.inflight')) as f:
+        assert json.load(f) == {'job_id': 'a' * 32}
+
+def test_finished_job_writes_the_report_and_releases_its_marker(app, jobs):
+    ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-07-01T09:10:00'}])
+    job, _ = jobs.submit(app, FILTERS)
+    jobs.executor.run()
+    job = jobs.get(job['job_id'])
+    assert job['status'] == 'done' and job['rows_written'] == 1
+    assert os.path.exists(jobs.artifact_path(job['job_id']))
+    assert markers(jobs) == []
+
+def test_marker_left_by_a_crash_does_not_block_new_jobs(app, jobs):
+    first, _ = jobs.submit(app, FILTERS)
+    key = first['key']
+    os.remove(os.path.join(jobs.directory, f"{first['job_id']}.json"))
+    job, coalesced = jobs.submit(app, FILTERS)
+    assert not coalesced and job['job_id'] != first['job_id']
+    with open(os.path.join(jobs.directory, f'{key}.inflight')) as f:
+        assert json.load(f) == {'job_id': job['job_id']}
+
+def test_purge_fails_abandoned_jobs_and_drops_their_markers(app, jobs):
+    job, _ = jobs.submit(app, FILTERS)
+    jobs._save(job, status='running')
+    job['updated_at'] = time.time() - REPORT_JOB_STALE_AFTER - 1
+    jobs._write_json(f"{job['job_id']}.json", job)
+    empty_marker = os.path.join(jobs.directory, 'torn.inflight')
+    open(empty_marker, 'w').close()
+    os.utime(empty_marker, (0, 0))
+
+    jobs._last_purge = 0
+    jobs.purge_expired()
+    assert jobs.get(job['job_id'])['status'] == 'failed'
+    assert markers(jobs) == []
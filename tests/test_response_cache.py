@@ -0,0 +1,74 @@
+import response_cache as response_cache_module
+from live import broadcaster
+from response_cache import ResponseCache, response_cache
+
+FILTERS = {'session': 'AN', 'campus': None, 'course': None, 'date_from': '2025-07-01', 'date_to': '2025-07-01'}
+
+def scan(scan_date, session='AN'):
+    return {'type': 'scan', 'session': session, 'campus': 'AEC', 'course': 'CE', 'scan_date': scan_date}
+
+def test_unrelated_scan_during_compute_does_not_block_caching():
+    cache = ResponseCache()
+    generation = cache.generation('attendance')
+    cache.invalidate_scan(scan('2025-07-02'))
+    cache.invalidate_scan(scan('2025-07-01', session='FN'))
+    cache.put('key', b'{}', 'attendance', FILTERS, generation)
+    assert cache.get('key') is not None
+
+def test_matching_scan_during_compute_is_not_cached():
+    cache = ResponseCache()
+    generation = cache.generation('attendance')
+    cache.invalidate_scan(scan('2025-07-01'))
+    cache.put('key', b'{}', 'attendance', FILTERS, generation)
+    assert cache.get('key') is None
+
+def test_matching_scan_evicts_only_affected_entries():
+    cache = ResponseCache()
+    cache.put('july-1', b'{}', 'attendance', FILTERS, cache.generation('attendance'))
+    cache.put('july-2', b'{}', 'attendance', dict(FILTERS, date_from='2025-07-02', date_to='2025-07-02'),
+              cache.generation('attendance'))
+    cache.invalidate_scan(scan('2025-07-02'))
+    assert cache.get('july-1') is not None
+    assert cache.get('july-2') is None
+
+def test_holiday_change_clears_every_workers_responses(client, monkeypatch):
+    published = []
+    monkeypatch.setattr(response_cache_module, 'publish_event', published.append)
+    response = client.post('/api/calendar/holidays', json={'date': '2025-08-15', 'description': 'Independence Day'})
+    assert response.get_json()['success']
+    assert published == [{'type': 'responses.changed'}]
+
+def test_responses_changed_event_clears_this_workers_cache():
+    response_cache.put('key', b'{}', 'dashboard', {}, response_cache.generation('dashboard'))
+    broadcaster.deliver({'type': 'responses.changed'})
+    assert response_cache.get('key') is None
+
+def test_conditional_requests_get_304_until_the_data_changes(client):
+    from app import db
+    from models import Student
+    first = client.get('/api/students')
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert client.get('/api/students', headers={'If-None-Match': etag}).status_code == 304
+
+    Student.query.filter_by(card_id='CARD001').one().name = 'John Q. Doe'
+    db.session.commit()
+    changed = client.get('/api/students', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert 'John Q. Doe' in {student['name'] for student in changed.get_json()['data']}
+
+def test_matching_scan_refreshes_a_cached_filter_response(client):
+    from ingest import ingest_scan_batch
+    query = {'date_from': '2025-07-01', 'date_to': '2025-07-01'}
+    assert client.post('/api/attendance/filter', json=query).get_json()['total'] == 0
+    hits = response_cache.hits
+    assert client.post('/api/attendance/filter', json=query).get_json()['total'] == 0
+    assert response_cache.hits == hits + 1
+
+    ingest_scan_batch([{'card_id': 'CARD001', 'timestamp': '2025-07-01T09:10:00'}])
+    assert client.post('/api/attendance/filter', json=query).get_json()['total'] == 1
+
+def test_unauthenticated_requests_are_not_cached(app):
+    response = app.test_client().get('/api/students')
+    assert response.get_json() == {'success': False, 'message': 'Authentication required'}
+    assert 'ETag' not in response.headers
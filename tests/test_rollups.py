@@ -0,0 +1,52 @@
+from app import db
+from models import Student, DailyAttendanceRollup
+from ingest import ingest_scan_batch
+from rollups import rebuild_rollups, rollup_summary
+from roster_import import import_roster
+
+def scan(card_id, timestamp):
+    return {'card_id': card_id, 'timestamp': timestamp}
+
+def rollups():
+    return sorted(
+        (row.scan_date, row.session, row.campus, row.course, row.present, row.late, row.absent)
+        for row in DailyAttendanceRollup.query.all()
+    )
+
+def record_scans():
+    ingest_scan_batch([
+        scan('CARD001', '2025-07-01T09:10:00'),
+        scan('CARD002', '2025-07-01T09:12:00'),
+        scan('CARD001', '2025-07-02T09:10:00'),
+    ])
+
+def test_ingest_keeps_rollups_equal_to_a_rebuild(app):
+    record_scans()
+    incremental = rollups()
+    rebuild_rollups()
+    assert rollups() == incremental
+
+def test_rollup_summary_counts_the_filtered_records(app):
+    record_scans()
+    summary = rollup_summary({'session': 'AN', 'course': 'CE'})
+    assert summary['total'] == 2
+    assert summary['present'] + summary['late'] + summary['absent'] == 2
+
+def test_editing_a_students_group_moves_their_rollups(app):
+    record_scans()
+    student = Student.query.filter_by(card_id='CARD001').one()
+    student.course = 'CSE'
+    db.session.commit()
+    moved = rollups()
+    assert all(row[3] != 'CE' for row in moved)
+    rebuild_rollups()
+    assert rollups() == moved
+
+def test_roster_import_moves_regrouped_students_rollups(app):
+    record_scans()
+    row = {'roll_number': '001', 'card_id': 'CARD001', 'name': 'John Doe', 'session': 'FN', 'campus': 'AEC', 'course': 'CE'}
+    assert import_roster([(2, row)]).imported == 1
+    assert rollup_summary({'session': 'FN', 'campus': 'AEC', 'course': 'CE'})['total'] == 2
+    moved = rollups()
+    rebuild_rollups()
+    assert rollups() == moved
@@ -0,0 +1,71 @@
+import io
+
+from openpyxl import Workbook
+
+from models import Student
+from roster_import import import_roster, iter_roster_rows, validate_roster_row
+
+HEADER = 'Roll Number,Card ID,Name,Session,Campus,Course,Year\n'
+
+def row(**fields):
+    values = {'roll_number': '101', 'card_id': 'CARD101', 'name': 'Eve Adams', 'session': 'an',
+              'campus': 'aec', 'course': 'CSE', 'year': '2'}
+    values.update(fields)
+    return values
+
+def test_valid_row_is_normalised():
+    values, error = validate_roster_row(row())
+    assert error is None
+    assert values == {'roll_number': '101', 'card_id': 'CARD101', 'name': 'Eve Adams', 'session': 'AN',
+                      'campus': 'AEC', 'course': 'CSE', 'year': 2, 'is_active': True}
+
+def test_invalid_rows_are_explained():
+    assert validate_roster_row(row(name='  '))[1] == 'Missing name'
+    assert validate_roster_row(row(session='XX'))[1] == 'Unknown session XX'
+    assert validate_roster_row(row(campus='MIT'))[1] == 'Unknown campus MIT'
+    assert validate_roster_row(row(year='second'))[1] == 'Invalid year second'
+    assert validate_roster_row(row(roll_number='9' * 21))[1] == 'roll_number longer than 20 characters'
+
+def test_csv_import_reports_each_rejected_line(app):
+    roster = (HEADER + '101,CARD101,Eve Adams,AN,AEC,CSE,2\n'
+              '\n'
+              '102,CARD102,Frank Lee,XX,AEC,CSE,1\n'
+              '101,CARD103,Eve Again,AN,AEC,CSE,1\n'
+              '104,CARD001,Card Thief,AN,AEC,CSE,1\n')
+    report = import_roster(iter_roster_rows(io.BytesIO(roster.encode()), 'roster.csv'))
+    assert (report.rows, report.imported) == (4, 1)
+    assert [(error['line'], error['error']) for error in report.errors] == [
+        (4, 'Unknown session XX'),
+        (5, 'Duplicate roll_number in file'),
+        (6, 'card_id already assigned to roll number 001'),
+    ]
+    assert Student.query.filter_by(roll_number='101').one().year == 2
+    assert Student.query.filter_by(card_id='CARD001').one().roll_number == '001'
+
+def test_import_updates_existing_students_by_roll_number(app):
+    roster = HEADER + '001,CARD001,John Q. Doe,AN,AEC,CE,3\n'
+    report = import_roster(iter_roster_rows(io.BytesIO(roster.encode()), 'roster.csv'))
+    assert report.imported == 1 and not report.errors
+    student = Student.query.filter_by(roll_number='001').one()
+    assert (student.name, student.year) == ('John Q. Doe', 3)
+
+def test_xlsx_rosters_are_read_row_by_row(app):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Roll Number', 'Card ID', 'Name', 'Session', 'Campus', 'Course'])
+    sheet.append(['201', 'CARD201', 'Grace Hall', 'FN', 'ACET', 'ECE'])
+    sheet.append([None] * 6)
+    sheet.append([202, 'CARD202', 'Henry Ford', 'FN', 'ACET', 'ECE'])
+    stream = io.BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+    report = import_roster(iter_roster_rows(stream, 'roster.xlsx'))
+    assert (report.rows, report.imported, report.errors) == (2, 2, [])
+    assert Student.query.filter_by(roll_number='202').one().year == 1
+
+def test_only_admins_may_import(client):
+    with client.session_transaction() as session:
+        session['user_role'] = 'staff'
+    data = {'file': (io.BytesIO(HEADER.encode()), 'roster.csv')}
+    response = client.post('/api/students/import', data=data, content_type='multipart/form-data')
+    assert response.get_json() == {'success': False, 'message': 'Admin access required'}
@@ -0,0 +1,57 @@
+import re
+import json
+import asyncio
+
+import ingest
+from scan_gateway import ScanGateway, SCAN_PATH
+
+def scan(card_id, timestamp='2025-07-01T09:10:00'):
+    return {'card_id': card_id, 'timestamp': timestamp}
+
+async def _exchange(gateway, requests):
+    gateway._queue = asyncio.Queue()
+    batcher = asyncio.create_task(gateway._batcher())
+    server = await asyncio.start_server(gateway.handle_connection, '127.0.0.1', 0)
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+    responses = []
+    try:
+        # Every request goes over the same keep-alive connection
+        for method, path, body in requests:
+            body = body if isinstance(body, bytes) else json.dumps(body).encode()
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(re.search(rb'Content-Length: (\d+)', head).group(1))
+            responses.append((int(head.split()[1]), json.loads(await reader.readexactly(length))))
+    finally:
+        writer.close()
+        server.close()
+        batcher.cancel()
+    return responses
+
+def exchange(app, *requests):
+    return asyncio.run(_exchange(ScanGateway(app, batch_window=0.001), requests))
+
+def test_gateway_answers_like_the_flask_endpoint(app, client):
+    gateway_responses = exchange(app, ('POST', SCAN_PATH, scan('CARD001')), ('POST', SCAN_PATH, scan('CARD001')),
+                                 ('POST', SCAN_PATH, scan('NOPE')), ('POST', SCAN_PATH, b'not json'))
+    flask_responses = [client.post(SCAN_PATH, json=payload).get_json()
+                       for payload in (scan('CARD002'), scan('CARD002'), scan('NOPE'), {'card_id': 'CARD002'})]
+
+    assert [status for status, _ in gateway_responses] == [200] * 4
+    for (_, gateway_body), flask_body in zip(gateway_responses, flask_responses):
+        assert gateway_body.keys() == flask_body.keys()
+        assert gateway_body['message'] == flask_body['message']
+    assert gateway_responses[3][1] == {'success': False, 'message': 'Invalid biometric data format'}
+
+def test_gateway_parses_each_scan_once(app, monkeypatch):
+    def parse_again(payloads):
+        raise AssertionError('scan parsed a second time')
+    monkeypatch.setattr(ingest, 'parse_scans', parse_again)
+    [(status, body)] = exchange(app, ('POST', SCAN_PATH, scan('CARD001')))
+    assert body['message'] == 'Attendance recorded successfully'
+
+def test_unknown_paths_and_methods(app):
+    responses = exchange(app, ('GET', SCAN_PATH, b''), ('GET', '/nowhere', b''), ('GET', '/health', b''))
+    assert [status for status, _ in responses] == [405, 404, 200]
+    assert responses[2][1]['stats']['connections'] == 1
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import ingest
+import routes
+from cache import student_cache
+from scan_journal import ScanJournal, JournalLane, DEAD_LETTER_FILE
+
+def scan(card_id):
+    return {'card_id': card_id, 'timestamp': '2025-07-01T09:10:00'}
+
+@pytest.fixture
+def journal(app, tmp_path):
+    """A journal over one locked lane holding four scans, drained by hand rather than by its thread"""
+    journal = ScanJournal(str(tmp_path))
+    journal._app = app
+    lane = journal._lane = JournalLane(str(tmp_path / 'lane-000'))
+    lane.try_lock()
+    with open(lane.segment_path(1), 'w') as f:
+        for seq, card_id in enumerate(['CARD001', 'POISON', 'CARD002', 'CARD003'], 1):
+            f.write(json.dumps({'seq': seq, 'received_at': 0, 'scan': scan(card_id)}) + '\n')
+    yield journal
+    lane.unlock()
+
+def failing_on(card_id, error):
+    real_ingest = ingest.ingest_scan_batch
+    def ingest_scan_batch(payloads):
+        if any(payload['card_id'] == card_id for payload in payloads):
+            raise error
+        return real_ingest(payloads)
+    return ingest_scan_batch
+
+def test_poison_scan_is_dead_lettered_and_the_lane_moves_on(journal, monkeypatch):
+    monkeypatch.setattr(ingest, 'ingest_scan_batch', failing_on('POISON', ValueError('bad scan')))
+    assert journal._drain(journal._lane) == 4
+    assert journal._lane.applied == 4
+    assert journal.applied == 3
+    assert journal.dead_letters == 1
+    with open(os.path.join(journal.directory, DEAD_LETTER_FILE)) as f:
+        [entry] = [json.loads(line) for line in f]
+    assert entry['seq'] == 2 and entry['scan']['card_id'] == 'POISON' and entry['error'] == 'bad scan'
+    assert journal.stats()['dead_letters'] == 1
+
+def test_lost_connection_keeps_the_batch_for_retry(journal, monkeypatch):
+    error = OperationalError('SELECT 1', {}, Exception('connection refused'))
+    monkeypatch.setattr(ingest, 'ingest_scan_batch', failing_on('POISON', error))
+    with pytest.raises(OperationalError):
+        journal._drain(journal._lane)
+    assert journal._lane.applied == 0
+    assert journal.dead_letters == 0
+    assert not os.path.exists(os.path.join(journal.directory, DEAD_LETTER_FILE))
+
+def test_unknown_cards_are_dead_lettered_for_review(journal):
+    assert journal._drain(journal._lane) == 4
+    assert journal.applied == 3
+    with open(os.path.join(journal.directory, DEAD_LETTER_FILE)) as f:
+        [entry] = [json.loads(line) for line in f]
+    assert (entry['seq'], entry['error']) == (2, 'Student not found')
+
+class FakeJournal:
+    enabled = True
+
+    def __init__(self):
+        self.scans = []
+
+    def append(self, scan):
+        self.scans.append(scan)
+
+def test_journaled_scan_is_acknowledged_from_memory(client, monkeypatch):
+    journal = FakeJournal()
+    monkeypatch.setattr(routes, 'scan_journal', journal)
+    student_cache.get('CARD001')
+    def unreachable(card_ids):
+        raise AssertionError('the journal path must not query the database')
+    monkeypatch.setattr(student_cache, '_load', unreachable)
+
+    first = client.post('/api/biometric/scan', json=scan('CARD001')).get_json()
+    second = client.post('/api/biometric/scan', json=scan('CARD001')).get_json()
+    unknown = client.post('/api/biometric/scan', json=scan('CARD404')).get_json()
+
+    assert first['queued'] and first['roll_number'] == '001'
+    assert second['duplicate'] and second['previous_time'] == '09:10:00'
+    assert unknown == {'success': True, 'message': 'Attendance queued for recording', 'queued': True,
+                       'scan_time': '09:10:00'}
+    assert [payload['card_id'] for payload in journal.scans] == ['CARD001', 'CARD404']
@@ -0,0 +1,79 @@
+import time
+
+from sqlalchemy import text
+
+import cache
+from cache import StudentCache
+from app import db
+from models import Student
+from cache import student_cache
+from live import Broadcaster, FileBus, broadcaster
+from roster_import import import_roster
+
+def test_students_changed_event_evicts_this_workers_cache(app):
+    assert student_cache.get('CARD001').name == 'John Doe'
+    subscriber = broadcaster.subscribe()
+    try:
+        broadcaster.deliver({'type': 'students.changed', 'card_ids': ['CARD001']})
+        assert 'CARD001' not in student_cache._records
+        # Cache invalidation is not part of the live feed
+        assert subscriber.next_event(timeout=0) is None
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+def test_file_bus_carries_student_changes_to_other_workers(tmp_path):
+    received = []
+    path = str(tmp_path / 'live.bus')
+    other_worker = Broadcaster()
+    other_worker.add_listener(received.append)
+    other_bus = FileBus(other_worker, path, poll_interval=0.01)
+    other_bus.start()
+    # The tailer starts reading at the end of the file
+    time.sleep(0.05)
+    FileBus(Broadcaster(), path).publish({'type': 'students.changed', 'card_ids': None})
+    deadline = time.time() + 2
+    while not received and time.time() < deadline:
+        time.sleep(0.01)
+    assert received == [{'type': 'students.changed', 'card_ids': None}]
+
+def test_roster_import_publishes_students_changed(app, monkeypatch):
+    published = []
+    monkeypatch.setattr(cache, 'publish_event', published.append)
+    student_cache.get('CARD001')
+    row = {'roll_number': '001', 'card_id': 'CARD001', 'name': 'John Q. Doe', 'session': 'AN', 'campus': 'AEC', 'course': 'CE'}
+    assert import_roster([(2, row)]).imported == 1
+    assert published == [{'type': 'students.changed', 'card_ids': None}]
+    assert student_cache.get('CARD001').name == 'John Q. Doe'
+
+def test_student_changes_are_evicted_at_commit_not_flush(app, monkeypatch):
+    published = []
+    monkeypatch.setattr(cache, 'publish_event', published.append)
+    student = Student.query.filter_by(card_id='CARD001').one()
+    student.card_id = 'CARD101'
+    db.session.flush()
+    assert published == []
+    db.session.commit()
+    assert published == [{'type': 'students.changed', 'card_ids': ['CARD001', 'CARD101']}]
+
+def test_rolled_back_student_changes_are_not_published(app, monkeypatch):
+    published = []
+    monkeypatch.setattr(cache, 'publish_event', published.append)
+    Student.query.filter_by(card_id='CARD002').one().name = 'Jane Doe'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert published == []
+
+def test_cached_students_expire_without_an_event(app, monkeypatch):
+    students = StudentCache(ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    assert students.get('CARD001').name == 'John Doe'
+    # Another process renames the student; no event reaches this one
+    db.session.execute(text("UPDATE students SET name = 'John Renamed' WHERE card_id = 'CARD001'"))
+    db.session.commit()
+    now[0] += 59
+    assert students.peek('CARD001').name == 'John Doe'
+    now[0] += 2
+    assert students.peek('CARD001') is None
+    assert students.get('CARD001').name == 'John Renamed'
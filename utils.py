@@ -1,42 +1,141 @@
 import io
+import os
+import itertools
 import logging
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from zoneinfo import ZoneInfo
+from log_events import log_event
 
-def validate_biometric_data(data):
-    """Validate biometric scanner data format"""
+# Scanner clocks send either local wall-clock time or an offset/Z timestamp;
+# both are normalised to this zone before scan_date is derived
+INSTITUTION_TIMEZONE = ZoneInfo(os.environ.get("INSTITUTION_TIMEZONE", "Asia/Kolkata"))
+
+class ScanPayload:
+    """A validated biometric scan in institution-local time"""
+    __slots__ = ('card_id', 'scan_datetime', 'scan_date', 'scan_time', 'scanner_id', 'location', 'tz')
+
+    def __init__(self, card_id, scan_datetime, scan_date, scan_time, scanner_id, location, tz=INSTITUTION_TIMEZONE):
+        self.card_id = card_id
+        # Attendance columns are naive and hold institution-local time
+        self.scan_datetime = scan_datetime
+        self.scan_date = scan_date
+        self.scan_time = scan_time
+        self.scanner_id = scanner_id
+        self.location = location
+        self.tz = tz
+
+    @property
+    def scanned_at(self):
+        """The scan time as an aware datetime (attaching a ZoneInfo is not free, so only on demand)"""
+        return self.scan_datetime.replace(tzinfo=self.tz)
+
+    def __repr__(self):
+        return f"<ScanPayload {self.card_id} {self.scan_datetime}>"
+
+def institution_today():
+    """Today's date in the institution's timezone"""
+    return datetime.now(INSTITUTION_TIMEZONE).date()
+
+# Longest values the attendance_records columns hold
+MAX_CARD_ID_LENGTH = 50
+MAX_SCANNER_ID_LENGTH = 50
+MAX_LOCATION_LENGTH = 100
+
+def _text_field(value, default, max_length):
+    """A payload's optional text field, or None if it is not a string or too long"""
+    if not value:
+        return default
+    if type(value) is not str or len(value) > max_length:
+        return None
+    return value
+
+def parse_scan(data, tz=INSTITUTION_TIMEZONE):
+    """Validate and parse one scanner payload in a single pass; returns a ScanPayload or None"""
+    if type(data) is not dict:
+        return None
+    card_id = data.get('card_id')
+    timestamp = data.get('timestamp')
+    if type(card_id) is not str or type(timestamp) is not str or not timestamp:
+        return None
+    card_id = card_id.strip()
+    if not card_id or len(card_id) > MAX_CARD_ID_LENGTH:
+        return None
+    scanner_id = _text_field(data.get('scanner_id'), 'unknown', MAX_SCANNER_ID_LENGTH)
+    location = _text_field(data.get('location'), 'Main Campus', MAX_LOCATION_LENGTH)
+    if scanner_id is None or location is None:
+        return None
     try:
-        if not isinstance(data, dict):
-            return False
-        
-        required_fields = ['card_id', 'timestamp']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return False
-        
-        # Validate timestamp format
-        timestamp = data.get('timestamp')
+        # fromisoformat accepts a trailing Z from Python 3.11
+        scanned_at = datetime.fromisoformat(timestamp)
+    except ValueError:
+        logging.error(f"Invalid timestamp format: {timestamp}")
+        return None
+    if scanned_at.tzinfo is None:
+        scan_datetime = scanned_at
+        scan_date = scanned_at.date()
+        scan_time = scanned_at.time()
+    else:
+        # date() and time() drop tzinfo; replace(tzinfo=None) is several times slower
         try:
-            datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        except ValueError:
-            logging.error(f"Invalid timestamp format: {timestamp}")
-            return False
-        
-        return True
-    except Exception as e:
-        logging.error(f"Data validation error: {e}")
-        return False
+            scanned_at = scanned_at.astimezone(tz)
+        except OverflowError:
+            logging.error(f"Timestamp out of range: {timestamp}")
+            return None
+        scan_date = scanned_at.date()
+        scan_time = scanned_at.time()
+        scan_datetime = datetime.combine(scan_date, scan_time)
+    return ScanPayload(card_id, scan_datetime, scan_date, scan_time, scanner_id, location, tz)
+
+def parse_scans(payloads, tz=INSTITUTION_TIMEZONE):
+    """Parse a list of scanner payloads; invalid entries come back as None"""
+    return [parse_scan(data, tz) for data in payloads]
+
+def validate_biometric_data(data):
+    """Validate biometric scanner data format"""
+    return parse_scan(data) is not None
+
+REPORT_HEADERS = [
+    "S.No.", "Student Name", "Roll Number", "Session", "Campus",
+    "Course", "Date", "Time", "Location", "Status"
+]
+
+# Rows buffered before the header is written, used to size the columns
+WIDTH_SAMPLE_ROWS = 1000
+
+def _report_filter_lines(filters):
+    filter_info = []
+    if filters.get('session'):
+        filter_info.append(f"Session: {filters['session']}")
+    if filters.get('campus'):
+        filter_info.append(f"Campus: {filters['campus']}")
+    if filters.get('course'):
+        filter_info.append(f"Course: {filters['course']}")
+    if filters.get('date_from'):
+        filter_info.append(f"From: {filters['date_from']}")
+    if filters.get('date_to'):
+        filter_info.append(f"To: {filters['date_to']}")
+    return filter_info
+
+def write_excel_report(rows, filters, output, progress=None):
+    """Stream attendance rows into an Excel report written to output.
+
+    rows is an iterable of (name, roll_number, session, campus, course,
+    scan_date, scan_time, location, status) tuples, consumed once. The
+    workbook is write-only, so memory stays flat regardless of row count.
+    Column widths are sized from the first WIDTH_SAMPLE_ROWS rows, since
+    write-only sheets emit column dimensions before any data. Returns the
+    summary counts accumulated during the same pass.
+    """
+    # openpyxl is only needed by exports; importing it here keeps it out of worker boot
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
 
-def generate_excel_report(attendance_data, filters):
-    """Generate Excel report from attendance data"""
     try:
-        # Create workbook and worksheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Attendance Report"
-        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Attendance Report")
+
         # Define styles
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="004466", end_color="004466", fill_type="solid")
@@ -47,170 +146,197 @@ def generate_excel_report(attendance_data, filters):
             top=Side(style='thin'),
             bottom=Side(style='thin')
         )
-        
+        status_styles = {
+            'present': (PatternFill(start_color="D4EDDA", end_color="D4EDDA", fill_type="solid"), Font(color="155724")),
+            'late': (PatternFill(start_color="FFF3CD", end_color="FFF3CD", fill_type="solid"), Font(color="856404")),
+            'absent': (PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid"), Font(color="721C24")),
+        }
+
+        def styled(value, **styles):
+            cell = WriteOnlyCell(ws, value=value)
+            for name, style in styles.items():
+                setattr(cell, name, style)
+            return cell
+
+        # Buffer a bounded sample of rows to size the columns
+        rows = iter(rows)
+        widths = [len(header) for header in REPORT_HEADERS]
+        sample = []
+        for row in rows:
+            sample.append(row)
+            for col_index, value in enumerate(row, 1):
+                if len(str(value)) > widths[col_index]:
+                    widths[col_index] = len(str(value))
+            if len(sample) >= WIDTH_SAMPLE_ROWS:
+                break
+        widths[0] = max(widths[0], len(str(len(sample))))
+        for col_num, max_length in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col_num)].width = min(30, max(12, max_length + 2))
+
         # Add title and filters
-        ws.merge_cells('A1:J1')
-        title_cell = ws['A1']
-        title_cell.value = "ADITYA ATTENDANCE REPORT"
-        title_cell.font = Font(size=16, bold=True, color="004466")
-        title_cell.alignment = Alignment(horizontal="center")
-        
-        # Add filter information
-        row_num = 3
-        filter_info = []
-        if filters.get('session'):
-            filter_info.append(f"Session: {filters['session']}")
-        if filters.get('campus'):
-            filter_info.append(f"Campus: {filters['campus']}")
-        if filters.get('course'):
-            filter_info.append(f"Course: {filters['course']}")
-        if filters.get('date_from'):
-            filter_info.append(f"From: {filters['date_from']}")
-        if filters.get('date_to'):
-            filter_info.append(f"To: {filters['date_to']}")
-        
+        ws.merged_cells.add('A1:J1')
+        ws.append([styled("ADITYA ATTENDANCE REPORT", font=Font(size=16, bold=True, color="004466"),
+                          alignment=Alignment(horizontal="center"))])
+        ws.append([])
+
+        filter_info = _report_filter_lines(filters)
         if filter_info:
-            ws[f'A{row_num}'] = "Filters Applied: " + " | ".join(filter_info)
-            ws[f'A{row_num}'].font = Font(italic=True)
-            row_num += 1
-        
+            ws.append([styled("Filters Applied: " + " | ".join(filter_info), font=Font(italic=True))])
+        ws.append([])
+
         # Add generation timestamp
-        row_num += 1
-        ws[f'A{row_num}'] = f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        ws[f'A{row_num}'].font = Font(italic=True, size=10)
-        
+        ws.append([styled(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", font=Font(italic=True, size=10))])
+        ws.append([])
+
         # Add headers
-        row_num += 2
-        headers = [
-            "S.No.", "Student Name", "Roll Number", "Session", "Campus", 
-            "Course", "Date", "Time", "Location", "Status"
-        ]
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=row_num, column=col_num, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = border
-        
-        # Add data rows
-        for index, (attendance_record, student) in enumerate(attendance_data, 1):
-            row_num += 1
-            data_row = [
-                index,
-                student.name,
-                student.roll_number,
-                student.session,
-                student.campus,
-                student.course,
-                attendance_record.scan_date.strftime('%Y-%m-%d'),
-                attendance_record.scan_time.strftime('%H:%M:%S'),
-                attendance_record.location,
-                attendance_record.status.title()
-            ]
-            
-            for col_num, value in enumerate(data_row, 1):
-                cell = ws.cell(row=row_num, column=col_num, value=value)
-                cell.border = border
-                
-                # Apply conditional formatting for status
-                if col_num == 10:  # Status column
-                    if value.lower() == 'present':
-                        cell.fill = PatternFill(start_color="D4EDDA", end_color="D4EDDA", fill_type="solid")
-                        cell.font = Font(color="155724")
-                    elif value.lower() == 'late':
-                        cell.fill = PatternFill(start_color="FFF3CD", end_color="FFF3CD", fill_type="solid")
-                        cell.font = Font(color="856404")
-                    elif value.lower() == 'absent':
-                        cell.fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
-                        cell.font = Font(color="721C24")
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(30, max(12, max_length + 2))
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
+        ws.append([styled(header, font=header_font, fill=header_fill, alignment=header_alignment, border=border)
+                   for header in REPORT_HEADERS])
+
+        # Add data rows, accumulating the summary in the same pass
+        counts = {'present': 0, 'late': 0, 'absent': 0}
+        total_records = 0
+        for row in itertools.chain(sample, rows):
+            name, roll_number, session, campus, course, scan_date, scan_time, location, status = row
+            total_records += 1
+            status_key = status.lower()
+            if status_key in counts:
+                counts[status_key] += 1
+
+            data_row = [styled(value, border=border) for value in (
+                total_records, name, roll_number, session, campus, course,
+                scan_date.isoformat(), scan_time.isoformat(timespec='seconds'), location
+            )]
+            status_cell = styled(status.title(), border=border)
+            if status_key in status_styles:
+                status_cell.fill, status_cell.font = status_styles[status_key]
+            data_row.append(status_cell)
+            ws.append(data_row)
+
+            if progress and total_records % 1000 == 0:
+                progress(total_records)
+
         # Add summary section
-        row_num += 3
-        ws[f'A{row_num}'] = "SUMMARY"
-        ws[f'A{row_num}'].font = Font(bold=True, size=14, color="004466")
-        
-        row_num += 1
-        total_records = len(attendance_data)
-        present_count = sum(1 for record, _ in attendance_data if record.status.lower() == 'present')
-        late_count = sum(1 for record, _ in attendance_data if record.status.lower() == 'late')
-        
+        ws.append([])
+        ws.append([])
+        ws.append([styled("SUMMARY", font=Font(bold=True, size=14, color="004466"))])
+
+        present_count = counts['present']
         summary_data = [
             ("Total Records:", total_records),
             ("Present:", present_count),
-            ("Late:", late_count),
+            ("Late:", counts['late']),
             ("Attendance Rate:", f"{(present_count/total_records*100):.1f}%" if total_records > 0 else "0%")
         ]
-        
+
         for label, value in summary_data:
-            ws[f'A{row_num}'] = label
-            ws[f'B{row_num}'] = value
-            ws[f'A{row_num}'].font = Font(bold=True)
-            row_num += 1
-        
-        # Save to BytesIO
-        output = io.BytesIO()
+            ws.append([styled(label, font=Font(bold=True)), value])
+
         wb.save(output)
-        output.seek(0)
-        
-        logging.info(f"Excel report generated with {total_records} records")
-        return output
-        
+        if progress:
+            progress(total_records)
+
+        log_event('report.generated', report='attendance', rows=total_records)
+        return dict(counts, total=total_records)
+
     except Exception as e:
         logging.error(f"Excel generation error: {e}")
         raise
 
-def format_attendance_summary(attendance_data):
-    """Format attendance data for display"""
+PERCENTAGE_HEADERS = [
+    "S.No.", "Student Name", "Roll Number", "Session", "Campus",
+    "Course", "Days Attended", "Working Days", "Percentage", "Status"
+]
+
+def write_percentage_report(rows, summary, filters, output):
+    """Write per-student attendance percentages from attendance_percentages to an Excel file"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+
     try:
-        if not attendance_data:
-            return {
-                'total': 0,
-                'present': 0,
-                'late': 0,
-                'absent': 0,
-                'percentage': 0
-            }
-        
-        total = len(attendance_data)
-        present = sum(1 for record, _ in attendance_data if record.status.lower() == 'present')
-        late = sum(1 for record, _ in attendance_data if record.status.lower() == 'late')
-        absent = sum(1 for record, _ in attendance_data if record.status.lower() == 'absent')
-        
-        percentage = (present / total * 100) if total > 0 else 0
-        
-        return {
-            'total': total,
-            'present': present,
-            'late': late,
-            'absent': absent,
-            'percentage': round(percentage, 1)
-        }
-        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Attendance Percentage")
+
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="004466", end_color="004466", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="center")
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        defaulter_fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
+        defaulter_font = Font(color="721C24")
+
+        def styled(value, **styles):
+            cell = WriteOnlyCell(ws, value=value)
+            for name, style in styles.items():
+                setattr(cell, name, style)
+            return cell
+
+        widths = [len(header) for header in PERCENTAGE_HEADERS]
+        for row in rows:
+            for col_index, key in enumerate(('name', 'roll_number', 'session', 'campus', 'course'), 1):
+                widths[col_index] = max(widths[col_index], len(str(row[key])))
+        for col_num, max_length in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col_num)].width = min(30, max(12, max_length + 2))
+
+        ws.merged_cells.add('A1:J1')
+        ws.append([styled("ADITYA ATTENDANCE PERCENTAGE REPORT", font=Font(size=16, bold=True, color="004466"),
+                          alignment=Alignment(horizontal="center"))])
+        ws.append([])
+
+        filter_info = _report_filter_lines(dict(filters, date_from=summary['date_from'], date_to=summary['date_to']))
+        ws.append([styled("Filters Applied: " + " | ".join(filter_info), font=Font(italic=True))])
+        working_info = " | ".join(f"{code}: {count}" for code, count in summary['working_days'].items())
+        ws.append([styled(f"Working days: {working_info or 'none'} | Threshold: {summary['threshold']:g}%",
+                          font=Font(italic=True))])
+        ws.append([styled(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", font=Font(italic=True, size=10))])
+        ws.append([])
+
+        ws.append([styled(header, font=header_font, fill=header_fill, alignment=header_alignment, border=border)
+                   for header in PERCENTAGE_HEADERS])
+
+        for number, row in enumerate(rows, 1):
+            percentage = f"{row['percentage']:.1f}%" if row['percentage'] is not None else "N/A"
+            data_row = [styled(value, border=border) for value in (
+                number, row['name'], row['roll_number'], row['session'], row['campus'], row['course'],
+                row['attended_days'], row['working_days'], percentage
+            )]
+            status_cell = styled("Defaulter" if row['defaulter'] else "OK", border=border)
+            if row['defaulter']:
+                status_cell.fill, status_cell.font = defaulter_fill, defaulter_font
+            data_row.append(status_cell)
+            ws.append(data_row)
+
+        ws.append([])
+        ws.append([])
+        ws.append([styled("SUMMARY", font=Font(bold=True, size=14, color="004466"))])
+        for label, value in (("Students:", summary['students']),
+                             (f"Below {summary['threshold']:g}%:", summary['defaulters'])):
+            ws.append([styled(label, font=Font(bold=True)), value])
+
+        wb.save(output)
+        log_event('report.generated', report='percentage', rows=len(rows))
+
     except Exception as e:
-        logging.error(f"Summary formatting error: {e}")
-        return {
-            'total': 0,
-            'present': 0,
-            'late': 0,
-            'absent': 0,
-            'percentage': 0
-        }
+        logging.error(f"Percentage report generation error: {e}")
+        raise
+
+def generate_excel_report(attendance_data, filters):
+    """Generate Excel report from (AttendanceRecord, Student) pairs"""
+    rows = (
+        (student.name, student.roll_number, student.session, student.campus, student.course,
+         attendance_record.scan_date, attendance_record.scan_time, attendance_record.location,
+         attendance_record.status)
+        for attendance_record, student in attendance_data
+    )
+    output = io.BytesIO()
+    write_excel_report(rows, filters, output)
+    output.seek(0)
+    return output
 
 def sanitize_filename(filename):
     """Sanitize filename for safe file operations"""
@@ -224,10 +350,6 @@ def sanitize_filename(filename):
     
     return filename
 
-def log_attendance_activity(activity_type, details):
-    """Log attendance-related activities"""
-    try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        logging.info(f"[{timestamp}] {activity_type}: {details}")
-    except Exception as e:
-        logging.error(f"Logging error: {e}")
+def log_attendance_activity(activity_type, **fields):
+    """Log an attendance-related activity as the structured event activity.<type>"""
+    log_event(f'activity.{activity_type.lower()}', **fields)